@@ -1,5 +1,5 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Optional
 import os
 import shutil
@@ -7,28 +7,145 @@ import json
 import asyncio
 import cv2
 import base64
+import uuid
+import datetime
+import time
 from app.core.config import settings
 from app.core.yolo_detector import YOLODetector
-from app.schemas.detection import DetectionSettings, ImageDetectionResponse
+from app.core.worker_pool import InferenceWorkerPool
+from app.core.result_cache import ResultCache, make_cache_key
+from app.core.renderer import draw_detections, encode_image
+from app.core.video_stream import VideoStreamRegistry
+from app.core.video_jobs import VideoJobQueue
+from app.core.frame_sampler import POLICIES, FrameSampler, parse_ranges
+from app.core.detection_store import DetectionStore
+from app.core.ws_protocol import ProtocolError, decode_request, encode_error, encode_response
+from app.core.backpressure import FlowControl
+from app.core.fair_executor import FairExecutor
+from app.core.rate_control import OutputParams, StreamRateController
+from app.core.metrics import endpoint_duration, registry as metrics_registry, stage_duration
+from app.schemas.detection import DetectionSettings, ImageDetectionResponse, ModelLoadRequest
 
 router = APIRouter()
+
+websocket_sessions = metrics_registry.gauge("websocket_sessions", "当前活跃的 WebSocket 连接数", ("endpoint",))
 detector = YOLODetector()
+if settings.BATCH_ENABLED:
+    # 所有连接共享同一个批处理调度器，并发请求会被合并成批次推理
+    detector.enable_batching()
+
+# 配置了推理进程池时，实时检测交给独立进程，不占用事件循环和 GIL
+worker_pool = InferenceWorkerPool() if settings.WORKER_POOL_SIZE > 0 else None
+
+# 检测任务按连接公平调度，一个繁忙的连接不会拖慢其他连接和 HTTP 接口
+fair_executor = FairExecutor()
+
+# 按图片内容缓存检测结果，重复上传的图片不再推理
+result_cache = ResultCache() if settings.RESULT_CACHE_ENABLED else None
+
+# 流式视频检测任务，检测结果旁路按任务 ID 读取
+video_streams = VideoStreamRegistry()
+
+# 视频检测任务队列，限制同时处理的视频数，服务重启后继续未完成的任务
+video_jobs = VideoJobQueue(detector)
+video_jobs.start()
+
+# 检测历史，后台线程批量写入数据库；数据库不可用时不影响检测接口
+detection_store = None
+if settings.DETECTION_STORE_ENABLED:
+    try:
+        detection_store = DetectionStore().start()
+    except Exception as e:
+        print(f"检测历史存储不可用: {e}")
+
+
+async def run_detector(method: str, *args, stream_id: str = None, key: str = None, **kwargs):
+    """在推理进程池或本地线程中执行检测方法
+
+    stream_id 用于静态画面门控等按视频流保存的状态，进程池会把同一流固定到同一进程。
+    任务经 fair_executor 按 key（缺省为 stream_id，HTTP 请求共用一个键）轮询调度。
+    """
+    key = key or stream_id or "http"
+    if stream_id is not None:
+        kwargs["stream_id"] = stream_id
+    if worker_pool is not None:
+        # 进程池的任务也经公平调度提交，排队发生在按连接的队列里，而不是进程的先进先出队列
+        return await fair_executor.run(
+            key, lambda: worker_pool.submit_nowait(method, *args, affinity=stream_id, **kwargs).result()
+        )
+    return await fair_executor.run(key, getattr(detector, method), *args, **kwargs)
+
+
+def encode_data_url(frame, output: OutputParams = None) -> str:
+    """把标注后的帧按输出参数编码为 JPEG Data URL"""
+    buffer = encode_image(frame, ".jpg", **(output.encode_options() if output is not None else {}))
+    with stage_duration.time(stage="base64_encode"):
+        return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+
+
+def check_model(model: Optional[str]):
+    """校验请求指定的模型已就绪"""
+    if model is not None and not detector.registry.has(model):
+        raise HTTPException(status_code=404, detail=f"模型不存在或尚未就绪: {model}")
+
+
+def record_history(source: str, detections, source_type: str, frame_index: int = None, model: str = None):
+    """登记检测历史，只入队不等待写库"""
+    if detection_store is None or not detections:
+        return
+    try:
+        model = model or detector.registry.current().name
+    except KeyError:
+        pass
+    detection_store.record(source, detections, source_type, frame_index=frame_index, model=model)
+
+
+async def broadcast_models(method: str, *args, **kwargs):
+    """把模型注册表的变更同步到所有推理进程"""
+    if worker_pool is not None:
+        futures = worker_pool.broadcast(method, *args, replay=True, **kwargs)
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
 
 @router.post("/detect/image", response_model=ImageDetectionResponse)
-async def detect_image(file: UploadFile = File(...)):
-    """上传并检测图片"""
+async def detect_image(response: Response, file: UploadFile = File(...), tiled: Optional[bool] = None,
+                       render: bool = True, model: Optional[str] = None):
+    """上传并检测图片，tiled 为 True 时对高分辨率图片使用切片推理
+
+    render 为 False 时只返回检测结果，不生成标注图片；model 指定使用的模型名称。
+
+    响应头 X-Cache 表示结果缓存的命中情况（memory / disk / miss / bypass）。
+    """
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="请上传图片文件")
+    check_model(model)
 
     # 保存上传的文件
     file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
     try:
+        content = await file.read()
+
+        cache_key = None
+        if result_cache is not None:
+            cache_key = make_cache_key(content, detector.cache_signature(tiled, model))
+            cached, tier = result_cache.get(cache_key, require_image=render)
+            response.headers["X-Cache"] = tier
+            if cached is not None:
+                record_history(file.filename, cached["detections"], "image", model=model)
+                return cached
+        else:
+            response.headers["X-Cache"] = "bypass"
+
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            buffer.write(content)
 
-        result = detector.detect_image(file_path)
+        # 在线程中执行，使并发请求能够进入同一批次
+        result = await run_detector("detect_image", file_path, tiled=tiled, render=render, model=model)
+        record_history(file.filename, result["detections"], "image", model=model)
+        if cache_key is not None:
+            result = await asyncio.to_thread(result_cache.put, cache_key, result)
         return result
     except Exception as e:
         # 如果发生错误，删除上传的文件
@@ -39,11 +156,37 @@ async def detect_image(file: UploadFile = File(...)):
         # 确保文件被关闭
         file.file.close()
 
+def sampling_options(policy: Optional[str], every_n: Optional[int], fps: Optional[float],
+                     ranges: Optional[str]) -> dict:
+    """校验抽帧参数，返回 FrameSampler.from_options 使用的选项"""
+    if policy is not None and policy not in POLICIES:
+        raise HTTPException(status_code=400, detail=f"不支持的抽帧策略: {policy}，可选 {', '.join(POLICIES)}")
+    if (every_n is not None and every_n < 1) or (fps is not None and fps <= 0):
+        raise HTTPException(status_code=400, detail="抽帧间隔和目标帧率必须为正数")
+    try:
+        parsed = parse_ranges(ranges)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if policy == "ranges" and not parsed:
+        raise HTTPException(status_code=400, detail="ranges 策略需要指定 sample_ranges")
+    return {"policy": policy, "every_n": every_n, "fps": fps, "ranges": parsed}
+
 @router.post("/detect/video")
-async def detect_video(file: UploadFile = File(...)):
-    """上传并检测视频"""
+async def detect_video(file: UploadFile = File(...), tracking: Optional[bool] = None, render: bool = True,
+                       model: Optional[str] = None, segments: Optional[int] = None,
+                       sample_policy: Optional[str] = None, sample_every: Optional[int] = None,
+                       sample_fps: Optional[float] = None, sample_ranges: Optional[str] = None):
+    """上传并检测视频，tracking 为 True 时只在关键帧检测、其余帧跟踪
+
+    render 为 False 时返回逐帧检测结果（NDJSON），不生成标注视频；
+    segments 大于 1 时按关键帧切分，由多个进程并行处理；
+    sample_policy 指定抽帧策略（every_n / fps / keyframes / ranges），
+    sample_ranges 格式为 "起始秒-结束秒,..."，未抽中的帧不解码为图像。
+    """
     if not file.content_type.startswith('video/'):
         raise HTTPException(status_code=400, detail="请上传视频文件")
+    check_model(model)
+    sampling = sampling_options(sample_policy, sample_every, sample_fps, sample_ranges)
 
     # 保存上传的文件
     file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
@@ -54,7 +197,10 @@ async def detect_video(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, buffer)
 
         # 使用异步任务处理视频
-        result_path = await asyncio.to_thread(detector.detect_video, file_path)
+        result_path = await asyncio.to_thread(detector.detect_video, file_path, tracking, render, model,
+                                             segments, sampling,
+                                             lambda index, detections: record_history(
+                                                 file.filename, detections, "video", index, model))
         
         # 验证结果文件
         if not os.path.exists(result_path):
@@ -62,7 +208,7 @@ async def detect_video(file: UploadFile = File(...)):
             
         return FileResponse(
             result_path,
-            media_type="video/mp4",
+            media_type="video/mp4" if render else "application/x-ndjson",
             headers={
                 "Content-Disposition": f'attachment; filename="{os.path.basename(result_path)}"'
             }
@@ -76,11 +222,157 @@ async def detect_video(file: UploadFile = File(...)):
         # 确保文件被关闭
         file.file.close()
 
+@router.post("/detect/video/jobs")
+async def create_video_job(file: UploadFile = File(...), tracking: Optional[bool] = None, render: bool = True,
+                           model: Optional[str] = None):
+    """提交视频检测任务，立即返回任务 ID；通过 /detect/video/jobs/{job_id} 查询进度"""
+    if not file.content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail="请上传视频文件")
+    check_model(model)
+
+    # 每个任务单独保存上传文件，避免同名视频互相覆盖
+    job_id = uuid.uuid4().hex
+    file_path = os.path.join(settings.UPLOAD_DIR, "jobs", job_id, os.path.basename(file.filename))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        with open(file_path, "wb") as buffer:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+        return video_jobs.submit(file_path, tracking, render, model, job_id=job_id)
+    except Exception as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        file.file.close()
+
+@router.get("/detect/video/jobs")
+async def list_video_jobs(limit: int = 50):
+    """最近提交的视频检测任务"""
+    return video_jobs.list(limit)
+
+@router.get("/detect/video/jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """查询任务状态和进度"""
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.delete("/detect/video/jobs/{job_id}")
+async def cancel_video_job(job_id: str):
+    """取消排队中或运行中的任务"""
+    job = video_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.get("/detect/video/jobs/{job_id}/result")
+async def get_video_job_result(job_id: str):
+    """下载已完成任务的结果（标注视频或 NDJSON 检测日志）"""
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"任务尚未完成: {job['status']}")
+    render = job["options"]["render"]
+    return FileResponse(
+        job["output_path"],
+        media_type="video/mp4" if render else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{os.path.basename(job["output_path"])}"'
+        }
+    )
+
+@router.post("/detect/video/stream")
+async def detect_video_stream(file: UploadFile = File(...), tracking: Optional[bool] = None,
+                              model: Optional[str] = None):
+    """上传视频，边处理边以分片 MP4 流式返回标注视频
+
+    没有 ffmpeg 时退化为 multipart JPEG 帧序列。响应头 X-Stream-Id 为任务 ID，
+    逐帧检测结果可通过 /detect/video/stream/{stream_id}/detections 以 NDJSON 同步读取。
+    """
+    if not file.content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail="请上传视频文件")
+    check_model(model)
+
+    file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        job = await asyncio.to_thread(video_streams.start, detector, file_path, tracking, model)
+    except Exception as e:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        file.file.close()
+
+    async def stream_video():
+        try:
+            while True:
+                chunk = await asyncio.to_thread(job.next_chunk)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            # 客户端断开时停止处理
+            if not job.finished.is_set():
+                job.cancel()
+
+    return StreamingResponse(
+        stream_video(),
+        media_type=job.media_type,
+        headers={
+            "X-Stream-Id": job.id,
+            "X-Detections-Url": f"{settings.API_V1_STR}/detect/video/stream/{job.id}/detections",
+        }
+    )
+
+@router.get("/detect/video/stream/{stream_id}/detections")
+async def detect_video_stream_detections(stream_id: str):
+    """流式视频检测的 NDJSON 旁路：从第一帧开始逐帧输出检测结果，处理结束后关闭"""
+    job = video_streams.get(stream_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="流式任务不存在或已过期")
+
+    async def stream_records():
+        sent = 0
+        while True:
+            records, done = await asyncio.to_thread(job.wait_records, sent)
+            for record in records:
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+            sent += len(records)
+            if done:
+                if job.error is not None:
+                    yield json.dumps({"error": job.error}, ensure_ascii=False) + "\n"
+                break
+
+    return StreamingResponse(stream_records(), media_type="application/x-ndjson")
+
+@router.get("/detections/history")
+async def detection_history(source: Optional[str] = None, class_name: Optional[str] = None,
+                            min_confidence: Optional[float] = None, start: Optional[datetime.datetime] = None,
+                            end: Optional[datetime.datetime] = None, cursor: Optional[str] = None,
+                            limit: int = 100):
+    """查询检测历史，按时间倒序分页
+
+    start / end 为 UTC 时间；翻页时把上一页返回的 next_cursor 作为 cursor 传入。
+    """
+    if detection_store is None:
+        raise HTTPException(status_code=503, detail="检测历史存储未启用")
+    try:
+        return await asyncio.to_thread(detection_store.query, source, class_name, min_confidence,
+                                       start, end, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/detect/camera")
-async def detect_camera():
+async def detect_camera(tracking: Optional[bool] = None):
     """启动摄像头检测"""
     try:
-        result_path = detector.detect_camera()
+        result_path = detector.detect_camera(tracking=tracking)
         return FileResponse(result_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -89,41 +381,249 @@ async def detect_camera():
 async def update_settings(settings: DetectionSettings):
     """更新检测参数"""
     try:
-        detector.update_settings(
-            confidence=settings.confidence,
-            iou=settings.iou,
-            device=settings.device,
-            half=settings.half
-        )
+        options = settings.model_dump()
+        detector.update_settings(**options)
+        if worker_pool is not None:
+            # 同步到所有推理进程
+            futures = worker_pool.broadcast("update_settings", replay=True, **options)
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
         return {"message": "设置已更新"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/models")
+async def list_models():
+    """查看已注册模型的版本、状态和内存占用"""
+    return {"default": detector.registry.default_name, "models": detector.list_models()}
+
+@router.post("/models")
+async def load_model(request: ModelLoadRequest):
+    """后台加载（或替换）命名模型，预热完成后上线；make_default 为 True 时上线即成为默认模型"""
+    try:
+        # 计算模型指纹要读取并哈希整个权重文件，放到线程中执行，不阻塞事件循环
+        model = await asyncio.to_thread(detector.load_model, request.name, request.weights, request.backend,
+                                        request.make_default, request.quantization)
+        await broadcast_models("load_model", request.name, request.weights, request.backend,
+                               request.make_default, request.quantization)
+        return model
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/models/{name}/default")
+async def set_default_model(name: str):
+    """切换默认模型，正在处理的请求继续使用原模型"""
+    try:
+        detector.set_default_model(name)
+        await broadcast_models("set_default_model", name)
+        return {"message": "默认模型已切换", "default": name}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.delete("/models/{name}")
+async def unload_model(name: str):
+    """卸载模型，在途请求结束后释放内存"""
+    try:
+        detector.unload_model(name)
+        await broadcast_models("unload_model", name)
+        return {"message": "模型已卸载"}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/load")
+async def load_status():
+    """查看实时流负载控制器的当前档位"""
+    if detector.load_controller is None:
+        return {"enabled": False}
+    return {"enabled": True, **detector.load_controller.stats()}
+
+@router.get("/fastpath")
+async def fast_path_stats():
+    """查看直通推理路径的帧数和缓冲区分配统计（启用进程池时按进程列出）"""
+    if worker_pool is None:
+        return {"enabled": settings.FAST_PATH_ENABLED, "stats": detector.fast_path_stats()}
+    futures = worker_pool.broadcast("fast_path_stats")
+    stats = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+    return {"enabled": settings.FAST_PATH_ENABLED, "workers": stats}
+
+@router.get("/workers/health")
+async def workers_health():
+    """查看推理进程池的健康状态"""
+    if worker_pool is None:
+        return {"enabled": False, "workers": []}
+    return {"enabled": True, "queue_depth": worker_pool.queue_depth(), "workers": worker_pool.health()}
+
+def rate_controller_for(websocket: WebSocket) -> StreamRateController:
+    """创建会话的输出控制器，查询参数 display_width / display_height 为客户端的显示尺寸"""
+    params = websocket.query_params
+    try:
+        display_size = (int(params.get("display_width") or 0), int(params.get("display_height") or 0))
+    except ValueError:
+        display_size = None
+    return StreamRateController(display_size=display_size)
+
+
+def parse_control(text: Optional[str]) -> Optional[dict]:
+    """识别客户端的控制消息，帧数据等其他消息返回 None
+
+    {"type": "pong", "t": ping 编号} 回应服务端的 ping；
+    {"type": "display", "width": 宽, "height": 高} 更新显示尺寸（例如窗口缩放后）。
+    """
+    # 控制消息很短，带图像的帧不必解析
+    if not text or len(text) > 256 or not text.lstrip().startswith("{"):
+        return None
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(message, dict) and message.get("type") in ("pong", "display"):
+        return message
+    return None
+
+
+def apply_control(rate: StreamRateController, message: dict):
+    if message["type"] == "pong":
+        rate.pong(message.get("t"))
+    else:
+        try:
+            rate.set_display_size(message.get("width"), message.get("height"))
+        except (TypeError, ValueError):
+            pass
+
+
+async def send_timed(websocket: WebSocket, payload, rate: StreamRateController = None):
+    """发送消息并记录在 send 上阻塞的时间，作为发送缓冲区积压的信号"""
+    started = time.perf_counter()
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_json(payload)
+    elapsed = time.perf_counter() - started
+    stage_duration.observe(elapsed, stage="ws_send")
+    if rate is not None:
+        rate.observe_send(elapsed)
+
+async def handle_json_frame(websocket: WebSocket, data: str, stream_id: str, flow: dict = None,
+                            rate: StreamRateController = None):
+    """JSON 协议：{"frame": Data URL, "render", "model"}，结果以 JSON 返回
+
+    flow 为连接的流控状态（可达帧率、已丢弃的过期帧数），附在结果的 flow 字段中；
+    rate 决定标注图像的质量、尺寸和是否随本帧发送，到时的 ping 附在结果的 ping 字段中。
+    """
+    try:
+        # 解析JSON数据
+        json_data = json.loads(data)
+
+        if "frame" in json_data:
+            # 处理帧并返回结果，render 为 false 时只返回检测结果
+            output = rate.next_frame() if rate is not None else None
+            render = json_data.get("render", True) and (output is None or output.render)
+            result = await run_detector("process_frame_base64", json_data["frame"],
+                                        stream_id=stream_id, render=render, model=json_data.get("model"),
+                                        **(output.encode_options() if output is not None else {}))
+            record_history(f"ws:{stream_id}", result.get("detections"), "stream",
+                           model=json_data.get("model"))
+            if flow is not None:
+                result = {**result, "flow": flow}
+            ping = rate.ping() if rate is not None else None
+            if ping is not None:
+                result = {**result, "ping": ping}
+            await send_timed(websocket, result, rate)
+        else:
+            await websocket.send_json({"error": "无效的帧数据"})
+    except json.JSONDecodeError:
+        await websocket.send_json({"error": "无效的JSON数据"})
+    except Exception as e:
+        await websocket.send_json({"error": str(e)})
+
+async def handle_binary_frame(websocket: WebSocket, data: bytes, stream_id: str,
+                              rate: StreamRateController = None):
+    """二进制协议（见 app.core.ws_protocol）：原始图像字节进，打包的检测结果和图像出
+
+    rate 决定标注图像的质量、尺寸和是否随本帧发送。
+    """
+    try:
+        request = decode_request(data)
+    except ProtocolError as e:
+        await websocket.send_bytes(encode_error(0, str(e)))
+        return
+    try:
+        # 推理进程需要可序列化的 bytes，本地执行时直接传 memoryview，省去一次拷贝
+        image = request.image if worker_pool is None else bytes(request.image)
+        output = rate.next_frame() if rate is not None else None
+        result = await run_detector("process_frame_encoded", image, stream_id=stream_id,
+                                    render=request.render and (output is None or output.render),
+                                    model=request.model, image_format=request.image_format,
+                                    **(output.encode_options() if output is not None else {}))
+        record_history(f"ws:{stream_id}", result["detections"], "stream", model=request.model)
+        payload = encode_response(request.seq, result["detections"], result["imgsz"], result["image"])
+    except Exception as e:
+        payload = encode_error(request.seq, str(e))
+    await send_timed(websocket, payload, rate)
+
 @router.websocket("/video/ws/video")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点，用于实时视频检测"""
+    """WebSocket端点，用于实时视频检测
+
+    文本消息使用 JSON 协议（Base64 Data URL 帧），二进制消息使用 ws_protocol 定义的二进制协议，
+    同一连接按消息类型分别处理。
+
+    接收和处理分开：接收任务持续读取消息，只保留最新一帧，处理期间到达的旧帧直接丢弃，
+    延迟不会随客户端发送速度累积。服务端按处理耗时估算可达帧率通告给客户端用于限速：
+    JSON 协议放在结果的 flow 字段，二进制协议定期发送文本消息 {"type": "flow", ...}。
+
+    标注图像的质量、尺寸和发送帧率按会话的 RTT 和发送阻塞自适应调整（见 StreamRateController），
+    检测结果每帧都发送。查询参数 display_width / display_height 声明客户端显示尺寸，
+    ping 在 JSON 协议中放在结果的 ping 字段，二进制协议以文本消息 {"type": "ping", "t"} 发送，
+    客户端回 {"type": "pong", "t"}。
+    """
     await websocket.accept()
-    
+    websocket_sessions.inc(endpoint="/video/ws/video")
+    # 每个连接是一路独立的视频流，用于静态画面门控
+    stream_id = uuid.uuid4().hex
+    flow = FlowControl()
+    rate = rate_controller_for(websocket)
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                # 控制消息立即处理，不进入帧槽位
+                control = parse_control(message.get("text"))
+                if control is not None:
+                    apply_control(rate, control)
+                    continue
+                flow.slot.put(message)
+        finally:
+            flow.slot.close()
+
+    receiver = asyncio.create_task(receive_frames())
     try:
         while True:
-            # 接收客户端发送的帧
-            data = await websocket.receive_text()
-            
-            try:
-                # 解析JSON数据
-                json_data = json.loads(data)
-                
-                if "frame" in json_data:
-                    # 处理帧并返回结果
-                    result = detector.process_frame_base64(json_data["frame"])
-                    await websocket.send_json(result)
-                else:
-                    await websocket.send_json({"error": "无效的帧数据"})
-            except json.JSONDecodeError:
-                await websocket.send_json({"error": "无效的JSON数据"})
-            except Exception as e:
-                await websocket.send_json({"error": str(e)})
-                
+            # 取最新的一帧，连接关闭后结束
+            message = await flow.slot.get()
+            if message is None:
+                raise WebSocketDisconnect(1000)
+            started = time.perf_counter()
+            if message.get("bytes") is not None:
+                await handle_binary_frame(websocket, message["bytes"], stream_id, rate)
+                elapsed = time.perf_counter() - started
+                endpoint_duration.observe(elapsed, endpoint="WS /video/ws/video binary")
+                flow.observe(elapsed)
+                if flow.advertisement_due():
+                    await websocket.send_json({"type": "flow", **flow.state()})
+                ping = rate.ping()
+                if ping is not None:
+                    await websocket.send_json({"type": "ping", "t": ping})
+            elif message.get("text") is not None:
+                await handle_json_frame(websocket, message["text"], stream_id, flow.state(), rate)
+                elapsed = time.perf_counter() - started
+                endpoint_duration.observe(elapsed, endpoint="WS /video/ws/video")
+                flow.observe(elapsed)
+
     except WebSocketDisconnect:
         # 客户端断开连接
         pass
@@ -133,23 +633,44 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.send_json({"error": str(e)})
         except:
             pass
+    finally:
+        receiver.cancel()
+        websocket_sessions.dec(endpoint="/video/ws/video")
+        fair_executor.release(stream_id)
+        # 释放该视频流的门控状态
+        if worker_pool is not None:
+            worker_pool.submit_nowait("release_stream", stream_id, affinity=stream_id)
+        else:
+            detector.release_stream(stream_id)
 
 @router.websocket("/video/ws/upload")
 async def video_websocket_endpoint(websocket: WebSocket):
-    """WebSocket端点，用于上传视频并实时检测"""
+    """WebSocket端点，用于上传视频并实时检测
+
+    标注图像的质量、尺寸和发送帧率按会话自适应调整，检测结果每帧都发送；显示尺寸、ping / pong
+    的约定与 /video/ws/video 的 JSON 协议相同。
+    """
     await websocket.accept()
+    websocket_sessions.inc(endpoint="/video/ws/upload")
+    # 同时也是该连接在公平调度线程池中的键
+    upload_id = uuid.uuid4().hex
+    # 每个连接使用独立的临时文件，并发上传互不覆盖
+    video_path = os.path.join(settings.UPLOAD_DIR, f"ws_upload_{upload_id}.mp4")
+    cap = None
+    receiver = None
     
     try:
         # 接收视频数据
         data = await websocket.receive_bytes()
         
         # 保存视频文件
-        video_path = os.path.join(settings.UPLOAD_DIR, "temp_video.mp4")
-        with open(video_path, "wb") as f:
-            f.write(data)
+        def save_video():
+            with open(video_path, "wb") as f:
+                f.write(data)
+        await asyncio.to_thread(save_video)
         
         # 打开视频文件
-        cap = cv2.VideoCapture(video_path)
+        cap = await asyncio.to_thread(cv2.VideoCapture, video_path)
         if not cap.isOpened():
             await websocket.send_json({"error": "无法打开视频文件"})
             return
@@ -166,34 +687,97 @@ async def video_websocket_endpoint(websocket: WebSocket):
             }
         })
         
+        # 跟踪模式：关键帧检测，其余帧由跟踪器外推，每帧都有带轨迹 ID 的结果
+        tracking = websocket.query_params.get("tracking")
+        tracking = settings.TRACKING_ENABLED if tracking is None else tracking.lower() in ("1", "true", "yes")
+        # render=0 时只发送检测结果，不绘制、不编码图像
+        render = websocket.query_params.get("render", "1").lower() in ("1", "true", "yes")
+        # model 指定使用的模型名称，缺省为默认模型
+        model = websocket.query_params.get("model")
+        if model is not None and not detector.registry.has(model):
+            await websocket.send_json({"error": f"模型不存在或尚未就绪: {model}"})
+            return
+        stream = None
+        if tracking:
+            if worker_pool is not None:
+                stream = detector.create_tracked_stream(
+                    lambda f: worker_pool.submit_nowait("detect_frame_realtime", f, model=model).result(),
+                    realtime=True
+                )
+            else:
+                stream = detector.create_tracked_stream(realtime=True, model=model)
+
+        # 非跟踪模式下默认每隔几帧处理一次，减少处理负担；未抽中的帧只 grab 不解码为图像
+        params = websocket.query_params
+        try:
+            sampling = sampling_options(
+                params.get("sample_policy") or ("all" if tracking else "every_n"),
+                int(params["sample_every"]) if params.get("sample_every") else
+                (None if tracking else settings.UPLOAD_WS_SAMPLE_EVERY_N),
+                float(params["sample_fps"]) if params.get("sample_fps") else None,
+                params.get("sample_ranges")
+            )
+            sampler = FrameSampler.from_options(cap, sampling, video_path)
+        except (HTTPException, ValueError) as e:
+            await websocket.send_json({"error": getattr(e, "detail", None) or str(e)})
+            return
+
+        # 视频上传后客户端只会发控制消息，由接收任务处理；连接断开时接收任务结束
+        rate = rate_controller_for(websocket)
+
+        async def receive_controls():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                control = parse_control(message.get("text"))
+                if control is not None:
+                    apply_control(rate, control)
+
+        receiver = asyncio.create_task(receive_controls())
+
         # 处理视频帧
-        frame_index = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
+        # 解码、检测、标注和编码都在公平调度线程池中执行，事件循环只负责收发
+        while cap.isOpened() and not receiver.done():
+            ret, frame = await fair_executor.run(upload_id, sampler.read)
             if not ret:
                 break
-                
-            # 每隔几帧处理一次，减少处理负担
-            if frame_index % 3 == 0:
-                # 处理帧
-                annotated_frame, detections = detector.process_frame(frame)
-                
+            frame_index = sampler.index
+            started = time.perf_counter()
+            # 发送缓冲区积压时降低质量和尺寸，并隔几帧才发送一次标注图像
+            frame_output = rate.next_frame()
+            frame_render = render and frame_output.render
+
+            # 处理帧
+            if stream is not None:
+                detections, keyframe = await fair_executor.run(upload_id, stream.step, frame)
+                annotated_frame = await fair_executor.run(upload_id, draw_detections, frame, detections) if frame_render else None
+                # 非关键帧没有推理，imgsz 为 None
+                imgsz = stream.last_imgsz if keyframe else None
+            else:
+                output = await run_detector("process_frame_detailed", frame, key=upload_id, render=frame_render, model=model)
+                annotated_frame, detections, imgsz = output["frame"], output["detections"], output["imgsz"]
+            record_history(f"upload:{upload_id}", detections, "video", frame_index, model)
+
+            message = {
+                "detections": detections,
+                "frame_index": frame_index,
+                "progress": frame_index / frame_count,
+                "imgsz": imgsz
+            }
+            if frame_render:
                 # 将标注后的图像编码为Base64
-                _, buffer = cv2.imencode('.jpg', annotated_frame)
-                annotated_frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                
-                # 发送结果
-                await websocket.send_json({
-                    "frame": f"data:image/jpeg;base64,{annotated_frame_base64}",
-                    "detections": detections,
-                    "frame_index": frame_index,
-                    "progress": frame_index / frame_count
-                })
-                
-                # 等待一小段时间，避免发送过快
-                await asyncio.sleep(0.05)
+                message["frame"] = await fair_executor.run(upload_id, encode_data_url, annotated_frame, frame_output)
+            ping = rate.ping()
+            if ping is not None:
+                message["ping"] = ping
             
-            frame_index += 1
+            # 发送结果
+            await send_timed(websocket, message, rate)
+            endpoint_duration.observe(time.perf_counter() - started, endpoint="WS /video/ws/upload")
+            
+            # 等待一小段时间，避免发送过快
+            await asyncio.sleep(0.05)
         
         # 关闭视频
         cap.release()
@@ -201,7 +785,9 @@ async def video_websocket_endpoint(websocket: WebSocket):
         # 发送完成消息
         await websocket.send_json({
             "status": "completed",
-            "message": "视频处理完成"
+            "message": "视频处理完成",
+            "sampling": sampler.stats(),
+            "rate_control": rate.stats()
         })
         
     except WebSocketDisconnect:
@@ -213,3 +799,14 @@ async def video_websocket_endpoint(websocket: WebSocket):
             await websocket.send_json({"error": str(e)})
         except:
             pass
+    finally:
+        websocket_sessions.dec(endpoint="/video/ws/upload")
+        if receiver is not None:
+            receiver.cancel()
+        fair_executor.release(upload_id)
+        if cap is not None:
+            cap.release()
+        try:
+            os.remove(video_path)
+        except OSError:
+            pass
@@ -14,15 +14,18 @@ async def image_to_base64(upload_file: UploadFile) -> str:
         # 读取文件内容
         content = await upload_file.read()
         
-        # 验证是否为有效的图片
+        # 验证是否为有效的图片：完整解码一次，文件头正常但数据截断或损坏的图片也能发现
         try:
-            Image.open(io.BytesIO(content))
+            with Image.open(io.BytesIO(content)) as image:
+                image.load()
         except Exception:
             raise HTTPException(status_code=400, detail="无效的图片文件")
         
         # 转换为base64
         base64_image = base64.b64encode(content).decode('utf-8')
         return f"data:image/{upload_file.content_type.split('/')[-1]};base64,{base64_image}"
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"图片处理失败: {str(e)}")
 
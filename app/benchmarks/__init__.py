@@ -0,0 +1,7 @@
+"""热点路径的基准测试
+
+用法：
+    python -m app.benchmarks run --output bench.json
+    python -m app.benchmarks run --inputs samples/ --baseline baseline.json
+    python -m app.benchmarks compare bench.json baseline.json
+"""
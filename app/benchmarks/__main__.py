@@ -0,0 +1,111 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+from typing import Any, Dict
+from app.core.config import settings
+from app.benchmarks.cases import CASES, BenchContext
+from app.benchmarks.inputs import Inputs
+from app.benchmarks.runner import compare, measure
+
+
+def run(args) -> Dict[str, Any]:
+    names = args.cases.split(",") if args.cases else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        raise SystemExit(f"未知的用例: {', '.join(unknown)}，可选 {', '.join(CASES)}")
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        inputs = Inputs(workdir, args.inputs, (width, height), args.video_frames)
+        ctx = BenchContext(inputs, args.model)
+        results = {}
+        try:
+            for name in names:
+                print(f"[bench] {name} ...", file=sys.stderr)
+                try:
+                    case = CASES[name](ctx)
+                    results[name] = measure(case.fn, args.iterations or case.iterations or 50,
+                                            args.warmup, case.items_per_call)
+                except Exception as e:
+                    # 缺少依赖或模型文件的用例记为错误，不影响其他用例
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            ctx.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "inputs": inputs.source,
+            "image_size": f"{width}x{height}",
+            "model_path": settings.MODEL_PATH,
+            "backend": settings.BACKEND,
+            "device": settings.DEVICE,
+            "half": settings.HALF,
+            "batch_enabled": settings.BATCH_ENABLED,
+            "fast_path_enabled": settings.FAST_PATH_ENABLED,
+        },
+        "cases": results,
+    }
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump(data: Dict[str, Any], path: str = None):
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmarks", description="热点路径的端到端基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="运行基准测试并输出 JSON")
+    run_parser.add_argument("--cases", help=f"逗号分隔的用例名，缺省全部：{', '.join(CASES)}")
+    run_parser.add_argument("--iterations", type=int, help="每个用例的计时次数，缺省取各用例的默认值")
+    run_parser.add_argument("--warmup", type=int, default=2, help="计时前的预热次数")
+    run_parser.add_argument("--inputs", help="录制样本目录（图片和视频），缺省使用合成数据")
+    run_parser.add_argument("--size", default="1280x720", help="合成图片和视频的分辨率")
+    run_parser.add_argument("--video-frames", type=int, default=60, help="合成视频的帧数")
+    run_parser.add_argument("--model", help="使用的模型名称，缺省为默认模型")
+    run_parser.add_argument("--output", help="结果文件路径，缺省输出到标准输出")
+    run_parser.add_argument("--baseline", help="同时与该基线结果对比")
+    run_parser.add_argument("--tolerance", type=float, default=0.10, help="允许的相对变差幅度")
+
+    compare_parser = sub.add_parser("compare", help="对比两次结果，有回归时退出码为 1")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10, help="允许的相对变差幅度")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        result = run(args)
+        if args.baseline:
+            result["comparison"] = compare(result, _load(args.baseline), args.tolerance)
+        _dump(result, args.output)
+        report = result.get("comparison")
+    else:
+        report = compare(_load(args.current), _load(args.baseline), args.tolerance)
+        _dump(report)
+
+    if report and report["regressions"]:
+        print(f"[bench] 性能回归: {', '.join(report['regressions'])}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import base64
+import glob
+import itertools
+import json
+import os
+import sys
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.benchmarks.inputs import Inputs
+
+FACE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "face_recognition")
+
+
+class Case(NamedTuple):
+    """一个待计时的调用；iterations 为该用例的默认次数（视频等重负载用例较少）"""
+    fn: Callable[[], Any]
+    items_per_call: int = 1
+    iterations: Optional[int] = None
+
+
+@contextmanager
+def working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class BenchContext:
+    """各用例共享的输入和被测对象，检测器只加载一次"""
+
+    def __init__(self, inputs: Inputs, model: Optional[str] = None):
+        self.inputs = inputs
+        self.model = model
+        self._detector = None
+        self._closers: List[Callable[[], Any]] = []
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            from app.core.yolo_detector import YOLODetector
+            self._detector = YOLODetector()
+        return self._detector
+
+    def on_close(self, fn: Callable[[], Any]):
+        self._closers.append(fn)
+
+    def close(self):
+        for fn in reversed(self._closers):
+            try:
+                fn()
+            except Exception:
+                pass
+        self._closers.clear()
+
+
+def _jpeg_data_url(image: np.ndarray) -> str:
+    _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return "data:image/jpeg;base64," + base64.b64encode(buffer).decode("ascii")
+
+
+def bench_detect_image(ctx: BenchContext) -> Case:
+    paths = itertools.cycle(ctx.inputs.image_files())
+    detector = ctx.detector
+    return Case(lambda: detector.detect_image(next(paths), render=True, model=ctx.model))
+
+
+def bench_process_frame(ctx: BenchContext) -> Case:
+    frames = itertools.cycle(ctx.inputs.images())
+    detector = ctx.detector
+    # 每次传入副本，标注绘制在副本上，不污染输入；不带 stream_id，不经过静态画面门控
+    return Case(lambda: detector.process_frame(next(frames).copy(), render=True, model=ctx.model))
+
+
+def bench_process_frame_base64(ctx: BenchContext) -> Case:
+    payloads = itertools.cycle([_jpeg_data_url(image) for image in ctx.inputs.images()])
+    detector = ctx.detector
+    return Case(lambda: detector.process_frame_base64(next(payloads), render=True, model=ctx.model))
+
+
+def bench_detect_video(ctx: BenchContext) -> Case:
+    path = ctx.inputs.video_file()
+    cap = cv2.VideoCapture(path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+    cap.release()
+    detector = ctx.detector
+    return Case(lambda: detector.detect_video(path, tracking=False, render=True, model=ctx.model, segments=0),
+                items_per_call=frames, iterations=3)
+
+
+def bench_websocket(ctx: BenchContext) -> Case:
+    """经由 /video/ws/video 的完整往返：JSON + Base64 帧进，检测结果和标注帧出"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api import endpoints
+
+    app = FastAPI()
+    app.include_router(endpoints.router, prefix=settings.API_V1_STR)
+    client = TestClient(app)
+    session = client.websocket_connect(f"{settings.API_V1_STR}/video/ws/video")
+    websocket = session.__enter__()
+    ctx.on_close(lambda: session.__exit__(None, None, None))
+
+    messages = itertools.cycle([json.dumps({"frame": _jpeg_data_url(image), "render": True, "model": ctx.model})
+                                for image in ctx.inputs.images()])
+
+    def round_trip():
+        websocket.send_text(next(messages))
+        result = websocket.receive_json()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+    return Case(round_trip)
+
+
+def bench_login(ctx: BenchContext) -> Case:
+    """登录的计算部分：bcrypt 校验密码并签发令牌，不包括数据库查询"""
+    from app.utils.auth import create_access_token, get_password_hash, verify_password
+
+    hashed = get_password_hash("benchmark-password")
+
+    def login():
+        if not verify_password("benchmark-password", hashed):
+            raise RuntimeError("密码校验失败")
+        create_access_token({"sub": "benchmark"})
+    return Case(login, iterations=20)
+
+
+def bench_token_verify(ctx: BenchContext) -> Case:
+    """受保护接口上的令牌校验（与 get_current_user 相同的解码方式），不包括数据库查询"""
+    from jose import jwt
+    from app.utils.auth import ALGORITHM, SECRET_KEY, create_access_token
+
+    token = create_access_token({"sub": "benchmark"})
+    return Case(lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), iterations=1000)
+
+
+def bench_face(ctx: BenchContext) -> Case:
+    """人脸检测 + 识别流水线（Retinaface.detect_image），模型路径相对 face_recognition 目录"""
+    import torch
+
+    if FACE_DIR not in sys.path:
+        sys.path.insert(0, FACE_DIR)
+    with working_directory(FACE_DIR):
+        from retinaface import Retinaface
+        retinaface = Retinaface(cuda=torch.cuda.is_available())
+
+    images = [cv2.imread(p) for p in sorted(glob.glob(os.path.join(FACE_DIR, "img", "*.jpg")))]
+    images = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images if image is not None]
+    images = itertools.cycle(images or [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in ctx.inputs.images()])
+
+    def detect():
+        with working_directory(FACE_DIR):
+            retinaface.detect_image(next(images).copy())
+    return Case(detect)
+
+
+CASES: Dict[str, Callable[[BenchContext], Case]] = {
+    "detect_image": bench_detect_image,
+    "process_frame": bench_process_frame,
+    "process_frame_base64": bench_process_frame_base64,
+    "detect_video": bench_detect_video,
+    "websocket": bench_websocket,
+    "login": bench_login,
+    "token_verify": bench_token_verify,
+    "face": bench_face,
+}
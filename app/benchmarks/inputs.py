@@ -0,0 +1,78 @@
+import glob
+import os
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def synthetic_image(width: int = 1280, height: int = 720, seed: int = 0) -> np.ndarray:
+    """固定随机种子生成的测试图：带噪声的灰色路面上画几个圆形井盖状目标"""
+    rng = np.random.default_rng(seed)
+    image = rng.normal(110, 18, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    for _ in range(4):
+        center = (int(rng.integers(80, width - 80)), int(rng.integers(80, height - 80)))
+        radius = int(rng.integers(30, 70))
+        cv2.circle(image, center, radius, (60, 60, 60), -1)
+        cv2.circle(image, center, radius, (30, 30, 30), 4)
+    return image
+
+
+def synthetic_video(path: str, frames: int = 60, fps: float = 25.0, size: Tuple[int, int] = (1280, 720)) -> str:
+    """生成目标缓慢平移的测试视频，帧间有变化，跟踪和静态画面门控都会正常工作"""
+    width, height = size
+    base = synthetic_image(width + frames * 4, height)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    try:
+        for i in range(frames):
+            writer.write(np.ascontiguousarray(base[:, i * 4:i * 4 + width]))
+    finally:
+        writer.release()
+    return path
+
+
+class Inputs:
+    """基准测试的输入：指定了录制样本目录时优先使用样本，否则使用合成数据"""
+
+    def __init__(self, workdir: str, input_dir: Optional[str] = None, image_size: Tuple[int, int] = (1280, 720),
+                 video_frames: int = 60):
+        self.workdir = workdir
+        self.image_size = image_size
+        self.video_frames = video_frames
+        self.image_paths: List[str] = []
+        self.video_paths: List[str] = []
+        if input_dir:
+            files = sorted(glob.glob(os.path.join(input_dir, "*")))
+            self.image_paths = [f for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+            self.video_paths = [f for f in files if f.lower().endswith(VIDEO_EXTENSIONS)]
+        self.source = "recorded" if self.image_paths or self.video_paths else "synthetic"
+        self._images: Optional[List[np.ndarray]] = None
+        self._video: Optional[str] = None
+
+    def images(self) -> List[np.ndarray]:
+        if self._images is None:
+            images = [cv2.imdecode(np.fromfile(p, dtype=np.uint8), cv2.IMREAD_COLOR) for p in self.image_paths]
+            images = [image for image in images if image is not None]
+            self._images = images or [synthetic_image(*self.image_size, seed=i) for i in range(4)]
+        return self._images
+
+    def image_files(self) -> List[str]:
+        """图片文件路径；使用合成数据时先写到工作目录"""
+        if self.image_paths:
+            return self.image_paths
+        paths = []
+        for i, image in enumerate(self.images()):
+            path = os.path.join(self.workdir, f"bench_{i}.jpg")
+            cv2.imwrite(path, image)
+            paths.append(path)
+        self.image_paths = paths
+        return paths
+
+    def video_file(self) -> str:
+        if self._video is None:
+            self._video = self.video_paths[0] if self.video_paths else synthetic_video(
+                os.path.join(self.workdir, "bench.mp4"), self.video_frames, size=self.image_size)
+        return self._video
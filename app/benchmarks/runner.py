@@ -0,0 +1,125 @@
+import gc
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _rss_reader() -> Optional[Callable[[], int]]:
+    """返回读取当前进程常驻内存（字节）的函数，平台不支持时返回 None"""
+    try:
+        import psutil
+        process = psutil.Process()
+        return lambda: process.memory_info().rss
+    except ImportError:
+        pass
+    if sys.platform.startswith("linux"):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+
+        def read() -> int:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * page_size
+        return read
+    return None
+
+
+class PeakRSS:
+    """在后台线程中定时采样常驻内存，记录一段代码执行期间的峰值"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.read = _rss_reader()
+        self.peak: Optional[int] = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak or 0, self.read())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSS":
+        if self.read is not None:
+            self.peak = self.read()
+            self._thread = threading.Thread(target=self._sample, name="bench-rss", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.read is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self.read())
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值的分位数，sorted_values 须已排序"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int = 1, items_per_call: int = 1) -> Dict[str, Any]:
+    """先预热 warmup 次，再计时执行 iterations 次
+
+    返回延迟分位数（毫秒）、吞吐（每秒处理的条目数）和执行期间的峰值常驻内存。
+    items_per_call 为每次调用处理的条目数，例如视频的帧数。
+    """
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+
+    latencies = []
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            begin = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - begin) * 1000)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_per_s": round(iterations * items_per_call / elapsed, 3) if elapsed > 0 else None,
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1) if rss.peak is not None else None,
+    }
+
+
+# 参与回归判断的指标：名称 -> 数值变大是否表示变差
+COMPARED_METRICS = {
+    "p50_ms": True,
+    "p95_ms": True,
+    "p99_ms": True,
+    "throughput_per_s": False,
+    "peak_rss_mb": True,
+}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.10) -> Dict[str, Any]:
+    """逐项对比两次结果，变差超过 tolerance（相对值）的指标记为回归"""
+    report = {"tolerance": tolerance, "cases": {}, "regressions": []}
+    for name, result in current.get("cases", {}).items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None or "error" in result or "error" in base:
+            continue
+        rows = {}
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            now, before = result.get(metric), base.get(metric)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            rows[metric] = {"baseline": before, "current": now, "change": round(change, 4), "regressed": regressed}
+            if regressed:
+                report["regressions"].append(f"{name}.{metric}")
+        report["cases"][name] = rows
+    return report
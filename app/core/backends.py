@@ -0,0 +1,198 @@
+import os
+import glob
+import hashlib
+import argparse
+from typing import Any, Dict, List, Optional
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from app.core.config import settings
+
+
+# 后端名称 -> (ultralytics 导出格式, 导出产物相对权重文件的后缀)
+BACKENDS = {
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+    "torchscript": ("torchscript", ".torchscript"),
+}
+
+
+def exported_model_path(weights: str, backend: str) -> str:
+    """导出产物的缓存路径，与权重文件放在同一目录"""
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+    return os.path.splitext(weights)[0] + BACKENDS[backend][1]
+
+
+def export_model(weights: str, backend: str, imgsz: int = None, force: bool = False) -> str:
+    """把 .pt 权重导出为指定后端的格式并缓存，已有且比权重新的产物直接复用"""
+    target = exported_model_path(weights, backend)
+    if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+        return target
+
+    fmt = BACKENDS[backend][0]
+    exported = YOLO(weights).export(
+        format=fmt,
+        imgsz=imgsz or settings.EXPORT_IMAGE_SIZE,
+        # onnx / openvino 使用动态形状，才能接受批处理调度器组成的批次
+        dynamic=backend in ("onnx", "openvino"),
+        half=False,
+        device="cpu",
+    )
+    if os.path.abspath(exported) != os.path.abspath(target):
+        raise RuntimeError(f"导出产物路径异常: {exported}")
+    return target
+
+
+def model_fingerprint(weights: str = None, backend: str = None, quantization: str = "none") -> str:
+    """模型版本标识：权重文件内容哈希 + 后端名称（+ 量化模式）"""
+    weights = weights or settings.MODEL_PATH
+    digest = hashlib.sha256()
+    with open(weights, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    version = f"{digest.hexdigest()[:16]}-{(backend or settings.BACKEND).lower()}"
+    if quantization != "none":
+        version += f"-int8-{quantization}"
+    return version
+
+
+def load_model(weights: str = None, backend: str = None, quantization: str = "none") -> YOLO:
+    """按指定的后端加载模型
+
+    导出后的模型仍由 ultralytics 加载，前处理（letterbox、归一化）和
+    后处理（NMS、坐标还原）与 PyTorch 后端完全相同，调用方式不变。
+    quantization 为 dynamic / static 时加载 INT8 量化模型，只在显式指定时生效；
+    量化模型基于 ONNX Runtime，此时 backend 只能为空或 onnx。
+    """
+    weights = weights or settings.MODEL_PATH
+    if quantization != "none":
+        if backend is not None and backend.lower() != "onnx":
+            raise ValueError(f"INT8 量化模型基于 ONNX Runtime，不能使用 {backend} 后端")
+        from app.core.quantization import quantize_model
+        return YOLO(quantize_model(weights, quantization), task="detect")
+    backend = (backend or settings.BACKEND).lower()
+    if backend == "pytorch":
+        return YOLO(weights)
+    return YOLO(export_model(weights, backend), task="detect")
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """计算两组 xyxy 框的 IoU 矩阵"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _compare_results(reference, candidate, box_tolerance: float, conf_tolerance: float) -> Dict[str, Any]:
+    """按类别和 IoU 贪心匹配两个后端的检测框，统计差异"""
+    ref_boxes = reference.boxes.xyxy.cpu().numpy()
+    ref_cls = reference.boxes.cls.cpu().numpy()
+    ref_conf = reference.boxes.conf.cpu().numpy()
+    cand_boxes = candidate.boxes.xyxy.cpu().numpy()
+    cand_cls = candidate.boxes.cls.cpu().numpy()
+    cand_conf = candidate.boxes.conf.cpu().numpy()
+
+    iou = _box_iou(ref_boxes, cand_boxes)
+    if iou.size:
+        iou[ref_cls[:, None] != cand_cls[None, :]] = 0
+
+    matched = 0
+    max_box_diff = 0.0
+    max_conf_diff = 0.0
+    used = set()
+    for i in np.argsort(-ref_conf):
+        if iou.shape[1] == 0:
+            break
+        j = int(np.argmax(iou[i]))
+        if iou[i, j] < 0.5 or j in used:
+            continue
+        used.add(j)
+        matched += 1
+        max_box_diff = max(max_box_diff, float(np.abs(ref_boxes[i] - cand_boxes[j]).max()))
+        max_conf_diff = max(max_conf_diff, float(abs(ref_conf[i] - cand_conf[j])))
+
+    ok = (matched == len(ref_boxes) == len(cand_boxes)
+          and max_box_diff <= box_tolerance and max_conf_diff <= conf_tolerance)
+    return {
+        "reference_boxes": int(len(ref_boxes)),
+        "candidate_boxes": int(len(cand_boxes)),
+        "matched": matched,
+        "max_box_diff": max_box_diff,
+        "max_conf_diff": max_conf_diff,
+        "passed": bool(ok),
+    }
+
+
+def check_parity(images: List[str], backend: str, weights: str = None,
+                 box_tolerance: float = 2.0, conf_tolerance: float = 0.02) -> Dict[str, Any]:
+    """比较指定后端（不做量化）与 PyTorch 后端在同一批图片上的检测结果
+
+    box_tolerance 为框坐标允许的最大偏差（像素），conf_tolerance 为置信度允许的最大偏差。
+    """
+    weights = weights or settings.MODEL_PATH
+    reference_model = YOLO(weights)
+    candidate_model = load_model(weights, backend)
+    options = dict(conf=settings.CONFIDENCE_THRESHOLD, iou=settings.IOU_THRESHOLD,
+                   device="cpu", verbose=False)
+
+    per_image = []
+    for path in images:
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        reference = reference_model.predict(source=image, **options)[0]
+        candidate = candidate_model.predict(source=image, **options)[0]
+        report = _compare_results(reference, candidate, box_tolerance, conf_tolerance)
+        report["image"] = path
+        per_image.append(report)
+
+    return {
+        "backend": backend,
+        "images": len(per_image),
+        "passed": all(r["passed"] for r in per_image),
+        "max_box_diff": max((r["max_box_diff"] for r in per_image), default=0.0),
+        "max_conf_diff": max((r["max_conf_diff"] for r in per_image), default=0.0),
+        "details": per_image,
+    }
+
+
+def list_images(folder: str) -> List[str]:
+    """列出目录下的图片文件"""
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png", "*.bmp"):
+        paths.extend(glob.glob(os.path.join(folder, ext)))
+    return sorted(paths)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="导出推理后端并与 PyTorch 结果做一致性校验")
+    parser.add_argument("--backend", required=True, choices=sorted(BACKENDS))
+    parser.add_argument("--weights", default=settings.MODEL_PATH)
+    parser.add_argument("--images", help="用于一致性校验的图片目录")
+    parser.add_argument("--force", action="store_true", help="忽略缓存重新导出")
+    parser.add_argument("--box-tolerance", type=float, default=2.0)
+    parser.add_argument("--conf-tolerance", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    path = export_model(args.weights, args.backend, force=args.force)
+    print(f"导出完成: {path}")
+    if args.images:
+        report = check_parity(list_images(args.images), args.backend, args.weights,
+                              args.box_tolerance, args.conf_tolerance)
+        print(f"一致性校验: {'通过' if report['passed'] else '未通过'}，"
+              f"图片数 {report['images']}，最大框偏差 {report['max_box_diff']:.3f}px，"
+              f"最大置信度偏差 {report['max_conf_diff']:.4f}")
+        for item in report["details"]:
+            if not item["passed"]:
+                print(f"  {item['image']}: {item}")
+        raise SystemExit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
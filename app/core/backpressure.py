@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.metrics import frames_dropped
+
+
+class LatestFrameSlot:
+    """单个连接的待处理帧槽位，只保留最新的一帧
+
+    接收任务不停地读取客户端消息放进槽位，处理循环每次取走最新的一帧；
+    处理期间到达的旧帧直接被新帧覆盖并计入丢帧。无论客户端发送多快，
+    每个连接最多只有一帧在处理、一帧在等待，端到端延迟有上界。
+    """
+
+    def __init__(self):
+        self._item: Any = None
+        self._event = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item: Any):
+        if self._item is not None:
+            self.dropped += 1
+            frames_dropped.inc(reason="stale")
+        self._item = item
+        self.received += 1
+        self._event.set()
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[Any]:
+        """等待并取走最新的一帧，连接关闭且没有待处理帧时返回 None"""
+        while self._item is None:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item, self._item = self._item, None
+        return item
+
+
+class RateEstimator:
+    """按每帧处理耗时的指数滑动平均估算服务端能达到的帧率"""
+
+    def __init__(self, alpha: float = None):
+        self.alpha = settings.REALTIME_RATE_ALPHA if alpha is None else alpha
+        self.seconds_per_frame: Optional[float] = None
+
+    def observe(self, seconds: float):
+        if self.seconds_per_frame is None:
+            self.seconds_per_frame = seconds
+        else:
+            self.seconds_per_frame += self.alpha * (seconds - self.seconds_per_frame)
+
+    @property
+    def fps(self) -> Optional[float]:
+        if not self.seconds_per_frame:
+            return None
+        return round(min(1.0 / self.seconds_per_frame, settings.REALTIME_MAX_ADVERTISED_FPS), 2)
+
+
+class FlowControl:
+    """一个实时连接的背压状态：最新帧槽位、帧率估计和定期的流控通告"""
+
+    def __init__(self):
+        self.slot = LatestFrameSlot()
+        self.rate = RateEstimator()
+        self._last_advertised = 0.0
+
+    def observe(self, seconds: float):
+        self.rate.observe(seconds)
+
+    def state(self) -> Dict[str, Any]:
+        return {"fps": self.rate.fps, "received": self.slot.received, "dropped": self.slot.dropped}
+
+    def advertisement_due(self) -> bool:
+        """距上次通告超过 REALTIME_FLOW_INTERVAL_S 时返回 True"""
+        now = time.monotonic()
+        if self.rate.fps is None or now - self._last_advertised < settings.REALTIME_FLOW_INTERVAL_S:
+            return False
+        self._last_advertised = now
+        return True
@@ -0,0 +1,150 @@
+import threading
+import queue
+import time
+import asyncio
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.metrics import registry
+
+
+class _BatchRequest:
+    """调度队列中的单个推理请求"""
+    __slots__ = ("frame", "options", "key", "future")
+
+    def __init__(self, frame: np.ndarray, options: Dict[str, Any]):
+        self.frame = frame
+        self.options = options
+        # 参数不同的请求不能放进同一个批次
+        self.key = tuple(sorted(options.items()))
+        self.future: Future = Future()
+
+
+class BatchScheduler:
+    """跨请求的动态批处理调度器
+
+    所有调用方把帧放入同一个队列，调度线程在 max_wait_ms 内尽量凑满
+    max_batch_size 帧后执行一次批量推理，再把结果分发回各自的 Future。
+    推理只在调度线程中执行，因此也避免了多线程同时调用同一个模型。
+    """
+
+    def __init__(self, predict_batch: Callable[..., List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self._predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Optional[_BatchRequest]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._batches = 0
+        self._frames = 0
+        self._max_seen = 0
+        registry.gauge("batch_scheduler_queue_frames", "批处理调度队列中等待推理的帧数").set_function(self.queue_depth)
+
+    def start(self):
+        """启动调度线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="yolo-batch-scheduler", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止调度线程，已入队的请求会先处理完"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, frame: np.ndarray, **options) -> Future:
+        """提交一帧，返回 concurrent.futures.Future"""
+        if self._thread is None:
+            self.start()
+        request = _BatchRequest(frame, options)
+        self._queue.put(request)
+        return request.future
+
+    def submit_many(self, frames: List[np.ndarray], **options) -> List[Future]:
+        """一次提交多帧（例如视频帧），它们会尽量进入同一批次"""
+        return [self.submit(frame, **options) for frame in frames]
+
+    def predict(self, frame: np.ndarray, **options) -> Any:
+        """同步提交并等待结果"""
+        return self.submit(frame, **options).result()
+
+    async def predict_async(self, frame: np.ndarray, **options) -> Any:
+        """异步提交并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(frame, **options))
+
+    def queue_depth(self) -> int:
+        """当前等待中的请求数"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """批处理统计信息"""
+        return {
+            "batches": self._batches,
+            "frames": self._frames,
+            "avg_batch_size": self._frames / self._batches if self._batches else 0.0,
+            "max_batch_size_seen": self._max_seen,
+            "queue_depth": self.queue_depth(),
+        }
+
+    def _collect(self, first: _BatchRequest) -> Tuple[List[_BatchRequest], bool]:
+        """以第一个请求为起点，在等待时间内收集一批请求"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 队列里已经有的请求直接取走，不必等待
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+
+            # 按推理参数分组，每组执行一次批量推理
+            groups: Dict[tuple, List[_BatchRequest]] = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for requests in groups.values():
+                self._run_group(requests)
+
+            if stopping:
+                return
+
+    def _run_group(self, requests: List[_BatchRequest]):
+        # 跳过已被调用方取消的请求
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+        try:
+            results = self._predict_batch([r.frame for r in requests], **requests[0].options)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._frames += len(requests)
+        self._max_seen = max(self._max_seen, len(requests))
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
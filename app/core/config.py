@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "YOLO Detection API"
@@ -11,11 +11,132 @@ class Settings(BaseSettings):
     IOU_THRESHOLD: float = 0.45
     DEVICE: str = "cpu"  # 默认使用 CPU
     HALF: bool = False  # Use half precision
+    BACKEND: str = "pytorch"  # 推理后端: pytorch / onnx / openvino / torchscript
+    EXPORT_IMAGE_SIZE: int = 640  # 导出模型时使用的输入尺寸
+    QUANTIZATION: str = "none"  # INT8 量化模式: none / dynamic / static（基于 ONNX Runtime）
+    CALIBRATION_DIR: str = "calibration"  # 静态量化校准图片目录
+    CALIBRATION_MAX_IMAGES: int = 200  # 参与校准的最大图片数
+
+    # 模型注册表设置（多个命名模型，支持热切换）
+    MODEL_DEFAULT_NAME: str = "default"  # MODEL_PATH 对应模型在注册表中的名称
+    MODELS: Dict[str, str] = {}  # 启动时额外加载的模型，名称 -> 权重路径
+    MODEL_WARMUP_RUNS: int = 2  # 模型上线前的预热推理次数
+
+    # 切片推理设置（高分辨率图片）
+    TILE_ENABLED: bool = False  # 图片检测默认是否启用切片推理
+    TILE_SIZE: int = 640  # 切片边长（像素）
+    TILE_OVERLAP: float = 0.2  # 相邻切片的重叠比例
+    TILE_MERGE: str = "nms"  # 跨切片合并策略: nms / nmm
+    TILE_MERGE_IOU: float = 0.5  # 合并阈值（nms 为 IoU，nmm 为交集/较小框面积）
+    TILE_FULL_IMAGE: bool = True  # 是否额外做一次整图推理，用于检出大目标
+
+    # 图片解码设置（源图远大于模型输入时直接缩小解码）
+    IMAGE_INGEST_REDUCED_DECODE: bool = True  # JPEG 是否按 1/2、1/4、1/8 缩小解码
+    IMAGE_INGEST_MIN_SIDE: int = 0  # 缩小解码后长边的下限，0 表示只保证不小于 EXPORT_IMAGE_SIZE
+    IMAGE_INGEST_TURBOJPEG: bool = True  # 安装了 PyTurboJPEG 时用 libjpeg-turbo 解码 JPEG
+
+    # 批处理调度设置
+    BATCH_ENABLED: bool = True  # 是否启用跨请求批处理调度
+    BATCH_MAX_SIZE: int = 8  # 单次批量推理的最大帧数
+    BATCH_MAX_WAIT_MS: float = 10.0  # 凑批的最长等待时间（毫秒）
+
+    # 实时帧直通推理路径（预分配缓冲区，绕过 ultralytics 通用 predictor）
+    FAST_PATH_ENABLED: bool = False
+
+    # 视频流水线设置
+    VIDEO_QUEUE_SIZE: int = 32  # 各阶段之间队列的最大帧数
+    VIDEO_INFER_WORKERS: int = 2  # 推理线程数（未启用批处理调度时固定为 1）
+    VIDEO_ANNOTATE_WORKERS: int = 2  # 标注线程数
+    VIDEO_SEGMENTS: int = 0  # 长视频分段并行处理的进程数，0 或 1 表示不分段
+    VIDEO_SEGMENT_MIN_FRAMES: int = 1500  # 每段的最少帧数，过短的视频不分段
+    VIDEO_STREAM_QUEUE_CHUNKS: int = 64  # 流式输出缓存的视频分块数，客户端读得慢时反压推理
+    VIDEO_STREAM_RETENTION_S: float = 300.0  # 流式任务结束后检测结果旁路保留的时间（秒）
+
+    # 抽帧设置（跳过的帧只 grab 或直接定位，不做颜色转换）
+    FRAME_SAMPLER_POLICY: str = "all"  # 视频检测默认的抽帧策略：all / every_n / fps / keyframes / ranges
+    FRAME_SAMPLER_EVERY_N: int = 3  # every_n 策略的默认间隔（帧）
+    FRAME_SAMPLER_FPS: float = 2.0  # fps 策略的默认目标帧率
+    FRAME_SAMPLER_SEEK_GAP: int = 120  # 跳过的帧数超过该值时直接定位，而不是逐帧 grab
+    UPLOAD_WS_SAMPLE_EVERY_N: int = 3  # /ws/upload 不跟踪时每隔多少帧检测一帧
+
+    # 视频任务队列设置
+    VIDEO_JOB_DB: str = "video_jobs.sqlite3"  # 任务记录的 SQLite 文件（相对 UPLOAD_DIR）
+    VIDEO_JOB_WORKERS: int = 1  # 同时处理的视频任务数
+    VIDEO_JOB_CHECKPOINT_FRAMES: int = 600  # 每处理多少帧记录一次检查点
+    VIDEO_JOB_HEARTBEAT_S: float = 5.0  # 运行中任务刷新心跳的间隔（秒）
+    VIDEO_JOB_STALE_S: float = 60.0  # 运行中任务超过该时间无心跳视为所属进程已退出，重新排队（秒）
+
+    # 跟踪设置（关键帧检测，中间帧由跟踪器外推）
+    TRACKING_ENABLED: bool = False  # 视频类接口默认是否启用跟踪模式
+    TRACKING_KEYFRAME_INTERVAL: int = 5  # 关键帧间隔（帧）
+    TRACKING_ADAPTIVE: bool = True  # 是否根据场景变化自适应调整关键帧间隔
+    TRACKING_MIN_INTERVAL: int = 1
+    TRACKING_MAX_INTERVAL: int = 10
+    TRACKING_HIGH_THRESHOLD: float = 0.5  # 高置信度检测框阈值
+    TRACKING_MATCH_IOU: float = 0.3  # 轨迹与检测框匹配的最小 IoU
+    TRACKING_MAX_AGE: int = 30  # 轨迹在无匹配情况下最多保留的帧数
+
+    # 静态画面门控设置
+    MOTION_GATE_ENABLED: bool = True  # 实时流是否启用静态画面门控
+    MOTION_GATE_SIZE: int = 64  # 比较时缩放到的边长（像素）
+    MOTION_GATE_PIXEL_DELTA: int = 12  # 灰度差超过该值的像素视为变化
+    MOTION_GATE_THRESHOLD: float = 0.01  # 变化像素比例低于该值时复用上次结果
+    MOTION_GATE_MAX_SKIP: int = 150  # 连续复用的最大帧数，超过后强制推理
+    MOTION_GATE_MAX_STREAMS: int = 256  # 同时保留门控状态的视频流数量上限
+
+    # 负载自适应设置（实时流在高负载时降低输入分辨率、拉长关键帧间隔）
+    LOAD_CONTROL_ENABLED: bool = True
+    LOAD_CONTROL_LEVELS: List[int] = [640, 480, 320]  # 各档位的输入尺寸
+    LOAD_CONTROL_KEYFRAME_INTERVALS: List[int] = [1, 3, 6]  # 各档位的最小关键帧间隔
+    LOAD_CONTROL_TARGET_MS: float = 150.0  # 单帧 p95 延迟目标（毫秒）
+    LOAD_CONTROL_WINDOW: int = 50  # 统计 p95 的样本数
+    LOAD_CONTROL_QUEUE_HIGH: int = 16  # 推理队列达到该深度视为过载
+    LOAD_CONTROL_COOLDOWN_S: float = 2.0  # 两次调整之间的最短间隔（秒）
+
+    # 实时连接背压设置（每个连接只保留最新一帧，并向客户端通告可达帧率）
+    REALTIME_RATE_ALPHA: float = 0.2  # 单帧处理耗时滑动平均的系数
+    REALTIME_FLOW_INTERVAL_S: float = 1.0  # 二进制协议下发送流控消息的间隔（秒）
+    REALTIME_MAX_ADVERTISED_FPS: float = 30.0  # 通告帧率的上限
+
+    # 输出自适应设置（按会话的 RTT 和发送阻塞调整标注图像的质量、尺寸和发送帧率）
+    RATE_CONTROL_ENABLED: bool = True
+    RATE_CONTROL_QUALITIES: List[int] = [90, 75, 60, 45]  # 各档位的 JPEG / WebP 编码质量
+    RATE_CONTROL_SCALES: List[float] = [1.0, 0.75, 0.5, 0.5]  # 各档位标注图像的缩放比例
+    RATE_CONTROL_FRAME_INTERVALS: List[int] = [1, 1, 2, 4]  # 各档位每隔几帧发送一次标注图像
+    RATE_CONTROL_TARGET_RTT_MS: float = 250.0  # RTT p90 目标（毫秒）
+    RATE_CONTROL_SEND_HIGH_MS: float = 30.0  # 发送平均阻塞超过该值视为发送缓冲区积压（毫秒）
+    RATE_CONTROL_WINDOW: int = 10  # 统计 RTT 和发送阻塞的样本数
+    RATE_CONTROL_COOLDOWN_S: float = 2.0  # 两次调整之间的最短间隔（秒）
+    RATE_CONTROL_PING_INTERVAL_S: float = 1.0  # 发送 ping 的间隔（秒）
+
+    # 推理进程池设置
+    WORKER_POOL_SIZE: int = 0  # 推理进程数，0 表示在主进程内推理
+    WORKER_TORCH_THREADS: int = 1  # 每个推理进程的 torch 线程数
+    WORKER_HEARTBEAT_INTERVAL: float = 2.0  # 心跳间隔（秒）
+    WORKER_HEARTBEAT_TIMEOUT: float = 30.0  # 超过该时间无心跳则重启进程（秒）
+    WORKER_TASK_TIMEOUT: float = 120.0  # 任务开始执行后超过该时间未完成则认为进程卡死并重启（秒），0 表示不检查
+
+    # 公平调度线程池设置（WebSocket 帧检测按连接轮询执行，不占用事件循环）
+    FAIR_EXECUTOR_WORKERS: int = 0  # 工作线程数，0 表示按 CPU 核数或推理进程数自动确定
+    FAIR_EXECUTOR_QUANTUM_S: float = 0.05  # 每轮分给一个连接的执行时间额度（秒）
 
     # Upload settings
     UPLOAD_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
 
+    # 图片检测结果缓存设置
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DIR: str = "cache"  # 相对 UPLOAD_DIR 的缓存目录
+    RESULT_CACHE_MEMORY_ENTRIES: int = 1024  # 内存 LRU 条目上限
+    RESULT_CACHE_DISK_MAX_MB: int = 512  # 磁盘缓存大小上限（MB）
+
+    # 检测历史存储设置（写入 app.core.database 的数据库）
+    DETECTION_STORE_ENABLED: bool = True  # 是否保存检测历史
+    DETECTION_STORE_BATCH_SIZE: int = 500  # 每批写入的最大行数
+    DETECTION_STORE_FLUSH_INTERVAL_S: float = 1.0  # 未攒满一批时最长等待多久写入（秒）
+    DETECTION_STORE_QUEUE_SIZE: int = 100000  # 等待写入的最大行数，超出时丢弃
+    DETECTION_STORE_MAX_PAGE: int = 1000  # 查询每页的最大行数
+
     class Config:
         case_sensitive = True
 
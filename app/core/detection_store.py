@@ -0,0 +1,205 @@
+import base64
+import datetime
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.detection import DetectionRecord
+
+
+store_rows = registry.counter(
+    "detection_store_rows_total", "检测历史记录的行数（inserted 为已写入，dropped 为队列满时丢弃）", ("result",)
+)
+store_flush_errors = registry.counter("detection_store_flush_errors_total", "检测历史批量写入失败的次数")
+
+
+def encode_cursor(created_at: datetime.datetime, row_id: int) -> str:
+    """分页游标：上一页最后一行的 (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").split("|")
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+class DetectionStore:
+    """检测历史存储
+
+    请求路径上只把检测结果放进有界队列，后台线程按 DETECTION_STORE_BATCH_SIZE
+    行或 DETECTION_STORE_FLUSH_INTERVAL_S 秒攒一批，用一条多行 INSERT 写入。
+    队列满时直接丢弃并计数，数据库变慢不会拖慢检测接口。
+    查询按 (created_at, id) 倒序做键集分页，每页都走索引定位，
+    与翻到第几页无关。created_at 为 UTC 时间。
+    """
+
+    def __init__(self, engine=None, batch_size: int = None, flush_interval: float = None, queue_size: int = None):
+        if engine is None:
+            from app.core.database import engine
+        self.engine = engine
+        self.Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        self.batch_size = max(1, batch_size or settings.DETECTION_STORE_BATCH_SIZE)
+        self.flush_interval = flush_interval or settings.DETECTION_STORE_FLUSH_INTERVAL_S
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(queue_size or settings.DETECTION_STORE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 已登记但尚未写完的行数（包括队列中和正在写入的），flush 据此判断是否全部落库；
+        # 入队前先计数、写完后才扣减，取出与写入之间不会出现计数为 0 的空档
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        registry.gauge("detection_store_queue_rows", "等待写入检测历史的行数").set_function(self._queue.qsize)
+
+    def start(self) -> "DetectionStore":
+        if self._thread is None:
+            DetectionRecord.__table__.create(self.engine, checkfirst=True)
+            self._thread = threading.Thread(target=self._run, name="detection-store", daemon=True)
+            self._thread.start()
+        return self
+
+    def record(self, source: str, detections: List[Dict[str, Any]], source_type: str = "image",
+               frame_index: int = None, model: str = None, created_at: datetime.datetime = None):
+        """登记一帧的检测结果，不等待写入"""
+        # 列类型为不带时区的 DATETIME，按 UTC 存储
+        created_at = created_at or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        with self._idle:
+            self._unfinished += len(detections)
+        for i, detection in enumerate(detections):
+            x1, y1, x2, y2 = detection["bbox"]
+            row = {
+                "created_at": created_at,
+                "source": source[:255],
+                "source_type": source_type,
+                "frame_index": frame_index,
+                "class_name": detection["class_name"],
+                "confidence": float(detection["confidence"]),
+                "x1": float(x1), "y1": float(y1), "x2": float(x2), "y2": float(y2),
+                "track_id": detection.get("track_id"),
+                "model": model,
+            }
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                store_rows.inc(len(detections) - i, result="dropped")
+                self._done(len(detections) - i)
+                return
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(DetectionRecord), batch)
+            store_rows.inc(len(batch), result="inserted")
+        except Exception as e:
+            store_flush_errors.inc()
+            store_rows.inc(len(batch), result="dropped")
+            print(f"检测历史写入失败: {e}")
+        finally:
+            self._done(len(batch))
+
+    def _done(self, rows: int):
+        with self._idle:
+            self._unfinished -= rows
+            if self._unfinished <= 0:
+                self._idle.notify_all()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待已登记的记录全部写入，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(min(remaining, 0.1))
+        return True
+
+    def stop(self):
+        self.flush()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def query(self, source: str = None, class_name: str = None, min_confidence: float = None,
+              start: datetime.datetime = None, end: datetime.datetime = None,
+              cursor: str = None, limit: int = 100) -> Dict[str, Any]:
+        """按条件倒序查询，返回 {"items", "next_cursor"}；next_cursor 为 None 表示没有更多"""
+        limit = max(1, min(limit, settings.DETECTION_STORE_MAX_PAGE))
+        conditions = []
+        if source is not None:
+            conditions.append(DetectionRecord.source == source)
+        if class_name is not None:
+            conditions.append(DetectionRecord.class_name == class_name)
+        if min_confidence is not None:
+            conditions.append(DetectionRecord.confidence >= min_confidence)
+        if start is not None:
+            conditions.append(DetectionRecord.created_at >= start)
+        if end is not None:
+            conditions.append(DetectionRecord.created_at < end)
+        if cursor:
+            after_time, after_id = decode_cursor(cursor)
+            conditions.append(or_(
+                DetectionRecord.created_at < after_time,
+                and_(DetectionRecord.created_at == after_time, DetectionRecord.id < after_id)
+            ))
+
+        statement = (
+            select(DetectionRecord)
+            .where(*conditions)
+            .order_by(DetectionRecord.created_at.desc(), DetectionRecord.id.desc())
+            .limit(limit + 1)
+        )
+        with self.Session() as session:
+            rows = session.execute(statement).scalars().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": [self._to_dict(row) for row in rows],
+            "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+        }
+
+    @staticmethod
+    def _to_dict(row: DetectionRecord) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "created_at": row.created_at.isoformat(),
+            "source": row.source,
+            "source_type": row.source_type,
+            "frame_index": row.frame_index,
+            "class_name": row.class_name,
+            "confidence": row.confidence,
+            "bbox": [row.x1, row.y1, row.x2, row.y2],
+            "track_id": row.track_id,
+            "model": row.model,
+        }
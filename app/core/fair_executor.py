@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+class _Task:
+    """公平调度队列中的单个任务"""
+    __slots__ = ("fn", "args", "kwargs", "future")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+
+
+class FairExecutor:
+    """按连接公平调度的线程池
+
+    每个键（通常是一个 WebSocket 连接）有自己的任务队列，工作线程按差额轮询
+    （deficit round robin）在有任务的键之间轮转：轮到的键获得 quantum_s 秒的额度，
+    额度为正时执行它的一个任务，任务实际耗时从额度中扣除。单帧耗时长或提交频繁的连接
+    会积累欠额而被跳过，不会饿死其他连接；检测任务也不再占用事件循环和默认线程池，
+    HTTP 接口在 WebSocket 满载时仍能及时响应。
+    """
+
+    def __init__(self, workers: int = None, quantum_s: float = None, name: str = "fair-executor"):
+        if not workers:
+            workers = settings.FAIR_EXECUTOR_WORKERS
+        if not workers:
+            # 使用推理进程池时线程只负责等待进程返回，按进程数的两倍保持进程忙碌
+            workers = 2 * settings.WORKER_POOL_SIZE if settings.WORKER_POOL_SIZE > 0 else min(8, os.cpu_count() or 4)
+        self.workers = max(1, int(workers))
+        self.quantum = settings.FAIR_EXECUTOR_QUANTUM_S if quantum_s is None else quantum_s
+        self.name = name
+        # 有待执行任务的键，按轮询顺序排列
+        self._queues: "OrderedDict[str, Deque[_Task]]" = OrderedDict()
+        self._deficit: Dict[str, float] = {}
+        # 已释放但队列中还有任务的键，队列清空时删除其欠额
+        self._released: Set[str] = set()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        registry.gauge("fair_executor_queue_tasks", "公平调度线程池中等待执行的任务数").set_function(self.queue_depth)
+        registry.gauge("fair_executor_active_keys", "公平调度线程池中有待执行任务的连接数").set_function(
+            lambda: len(self._queues)
+        )
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._cond:
+            self._stopping = False
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作线程，已入队的任务会先执行完"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """把任务放进 key 的队列，返回 concurrent.futures.Future"""
+        if not self._threads:
+            self.start()
+        task = _Task(fn, args, kwargs)
+        with self._cond:
+            tasks = self._queues.get(key)
+            if tasks is None:
+                tasks = self._queues[key] = deque()
+            tasks.append(task)
+            self._released.discard(key)
+            self._pending += 1
+            self._cond.notify()
+        return task.future
+
+    async def run(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """异步提交并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(key, fn, *args, **kwargs))
+
+    def release(self, key: str):
+        """连接关闭后清除它的欠额；队列中还有任务时等队列清空后再清除"""
+        with self._cond:
+            if key in self._queues:
+                self._released.add(key)
+            else:
+                self._deficit.pop(key, None)
+
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "active_keys": len(self._queues),
+                "queued_by_key": {key: len(tasks) for key, tasks in self._queues.items()},
+            }
+
+    def _next(self) -> Tuple[str, _Task]:
+        """取下一个要执行的任务，调用方持有锁"""
+        while True:
+            key = next(iter(self._queues))
+            deficit = self._deficit.get(key, 0.0)
+            if deficit <= 0:
+                # 额度用完，补充一个 quantum 后排到队尾
+                self._deficit[key] = deficit + self.quantum
+                self._queues.move_to_end(key)
+                continue
+            tasks = self._queues[key]
+            task = tasks.popleft()
+            self._pending -= 1
+            if tasks:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+                if key in self._released:
+                    # 连接已关闭，不再记账
+                    self._released.discard(key)
+                    self._deficit.pop(key, None)
+                else:
+                    # 队列清空时不保留剩余额度；本任务的耗时执行完后再扣，欠额留到下次
+                    self._deficit[key] = 0.0
+            return key, task
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queues and not self._stopping:
+                    self._cond.wait()
+                if not self._queues:
+                    return
+                key, task = self._next()
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except Exception as e:
+                task.future.set_exception(e)
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                # 连接已释放的键不再记账
+                if key in self._deficit:
+                    self._deficit[key] -= elapsed
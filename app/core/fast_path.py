@@ -0,0 +1,196 @@
+import copy
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry, stage_duration
+
+
+fast_path_frames = registry.counter("fast_path_frames_total", "直通推理路径处理的帧数")
+fast_path_allocations = registry.counter(
+    "fast_path_buffer_allocations_total", "直通推理路径新分配缓冲区的次数"
+)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """贪心 NMS，每轮用向量化方式计算与剩余框的 IoU，返回保留框的下标"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(prediction: np.ndarray, conf: float, iou: float, max_det: int = 300,
+                max_wh: float = 7680.0) -> np.ndarray:
+    """解码单张图的检测头输出 (4 + 类别数, 候选数)，返回 (n, 6) 的 [x1, y1, x2, y2, score, cls]
+
+    所有类别一起做 NMS：按类别给框加上不同的偏移，不同类别的框不会互相抑制。
+    """
+    scores_all = prediction[4:]
+    cls = scores_all.argmax(axis=0)
+    scores = scores_all[cls, np.arange(scores_all.shape[1])]
+    mask = scores > conf
+    if not mask.any():
+        return np.zeros((0, 6), dtype=np.float32)
+
+    cx, cy, w, h = prediction[:4, mask]
+    boxes = np.stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2), axis=1)
+    scores, cls = scores[mask], cls[mask]
+    keep = nms(boxes + (cls * max_wh)[:, None], scores, iou)[:max_det]
+    return np.concatenate((boxes[keep], scores[keep, None], cls[keep, None]), axis=1).astype(np.float32)
+
+
+class _Buffers:
+    """某个输入尺寸下预分配的 letterbox 画布和模型输入张量"""
+
+    def __init__(self, imgsz: int, batch_size: int, device, dtype):
+        import torch
+
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self.canvas = np.full((batch_size, imgsz, imgsz, 3), 114, dtype=np.uint8)
+        # 与画布共享内存的 torch 视图，拷贝到输入张量时不经过中间数组
+        self.canvas_tensor = torch.from_numpy(self.canvas)
+        self.input = torch.empty((batch_size, 3, imgsz, imgsz), dtype=dtype, device=device)
+        # 按缩放后尺寸缓存 resize 的目标数组，同一路流的分辨率通常不变
+        self.resized: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+class FastPath:
+    """实时帧的直通推理路径
+
+    跳过 ultralytics 通用 predictor：letterbox 写入预分配画布，BGR→RGB、
+    HWC→CHW 和归一化在预分配的输入张量上原地完成，直接调用模型前向，
+    再用向量化的 NumPy 后处理解码和 NMS。letterbox 画布、resize 目标和输入张量
+    按输入尺寸复用，buffer_allocations 统计的是这些缓冲区的新建次数
+    （torch / NumPy 内部的临时分配不在统计范围内）。
+
+    使用模型的独立副本：ultralytics 检测头会在模块上缓存 anchors / strides / shape，
+    与 predictor 共用同一个模块时，不同输入形状的并发前向会用错 anchors。
+    """
+
+    def __init__(self, model, device: str = None, half: bool = None, batch_size: int = None):
+        import torch
+        from ultralytics.nn.autobackend import AutoBackend
+
+        self.device = torch.device(device or settings.DEVICE)
+        # nn.Module 深拷贝一份，fuse 和检测头的缓存都不会影响 predictor 使用的模块
+        weights = copy.deepcopy(model.model) if hasattr(model.model, "parameters") else model.ckpt_path or model.model
+        self.backend = AutoBackend(weights, device=self.device, fp16=bool(settings.HALF if half is None else half),
+                                   fuse=True, verbose=False)
+        self.backend.eval()
+        self.names = self.backend.names
+        self.dtype = torch.float16 if self.backend.fp16 else torch.float32
+        self.batch_size = max(1, batch_size or settings.BATCH_MAX_SIZE)
+        self._buffers: Dict[int, _Buffers] = {}
+        self._lock = threading.Lock()
+        # 插桩回调：每次 run 结束后收到本次的分配统计
+        self.on_frame: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._stats = {"frames": 0, "buffer_allocations": 0, "last": None}
+
+    def _allocated(self, count: int, record: Dict[str, Any]):
+        record["buffer_allocations"] += count
+        fast_path_allocations.inc(count)
+
+    def _buffers_for(self, imgsz: int, record: Dict[str, Any]) -> _Buffers:
+        buffers = self._buffers.get(imgsz)
+        if buffers is None:
+            buffers = self._buffers[imgsz] = _Buffers(imgsz, self.batch_size, self.device, self.dtype)
+            self._allocated(2, record)
+        return buffers
+
+    def _letterbox(self, frame: np.ndarray, buffers: _Buffers, slot: int,
+                   record: Dict[str, Any]) -> Tuple[float, int, int]:
+        """等比缩放到画布中央，返回 (缩放比例, 左侧填充, 顶部填充)"""
+        height, width = frame.shape[:2]
+        size = buffers.imgsz
+        ratio = min(size / height, size / width)
+        new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+        left, top = (size - new_w) // 2, (size - new_h) // 2
+
+        canvas = buffers.canvas[slot]
+        canvas[...] = 114
+        if (new_w, new_h) == (width, height):
+            canvas[top:top + new_h, left:left + new_w] = frame
+        else:
+            resized = buffers.resized.get((new_h, new_w))
+            if resized is None:
+                resized = buffers.resized[(new_h, new_w)] = np.empty((new_h, new_w, 3), dtype=np.uint8)
+                self._allocated(1, record)
+            cv2.resize(frame, (new_w, new_h), dst=resized, interpolation=cv2.INTER_LINEAR)
+            canvas[top:top + new_h, left:left + new_w] = resized
+        return ratio, left, top
+
+    def _prepare(self, count: int, buffers: _Buffers):
+        """uint8 BGR 画布 → 归一化的 RGB CHW 输入，全部在预分配张量上原地完成"""
+        source = buffers.canvas_tensor[:count]
+        target = buffers.input[:count]
+        for channel in range(3):
+            # 输入通道 0/1/2 依次取画布的 R/G/B（BGR 的 2/1/0）
+            target[:, channel].copy_(source[..., 2 - channel])
+        target.mul_(1.0 / 255.0)
+        return target
+
+    def run(self, frames: List[np.ndarray], conf: float, iou: float,
+            imgsz: int = None) -> List[List[Dict[str, Any]]]:
+        """检测一组帧，返回每帧的检测结果列表"""
+        import torch
+
+        imgsz = imgsz or settings.EXPORT_IMAGE_SIZE
+        record = {"frames": len(frames), "buffer_allocations": 0}
+
+        outputs = []
+        with self._lock:
+            buffers = self._buffers_for(imgsz, record)
+            for start in range(0, len(frames), self.batch_size):
+                chunk = frames[start:start + self.batch_size]
+                with stage_duration.time(stage="preprocess"):
+                    transforms = [self._letterbox(frame, buffers, slot, record) for slot, frame in enumerate(chunk)]
+                    inputs = self._prepare(len(chunk), buffers)
+                with stage_duration.time(stage="inference"), torch.inference_mode():
+                    prediction = self.backend(inputs)
+                    if isinstance(prediction, (list, tuple)):
+                        prediction = prediction[0]
+                    if isinstance(prediction, torch.Tensor):
+                        prediction = prediction.float().cpu().numpy()
+                with stage_duration.time(stage="postprocess"):
+                    for frame, (ratio, left, top), pred in zip(chunk, transforms, prediction):
+                        outputs.append(self._to_detections(postprocess(pred, conf, iou), frame.shape,
+                                                           ratio, left, top))
+
+        fast_path_frames.inc(len(frames))
+        self._stats["frames"] += len(frames)
+        self._stats["buffer_allocations"] += record["buffer_allocations"]
+        self._stats["last"] = record
+        if self.on_frame is not None:
+            self.on_frame(record)
+        return outputs
+
+    def _to_detections(self, boxes: np.ndarray, shape, ratio: float, left: int, top: int) -> List[Dict[str, Any]]:
+        """把画布坐标还原到原图并裁剪到图像范围内"""
+        height, width = shape[:2]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / ratio).clip(0, width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / ratio).clip(0, height)
+        return [
+            {
+                "class_name": self.names[int(cls)],
+                "confidence": float(score),
+                "bbox": [float(x1), float(y1), float(x2), float(y2)],
+            }
+            for x1, y1, x2, y2, score, cls in boxes.tolist()
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """累计帧数、缓冲区分配次数以及最近一次调用的分配统计"""
+        return dict(self._stats, buffer_sizes=sorted(self._buffers))
@@ -0,0 +1,183 @@
+import bisect
+from typing import Any, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.video_segments import keyframe_indices
+
+
+POLICIES = ("all", "every_n", "fps", "keyframes", "ranges")
+
+sampler_frames = registry.counter(
+    "frame_sampler_frames_total", "抽帧器处理的源视频帧数（decoded 为完整解码，grabbed / seeked 为跳过）",
+    ("action",)
+)
+
+
+def decode_savings_ratio() -> float:
+    """未做完整解码和颜色转换的帧占全部源帧的比例"""
+    decoded = sampler_frames.get(action="decoded")
+    skipped = sampler_frames.get(action="grabbed") + sampler_frames.get(action="seeked")
+    total = decoded + skipped
+    return skipped / total if total else 0.0
+
+
+registry.gauge("frame_sampler_decode_savings_ratio", "抽帧节省的解码比例").set_function(decode_savings_ratio)
+
+
+def parse_ranges(text: Optional[str]) -> List[Tuple[float, float]]:
+    """解析时间段参数，格式为 "起始秒-结束秒,起始秒-结束秒"，结束秒可省略表示到结尾"""
+    ranges = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition("-")
+        start = float(start)
+        end = float(end) if end.strip() else float("inf")
+        if end <= start:
+            raise ValueError(f"无效的时间段: {item}")
+        ranges.append((start, end))
+    return sorted(ranges)
+
+
+class FrameSampler:
+    """按策略抽取视频帧，接口与 cv2.VideoCapture.read 相同
+
+    all：每帧；every_n：每 N 帧取一帧；fps：按目标帧率取帧；keyframes：只取关键帧；
+    ranges：只取指定时间段内的帧（可与 every_n / fps 叠加）。
+    不需要的帧只调用 grab()，跳过 retrieve 的颜色转换和拷贝；间隔超过
+    FRAME_SAMPLER_SEEK_GAP 时直接定位，连中间帧的 grab 也省掉。
+    index 为最近一次返回的帧在源视频中的帧号。
+    """
+
+    def __init__(self, cap, policy: str = "all", every_n: int = None, target_fps: float = None,
+                 ranges: List[Tuple[float, float]] = None, video_path: str = None, seek_gap: int = None):
+        if policy not in POLICIES:
+            raise ValueError(f"不支持的抽帧策略: {policy}")
+        self.cap = cap
+        self.policy = policy
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.seek_gap = seek_gap or settings.FRAME_SAMPLER_SEEK_GAP
+        self.position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        self.index = -1
+        # 已返回帧的源帧号，按返回顺序排列
+        self.sampled_indices: List[int] = []
+
+        step = 1.0
+        if every_n:
+            step = max(1, int(every_n))
+        elif target_fps:
+            step = max(1.0, self.fps / float(target_fps))
+        if policy in ("every_n", "fps", "ranges"):
+            self.step = step
+        else:
+            self.step = 1.0
+        self.ranges = [(int(s * self.fps), e * self.fps) for s, e in (ranges or [])]
+        if policy == "ranges" and not self.ranges:
+            raise ValueError("ranges 策略需要指定时间段")
+
+        self.keyframes: List[int] = []
+        if policy == "keyframes":
+            self.keyframes = keyframe_indices(video_path, self.fps) if video_path else []
+            if not self.keyframes:
+                # 读不到关键帧信息时退化为每秒一帧
+                self.step = max(1.0, self.fps)
+        self._next_wanted = float(self.position)
+
+    @classmethod
+    def from_options(cls, cap, options: Optional[Dict[str, Any]], video_path: str = None) -> "FrameSampler":
+        """按 {"policy", "every_n", "fps", "ranges"} 选项创建抽帧器，缺省取配置"""
+        options = options or {}
+        policy = options.get("policy") or settings.FRAME_SAMPLER_POLICY
+        every_n, target_fps = options.get("every_n"), options.get("fps")
+        if policy == "every_n" and not every_n:
+            every_n = settings.FRAME_SAMPLER_EVERY_N
+        if policy == "fps" and not target_fps:
+            target_fps = settings.FRAME_SAMPLER_FPS
+        ranges = options.get("ranges")
+        if isinstance(ranges, str):
+            ranges = parse_ranges(ranges)
+        return cls(cap, policy, every_n=every_n, target_fps=target_fps, ranges=ranges, video_path=video_path)
+
+    @property
+    def active(self) -> bool:
+        """是否真的会跳过帧"""
+        return self.policy != "all"
+
+    @property
+    def output_fps(self) -> float:
+        """抽帧后的等效帧率，用于写出标注视频"""
+        if self.policy == "keyframes" and self.keyframes and self.total_frames:
+            return max(1e-3, self.fps * len(self.keyframes) / self.total_frames)
+        return self.fps / self.step
+
+    def expected_frames(self) -> int:
+        """预计返回的帧数，用于进度显示"""
+        if self.policy == "keyframes" and self.keyframes:
+            return len(self.keyframes)
+        lengths = [self.total_frames]
+        if self.policy == "ranges":
+            # 每个时间段从段首重新计步
+            lengths = [max(0, min(e, self.total_frames) - s) for s, e in self.ranges]
+        # 第 k 帧取在 ceil(k * step)，长度为 L 的区间内共 ceil(L / step) 帧
+        return sum(int(np.ceil(length / self.step - 1e-6)) for length in lengths)
+
+    def _next_target(self) -> Optional[int]:
+        """下一个需要的源帧号，没有更多帧时返回 None"""
+        if self.policy == "keyframes" and self.keyframes:
+            pos = bisect.bisect_left(self.keyframes, self.position)
+            return self.keyframes[pos] if pos < len(self.keyframes) else None
+
+        wanted = max(self._next_wanted, float(self.position))
+        if self.policy == "ranges":
+            for start, end in self.ranges:
+                if wanted < end:
+                    # 进入新的时间段时从段首开始重新计步
+                    if wanted < start:
+                        wanted = float(start)
+                    break
+            else:
+                return None
+        return int(np.ceil(wanted - 1e-6))
+
+    def _skip_to(self, target: int) -> bool:
+        gap = target - self.position
+        if gap > self.seek_gap:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            sampler_frames.inc(gap, action="seeked")
+            self.position = target
+            return True
+        while self.position < target:
+            if not self.cap.grab():
+                return False
+            sampler_frames.inc(action="grabbed")
+            self.position += 1
+        return True
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        target = self._next_target()
+        if target is None or (self.policy != "all" and 0 < self.total_frames <= target):
+            return False, None
+        if not self._skip_to(target):
+            return False, None
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        sampler_frames.inc(action="decoded")
+        self.index = self.position
+        self.position += 1
+        # 按名义时间表累加步长，不从取整后的帧号重新起算，否则小数步长会逐帧漂移
+        self._next_wanted = max(self._next_wanted, float(self.index)) + self.step
+        self.sampled_indices.append(self.index)
+        return True, frame
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "sampled_frames": len(self.sampled_indices),
+            "source_frames": self.position,
+            "decode_savings": 1 - len(self.sampled_indices) / self.position if self.position else 0.0,
+        }
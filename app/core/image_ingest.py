@@ -0,0 +1,224 @@
+import struct
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry, stage_duration
+
+# libjpeg-turbo 的 Python 绑定是可选依赖，未安装或找不到动态库时使用 OpenCV 解码
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+image_decodes = registry.counter(
+    "image_ingest_decodes_total", "图片解码次数（按解码器和缩小倍数）", ("decoder", "reduction")
+)
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# JPEG 中携带图像尺寸的 SOF 段（排除 DHT / JPG / DAC）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_turbo = None
+_turbo_loaded = False
+
+
+class ImageHeader(NamedTuple):
+    format: str  # jpeg / png / webp
+    width: int
+    height: int
+    orientation: int = 1  # JPEG 的 EXIF 方向，5~8 表示解码后宽高互换
+
+
+class DecodedImage(NamedTuple):
+    image: np.ndarray
+    original_size: Tuple[int, int]  # 原图（按 EXIF 方向旋转后）的宽、高
+    scale: Tuple[float, float]  # 原图坐标 = 解码图坐标 × scale
+    decoder: str
+
+
+def _turbojpeg():
+    """按需加载 libjpeg-turbo，加载失败时返回 None（只尝试一次）"""
+    global _turbo, _turbo_loaded
+    if not _turbo_loaded:
+        _turbo_loaded = True
+        if TurboJPEG is not None and settings.IMAGE_INGEST_TURBOJPEG:
+            try:
+                _turbo = TurboJPEG()
+            except Exception as e:
+                print(f"libjpeg-turbo 不可用，使用 OpenCV 解码: {e}")
+    return _turbo
+
+
+def ingest_signature() -> str:
+    """影响解码结果（缩小倍数、解码器）的设置，作为图片检测结果缓存键的一部分"""
+    decoder = "turbojpeg" if _turbojpeg() is not None else "opencv"
+    return (f"ingest={settings.IMAGE_INGEST_REDUCED_DECODE},{settings.IMAGE_INGEST_MIN_SIDE},"
+            f"{settings.EXPORT_IMAGE_SIZE},{decoder}")
+
+
+def _exif_orientation(segment: memoryview) -> int:
+    """从 APP1 段中读取 EXIF 方向标签，没有时返回 1"""
+    if bytes(segment[:6]) != b"Exif\x00\x00":
+        return 1
+    tiff = segment[6:]
+    if len(tiff) < 8:
+        return 1
+    endian = {b"II": "<", b"MM": ">"}.get(bytes(tiff[:2]))
+    if endian is None:
+        return 1
+    offset = struct.unpack_from(endian + "I", tiff, 4)[0]
+    if offset + 2 > len(tiff):
+        return 1
+    count = struct.unpack_from(endian + "H", tiff, offset)[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, _, _ = struct.unpack_from(endian + "HHI", tiff, entry)
+        if tag == 0x0112:
+            value = struct.unpack_from(endian + "H", tiff, entry + 8)[0]
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def _probe_jpeg(view: memoryview) -> Optional[ImageHeader]:
+    offset, orientation = 2, 1
+    while offset + 4 <= len(view):
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        if marker == 0xFF:
+            # 段之间允许填充字节
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack_from(">H", view, offset + 2)[0]
+        if marker == 0xE1:
+            orientation = _exif_orientation(view[offset + 4:offset + 2 + length])
+        elif marker in _SOF_MARKERS:
+            if offset + 9 > len(view):
+                return None
+            height, width = struct.unpack_from(">HH", view, offset + 5)
+            return ImageHeader("jpeg", width, height, orientation)
+        elif marker in (0xD9, 0xDA):
+            return None
+        offset += 2 + length
+    return None
+
+
+def probe(data) -> Optional[ImageHeader]:
+    """只读文件头获取格式和尺寸，不解码像素；不认识的格式返回 None"""
+    view = memoryview(data).cast("B")
+    try:
+        if bytes(view[:3]) == b"\xff\xd8\xff":
+            return _probe_jpeg(view)
+        if bytes(view[:8]) == b"\x89PNG\r\n\x1a\n" and bytes(view[12:16]) == b"IHDR":
+            width, height = struct.unpack_from(">II", view, 16)
+            return ImageHeader("png", width, height)
+        if bytes(view[:4]) == b"RIFF" and bytes(view[8:12]) == b"WEBP":
+            chunk = bytes(view[12:16])
+            if chunk == b"VP8 ":
+                width, height = struct.unpack_from("<HH", view, 26)
+                return ImageHeader("webp", width & 0x3FFF, height & 0x3FFF)
+            if chunk == b"VP8L":
+                bits = struct.unpack_from("<I", view, 21)[0]
+                return ImageHeader("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+            if chunk == b"VP8X":
+                width = int.from_bytes(bytes(view[24:27]), "little") + 1
+                height = int.from_bytes(bytes(view[27:30]), "little") + 1
+                return ImageHeader("webp", width, height)
+    except struct.error:
+        return None
+    return None
+
+
+def reduction_for(header: Optional[ImageHeader], target_size: int = None) -> int:
+    """选择缩小解码倍数（1/2/4/8），保证缩小后长边不小于模型输入尺寸
+
+    只有 JPEG 能在解码时直接缩小（libjpeg 的 DCT 缩放），其他格式返回 1。
+    """
+    if header is None or header.format != "jpeg" or not settings.IMAGE_INGEST_REDUCED_DECODE:
+        return 1
+    min_side = max(target_size or settings.EXPORT_IMAGE_SIZE, settings.IMAGE_INGEST_MIN_SIDE)
+    long_side = max(header.width, header.height)
+    for factor in (8, 4, 2):
+        if long_side / factor >= min_side:
+            return factor
+    return 1
+
+
+def output_long_side(header: Optional[ImageHeader], scale: float = 1.0,
+                     max_size: Optional[Tuple[int, int]] = None) -> Optional[int]:
+    """标注图像按 scale、max_size（见 renderer.encode_image）输出时的长边像素数"""
+    if header is None:
+        return None
+    width, height = (header.height, header.width) if header.orientation >= 5 else (header.width, header.height)
+    factor = min(scale or 1.0, 1.0)
+    if max_size:
+        if max_size[0]:
+            factor = min(factor, max_size[0] / width)
+        if max_size[1]:
+            factor = min(factor, max_size[1] / height)
+    return int(np.ceil(max(width, height) * factor))
+
+
+def decode_image(data, target_size: int = None, full: bool = False, output_scale: float = None,
+                 output_max_size: Optional[Tuple[int, int]] = None) -> DecodedImage:
+    """解码图片字节，源图远大于模型输入时直接以 1/2、1/4、1/8 的尺寸解码
+
+    data 可以是 bytes、memoryview 或 uint8 数组；full 为 True 时（例如切片推理）总是全尺寸解码。
+    需要返回标注图像时传入输出的 output_scale / output_max_size，缩小解码不会小于输出尺寸，
+    标注图像的清晰度与全尺寸解码相同。检测框用 scale_detections 按返回的 scale 映射回原图坐标。
+    """
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, np.uint8)
+    header = probe(buffer)
+    if output_scale is not None and header is not None:
+        target_size = max(target_size or settings.EXPORT_IMAGE_SIZE,
+                          output_long_side(header, output_scale, output_max_size))
+    factor = 1 if full else reduction_for(header, target_size)
+
+    image, decoder = None, "opencv"
+    with stage_duration.time(stage="imdecode"):
+        turbo = _turbojpeg() if header is not None and header.format == "jpeg" else None
+        # libjpeg-turbo 不处理 EXIF 方向，带旋转的图片交给 OpenCV
+        if turbo is not None and header.orientation == 1:
+            try:
+                image = turbo.decode(buffer, scaling_factor=(1, factor) if factor > 1 else None)
+                decoder = "turbojpeg"
+            except Exception:
+                image = None
+        if image is None and factor > 1:
+            image = cv2.imdecode(buffer, _REDUCED_FLAGS[factor])
+            decoder = "opencv_reduced"
+        if image is None:
+            image, factor, decoder = cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1, "opencv"
+    if image is None:
+        raise ValueError("无法解码图像数据")
+    image_decodes.inc(decoder=decoder, reduction=str(factor))
+
+    height, width = image.shape[:2]
+    if header is None or factor == 1:
+        return DecodedImage(image, (width, height), (1.0, 1.0), decoder)
+    original = (header.height, header.width) if header.orientation >= 5 else (header.width, header.height)
+    return DecodedImage(image, original, (original[0] / width, original[1] / height), decoder)
+
+
+def read_image(path: str, target_size: int = None, full: bool = False, output_scale: float = None,
+               output_max_size: Optional[Tuple[int, int]] = None) -> DecodedImage:
+    """读取图片文件并解码，与 ultralytics 相同用 np.fromfile 读取，兼容中文路径"""
+    return decode_image(np.fromfile(path, dtype=np.uint8), target_size, full, output_scale, output_max_size)
+
+
+def scale_detections(detections: List[Dict[str, Any]], scale: Tuple[float, float]) -> List[Dict[str, Any]]:
+    """把缩小解码图上的检测框映射回原图坐标，返回新的列表，不修改传入的检测结果"""
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return detections
+    scaled = []
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        scaled.append({**det, "bbox": [x1 * sx, y1 * sy, x2 * sx, y2 * sy]})
+    return scaled
@@ -0,0 +1,89 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+class LoadController:
+    """按负载自适应选择推理分辨率和关键帧间隔
+
+    记录最近的单帧延迟和队列深度：p95 延迟超过目标或队列积压时降一档
+    （更小的输入尺寸、更长的关键帧间隔），p95 明显低于目标且队列空闲时
+    升一档。两次调整之间有冷却时间，避免来回抖动。
+    """
+
+    def __init__(self, levels: List[int] = None, keyframe_intervals: List[int] = None,
+                 target_ms: float = None, window: int = None, queue_high: int = None,
+                 cooldown: float = None, queue_depth: Callable[[], int] = None):
+        self.levels = list(levels or settings.LOAD_CONTROL_LEVELS)
+        intervals = list(keyframe_intervals or settings.LOAD_CONTROL_KEYFRAME_INTERVALS)
+        # 间隔列表短于分辨率档位时沿用最后一个值
+        self.keyframe_intervals = [intervals[min(i, len(intervals) - 1)] for i in range(len(self.levels))]
+        self.target_ms = target_ms or settings.LOAD_CONTROL_TARGET_MS
+        self.queue_high = queue_high or settings.LOAD_CONTROL_QUEUE_HIGH
+        self.cooldown = settings.LOAD_CONTROL_COOLDOWN_S if cooldown is None else cooldown
+        self.queue_depth = queue_depth or (lambda: 0)
+        self._latencies = deque(maxlen=window or settings.LOAD_CONTROL_WINDOW)
+        self._lock = threading.Lock()
+        self._last_change = 0.0
+        self.level = 0
+        self.changes = 0
+
+        registry.gauge("load_control_imgsz", "当前实时推理使用的输入尺寸").set_function(lambda: self.imgsz)
+        registry.gauge("load_control_level", "当前降级档位（0 为全分辨率）").set_function(lambda: self.level)
+
+    @property
+    def imgsz(self) -> int:
+        return self.levels[self.level]
+
+    @property
+    def keyframe_interval(self) -> int:
+        return self.keyframe_intervals[self.level]
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            return float(np.percentile(self._latencies, 95))
+
+    def observe(self, latency_ms: float, frames: int = 1):
+        """记录一次处理的单帧延迟，并按需要调整档位"""
+        with self._lock:
+            for _ in range(max(1, frames)):
+                self._latencies.append(latency_ms)
+        self._adjust()
+
+    def _adjust(self):
+        now = time.monotonic()
+        if now - self._last_change < self.cooldown:
+            return
+        p95 = self.p95()
+        if p95 is None:
+            return
+        depth = self.queue_depth()
+
+        with self._lock:
+            if (p95 > self.target_ms or depth >= self.queue_high) and self.level < len(self.levels) - 1:
+                self.level += 1
+            elif p95 < self.target_ms * 0.6 and depth < self.queue_high / 4 and self.level > 0:
+                self.level -= 1
+            else:
+                return
+            # 档位变化后旧的延迟样本不再有参考价值
+            self._latencies.clear()
+            self._last_change = now
+            self.changes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "imgsz": self.imgsz,
+            "keyframe_interval": self.keyframe_interval,
+            "level": self.level,
+            "p95_ms": self.p95(),
+            "queue_depth": self.queue_depth(),
+            "target_ms": self.target_ms,
+            "changes": self.changes,
+        }
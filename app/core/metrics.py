@@ -0,0 +1,315 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签值保存数值"""
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def remove(self, **labels):
+        """删除一组标签对应的序列，例如已卸载的模型"""
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        """当前各序列的值，可跨进程传递"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, external: List[Dict[Tuple[str, ...], Any]] = ()) -> List[str]:
+        """输出文本格式；external 为其他进程的快照，同标签的序列相加"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        merged: Dict[Tuple[str, ...], float] = {}
+        for _, key, value in self.samples():
+            merged[key] = merged.get(key, 0.0) + value
+        for values in external:
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0.0) + value
+        for key, value in merged.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以绑定回调在采集时取值"""
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """采集时调用 function 获取当前值"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+            self._functions.pop(key, None)
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], float]]:
+        samples = super().samples()
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                samples.append((self.name, key, float(function())))
+            except Exception:
+                continue
+        return samples
+
+
+class Histogram(_Metric):
+    """按桶统计分布的直方图，用于耗时等指标
+
+    每个序列保存各桶的非累积计数以及总和、次数，observe 只做一次二分查找和加法，
+    输出时再累加成 Prometheus 要求的累积桶。
+    """
+    metric_type = "histogram"
+    # 默认桶覆盖 0.5 毫秒到 1 分钟，适合单帧各阶段到整段视频的耗时
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                       30.0, 60.0)
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = None):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        # 各序列为 [桶 1 ... 桶 n, +Inf 桶, 总和, 次数]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录 with 块的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels) -> float:
+        """观测次数"""
+        series = self._series.get(self._key(labels))
+        return series[-1] if series is not None else 0.0
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series.pop(key, None)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self, external: List[Dict[Tuple[str, ...], List[float]]] = ()) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        merged = self.snapshot()
+        for values in external:
+            for key, series in values.items():
+                target = merged.get(key)
+                if target is None:
+                    merged[key] = list(series)
+                elif len(target) == len(series):
+                    for i, value in enumerate(series):
+                        target[i] += value
+        label_names = self.label_names + ("le",)
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for key, series in merged.items():
+            cumulative = 0.0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(label_names, key + (bound,))} "
+                             f"{_format_value(cumulative)}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    """进程内的指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        # 其他进程（如推理进程）上报的快照：来源 -> {指标名: 快照}
+        self._external: Dict[str, Dict[str, Any]] = {}
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Tuple[str, ...], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labels, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+                raise ValueError(f"指标 {name} 已以不同类型或标签注册")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> List[Tuple[str, str, str, Tuple[str, ...], Optional[Tuple[float, ...]], Any]]:
+        """计数器和直方图的快照，可以跨进程传递后由 set_external 汇总；仪表盘只反映本进程状态，不包括在内"""
+        with self._lock:
+            metrics = [m for m in self._metrics.values() if isinstance(m, (Counter, Histogram))]
+        return [
+            (m.metric_type, m.name, m.documentation, m.label_names, getattr(m, "buckets", None), m.snapshot())
+            for m in metrics
+        ]
+
+    def set_external(self, source: str, snapshot):
+        """记录某个来源最新的快照，输出时与本进程的同名指标相加"""
+        values = {}
+        for kind, name, documentation, labels, buckets, series in snapshot:
+            try:
+                if kind == "histogram":
+                    self.histogram(name, documentation, labels, buckets)
+                else:
+                    self.counter(name, documentation, labels)
+            except ValueError:
+                continue
+            values[name] = series
+        with self._lock:
+            self._external[source] = values
+
+    def remove_external(self, source: str):
+        with self._lock:
+            self._external.pop(source, None)
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            externals = list(self._external.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render([values[metric.name] for values in externals if metric.name in values]))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# 各线程中正在计时的 histogram，用于识别嵌套调用
+_timing = threading.local()
+
+
+def timed(histogram: Histogram, **labels):
+    """装饰器：把函数每次调用的耗时记入 histogram
+
+    同一线程内被装饰的函数嵌套调用时（例如 process_frame 内部调用 process_frames_detailed），
+    同一个 histogram 只记录最外层的一次，一次请求不会产生多个样本。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            active = getattr(_timing, "active", None)
+            if active is None:
+                active = _timing.active = set()
+            if id(histogram) in active:
+                return fn(*args, **kwargs)
+            active.add(id(histogram))
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                active.discard(id(histogram))
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+# 多个模块共用的耗时与丢帧指标
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "单帧处理各阶段的耗时（Base64 解码、图像解码、推理、绘制、编码、发送等）", ("stage",)
+)
+method_duration = registry.histogram("detector_method_duration_seconds", "检测器各方法的耗时", ("method",))
+endpoint_duration = registry.histogram("endpoint_duration_seconds", "各接口的处理耗时（WebSocket 按消息计）",
+                                       ("endpoint",))
+frames_dropped = registry.counter("frames_dropped_total", "未经处理即丢弃的帧数", ("reason",))
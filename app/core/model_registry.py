@@ -0,0 +1,304 @@
+import os
+import gc
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.core.backends import load_model, model_fingerprint
+from app.core.metrics import registry as metrics_registry
+
+
+model_memory = metrics_registry.gauge(
+    "model_memory_bytes", "已加载模型占用的内存（参数或模型文件大小）", ("model", "version")
+)
+model_inflight = metrics_registry.gauge(
+    "model_inflight_requests", "各模型版本正在处理的请求数", ("model", "version")
+)
+model_load_seconds = metrics_registry.gauge(
+    "model_load_seconds", "各模型版本的加载耗时（秒）", ("model", "version")
+)
+model_warmup_seconds = metrics_registry.gauge(
+    "model_warmup_seconds", "各模型版本的预热耗时（秒）", ("model", "version")
+)
+
+
+def _path_size(path: str) -> int:
+    """文件或目录（OpenVINO 模型为目录）的总大小"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def _model_memory(model) -> int:
+    """估算模型占用的内存：PyTorch 模型统计参数和缓冲区，导出模型按文件大小计"""
+    module = getattr(model, "model", None)
+    if hasattr(module, "parameters"):
+        tensors = itertools.chain(module.parameters(), module.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
+    if isinstance(module, str) and os.path.exists(module):
+        return _path_size(module)
+    return 0
+
+
+class ModelVersion:
+    """注册表中的一个模型版本"""
+
+    def __init__(self, name: str, weights: str, backend: str, seq: int, quantization: str = "none"):
+        self.name = name
+        self.weights = weights
+        self.backend = backend
+        self.quantization = quantization
+        self.seq = seq
+        self.version = model_fingerprint(weights, backend, quantization)
+        # 同名模型的不同版本可能同时存在（新版本就绪、旧版本排空），用 key 区分
+        self.key = f"{name}@{self.version}#{seq}"
+        self.model = None
+        self.state = "loading"
+        self.inflight = 0
+        self.memory_bytes = 0
+        self.load_ms = None
+        self.warmup_ms = None
+        self.loaded_at = None
+        self.error = None
+        self.make_default = False
+        # 依附于该版本的派生对象（如直通推理路径），随版本一起释放
+        self.cache: Dict[str, Any] = {}
+
+    def labels(self) -> Dict[str, str]:
+        """指标标签；同一权重重复加载时靠序号区分"""
+        return {"model": self.name, "version": f"{self.version}#{self.seq}"}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "backend": self.backend,
+            "quantization": self.quantization,
+            "weights": self.weights,
+            "state": self.state,
+            "inflight": self.inflight,
+            "memory_bytes": self.memory_bytes,
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """命名模型注册表
+
+    每个名称对应一个当前版本。新版本在后台加载并预热，就绪后原子地替换
+    同名旧版本；旧版本进入 draining 状态，等在途请求全部结束后才释放。
+    默认模型同样可以随时切换，请求可通过名称显式选择模型做 A/B 对比。
+    """
+
+    def __init__(self, warmup_runs: int = None, on_change: Callable[[], None] = None):
+        self.warmup_runs = settings.MODEL_WARMUP_RUNS if warmup_runs is None else warmup_runs
+        # 默认模型或同名模型版本变化时回调，例如清空按流缓存的检测结果
+        self.on_change = on_change
+        self._active: Dict[str, ModelVersion] = {}
+        self._versions: Dict[str, ModelVersion] = {}
+        self._default: Optional[str] = None
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def default_name(self) -> Optional[str]:
+        return self._default
+
+    def load(self, name: str, weights: str, backend: str = None, make_default: bool = False,
+             background: bool = True, quantization: str = None) -> ModelVersion:
+        """加载（或替换）一个命名模型，background 为 True 时在后台线程加载和预热
+
+        quantization 为空时，未指定后端的模型沿用配置的 QUANTIZATION，显式指定了后端的
+        模型按该后端原样加载，不做量化。
+        """
+        if quantization is None:
+            quantization = settings.QUANTIZATION if backend is None else "none"
+        if quantization not in ("none", "dynamic", "static"):
+            raise ValueError(f"不支持的量化模式: {quantization}")
+        if quantization != "none":
+            # INT8 量化模型基于 ONNX Runtime
+            if backend is not None and backend.lower() != "onnx":
+                raise ValueError(f"INT8 量化模型基于 ONNX Runtime，不能使用 {backend} 后端")
+            backend = "onnx"
+        backend = (backend or settings.BACKEND).lower()
+        if not os.path.exists(weights):
+            raise ValueError(f"模型文件不存在: {weights}")
+        version = ModelVersion(name, weights, backend, next(self._seq), quantization)
+        version.make_default = make_default
+        with self._lock:
+            # 同名的失败记录被新的加载请求取代
+            for key in [k for k, v in self._versions.items() if v.name == name and v.state == "failed"]:
+                del self._versions[key]
+            self._versions[version.key] = version
+        if background:
+            threading.Thread(target=self._load, args=(version,), name=f"model-load-{name}",
+                             daemon=True).start()
+        else:
+            self._load(version)
+            if version.state == "failed":
+                raise RuntimeError(f"模型 {name} 加载失败: {version.error}")
+        return version
+
+    def _warmup(self, model):
+        size = settings.EXPORT_IMAGE_SIZE
+        frame = np.zeros((size, size, 3), dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            model.predict(source=frame, device=settings.DEVICE, half=settings.HALF, verbose=False)
+
+    def _load(self, version: ModelVersion):
+        try:
+            start = time.perf_counter()
+            model = load_model(version.weights, version.backend, version.quantization)
+            version.load_ms = (time.perf_counter() - start) * 1000
+            # 预热后再上线，首个请求不用承担初始化开销
+            start = time.perf_counter()
+            self._warmup(model)
+            version.warmup_ms = (time.perf_counter() - start) * 1000
+            version.memory_bytes = _model_memory(model)
+        except Exception as e:
+            version.state = "failed"
+            version.error = str(e)
+            return
+
+        with self._lock:
+            version.model = model
+            version.loaded_at = time.time()
+            current = self._active.get(version.name)
+            if current is not None and current.seq > version.seq:
+                # 同名的更新版本已经先一步上线，本版本直接作废
+                self._retire(version)
+                return
+            self._active[version.name] = version
+            version.state = "ready"
+            if version.make_default or self._default is None:
+                self._default = version.name
+            if current is not None:
+                self._retire(current)
+        labels = version.labels()
+        model_memory.set(version.memory_bytes, **labels)
+        model_inflight.set_function(lambda: version.inflight, **labels)
+        model_load_seconds.set(version.load_ms / 1000, **labels)
+        model_warmup_seconds.set(version.warmup_ms / 1000, **labels)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _retire(self, version: ModelVersion):
+        """下线一个版本，调用方需持有锁；没有在途请求时立即释放"""
+        version.state = "draining"
+        if version.inflight == 0:
+            self._evict(version)
+
+    def _evict(self, version: ModelVersion):
+        version.state = "evicted"
+        version.model = None
+        version.cache.clear()
+        self._versions.pop(version.key, None)
+        model_memory.remove(**version.labels())
+        model_inflight.remove(**version.labels())
+        model_load_seconds.remove(**version.labels())
+        model_warmup_seconds.remove(**version.labels())
+        gc.collect()
+
+    def acquire(self, name: str = None) -> ModelVersion:
+        """取得模型当前版本并登记一个在途请求，用完后必须调用 release
+
+        name 也可以是版本 key，用于在一段较长的处理（如整段视频）中固定版本。
+        """
+        with self._lock:
+            name = name or self._default
+            version = self._active.get(name)
+            if version is None and name in self._versions and self._versions[name].model is not None:
+                version = self._versions[name]
+            if version is None:
+                raise KeyError(f"模型不存在或尚未就绪: {name}")
+            version.inflight += 1
+            return version
+
+    def release(self, version: ModelVersion):
+        with self._lock:
+            version.inflight -= 1
+            if version.state == "draining" and version.inflight == 0:
+                self._evict(version)
+
+    @contextmanager
+    def use(self, name: str = None) -> Iterator[ModelVersion]:
+        version = self.acquire(name)
+        try:
+            yield version
+        finally:
+            self.release(version)
+
+    def get(self, key: str) -> ModelVersion:
+        """按版本 key 查找（包括正在排空的旧版本）"""
+        with self._lock:
+            version = self._versions.get(key)
+        if version is None or version.model is None:
+            raise KeyError(f"模型版本已释放: {key}")
+        return version
+
+    def has(self, name: str) -> bool:
+        return name in self._active
+
+    def current(self, name: str = None) -> ModelVersion:
+        """模型当前版本，不登记在途请求"""
+        name = name or self._default
+        version = self._active.get(name)
+        if version is None:
+            raise KeyError(f"模型不存在或尚未就绪: {name}")
+        return version
+
+    def set_default(self, name: str):
+        """切换默认模型；目标仍在加载时，就绪后自动切换"""
+        with self._lock:
+            if name in self._active:
+                self._default = name
+            else:
+                loading = [v for v in self._versions.values() if v.name == name and v.state == "loading"]
+                if not loading:
+                    raise KeyError(f"模型不存在: {name}")
+                loading[-1].make_default = True
+                return
+        self._changed()
+
+    def unload(self, name: str):
+        """卸载模型，在途请求结束后释放内存；默认模型不能卸载"""
+        with self._lock:
+            if name == self._default:
+                raise ValueError("不能卸载默认模型，请先切换默认模型")
+            version = self._active.pop(name, None)
+            if version is None:
+                raise KeyError(f"模型不存在: {name}")
+            self._retire(version)
+
+    def versions(self) -> List[ModelVersion]:
+        """所有仍在内存中的版本（包括加载中和排空中的版本）"""
+        with self._lock:
+            return sorted(self._versions.values(), key=lambda v: v.seq)
+
+    def clear_caches(self):
+        """清空所有版本的派生对象，例如推理设备变化后"""
+        with self._lock:
+            for version in self._versions.values():
+                version.cache.clear()
+
+    def describe(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            versions = sorted(self._versions.values(), key=lambda v: v.seq)
+            default = self._default
+        return [dict(v.describe(), default=(v.name == default and v.state == "ready")) for v in versions]
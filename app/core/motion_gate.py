@@ -0,0 +1,83 @@
+from typing import Any, Dict, List, Optional
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+gate_checks = registry.counter(
+    "motion_gate_checks_total", "静态画面门控的判定次数", ("result",)
+)
+
+
+def gate_hit_ratio() -> float:
+    """门控命中率（复用上一次检测结果的比例）"""
+    hits = gate_checks.get(result="hit")
+    total = hits + gate_checks.get(result="miss")
+    return hits / total if total else 0.0
+
+
+registry.gauge("motion_gate_hit_ratio", "静态画面门控命中率").set_function(gate_hit_ratio)
+
+
+class MotionGate:
+    """静态画面门控
+
+    把帧缩小成灰度小图，与上一次实际推理的帧比较；变化像素比例低于阈值
+    时直接复用上一次的检测结果。与上一次推理帧（而不是上一帧）比较，
+    缓慢变化也会累积到阈值；连续复用超过 max_skip 帧时强制推理一次。
+    """
+
+    def __init__(self, size: int = None, pixel_delta: int = None,
+                 threshold: float = None, max_skip: int = None):
+        self.size = size or settings.MOTION_GATE_SIZE
+        self.pixel_delta = settings.MOTION_GATE_PIXEL_DELTA if pixel_delta is None else pixel_delta
+        self.threshold = settings.MOTION_GATE_THRESHOLD if threshold is None else threshold
+        self.max_skip = settings.MOTION_GATE_MAX_SKIP if max_skip is None else max_skip
+        self._reference: Optional[np.ndarray] = None
+        self._detections: Optional[List[Dict[str, Any]]] = None
+        self._skipped = 0
+        self._pending: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        # 轻微模糊以抑制传感器噪声和压缩噪声
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def changed_fraction(self, thumbnail: np.ndarray) -> float:
+        """与参考帧相比变化像素所占比例"""
+        if self._reference is None or self._reference.shape != thumbnail.shape:
+            return 1.0
+        diff = cv2.absdiff(thumbnail, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def check(self, frame: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        """画面未变化时返回可复用的检测结果，否则返回 None（需要推理）"""
+        thumbnail = self._thumbnail(frame)
+        if (self._detections is not None and self._skipped < self.max_skip
+                and self.changed_fraction(thumbnail) < self.threshold):
+            self._skipped += 1
+            self.hits += 1
+            gate_checks.inc(result="hit")
+            return self._detections
+
+        self._pending = thumbnail
+        self.misses += 1
+        gate_checks.inc(result="miss")
+        return None
+
+    def commit(self, detections: List[Dict[str, Any]]):
+        """记录刚刚推理的帧及其检测结果，作为之后比较的参考"""
+        if self._pending is not None:
+            self._reference = self._pending
+            self._pending = None
+        self._detections = detections
+        self._skipped = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
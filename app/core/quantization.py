@@ -0,0 +1,283 @@
+import os
+import re
+import time
+import hashlib
+import argparse
+from typing import Any, Dict, Iterator, List, Optional
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from app.core.config import settings
+from app.core.backends import export_model, list_images
+from app.core.tracker import iou_matrix
+
+
+QUANT_MODES = ("dynamic", "static")
+
+
+def calibration_digest(images: List[str]) -> str:
+    """校准图片列表的摘要（路径、大小、修改时间），校准集变化后不再复用旧的量化模型"""
+    digest = hashlib.sha256()
+    for path in images:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def quantized_model_path(weights: str, mode: str, calibration: str = None) -> str:
+    """量化模型的缓存路径，与权重文件放在同一目录；静态量化的文件名带校准集摘要"""
+    if mode not in QUANT_MODES:
+        raise ValueError(f"不支持的量化模式: {mode}")
+    suffix = f".int8-{mode}-{calibration}" if calibration else f".int8-{mode}"
+    return os.path.splitext(weights)[0] + suffix + ".onnx"
+
+
+def _read_image(path: str) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _calibration_inputs(images: List[str], imgsz: int) -> Iterator[np.ndarray]:
+    """按 ultralytics 的前处理（letterbox、BGR→RGB、归一化）生成校准输入"""
+    from ultralytics.data.augment import LetterBox
+
+    letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False, stride=32)
+    for path in images:
+        image = _read_image(path)
+        if image is None:
+            continue
+        image = letterbox(image=image)
+        tensor = image[..., ::-1].transpose(2, 0, 1)[None]
+        yield np.ascontiguousarray(tensor, dtype=np.float32) / 255.0
+
+
+def _head_nodes(model) -> List[str]:
+    """检测头的节点名称；检测头负责框解码，量化后误差最大，保持 FP32"""
+    pattern = re.compile(r"^/model\.(\d+)/")
+    indices = [int(m.group(1)) for node in model.graph.node for m in [pattern.match(node.name)] if m]
+    if not indices:
+        return []
+    prefix = f"/model.{max(indices)}/"
+    return [node.name for node in model.graph.node if node.name.startswith(prefix)]
+
+
+def quantize_model(weights: str = None, mode: str = None, calibration_dir: str = None,
+                   force: bool = False) -> str:
+    """导出 ONNX 并做 INT8 量化，结果缓存在权重文件旁
+
+    导出时 ultralytics 已将 Conv+BN 融合，量化前再用 ONNX Runtime 的预处理
+    做图优化和形状推断。dynamic 只量化权重，static 使用校准图片统计激活范围。
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    weights = weights or settings.MODEL_PATH
+    mode = mode or settings.QUANTIZATION
+    images = []
+    if mode == "static":
+        images = list_images(calibration_dir or settings.CALIBRATION_DIR)[:settings.CALIBRATION_MAX_IMAGES]
+        if not images:
+            raise ValueError("静态量化需要校准图片，请检查 CALIBRATION_DIR")
+    target = quantized_model_path(weights, mode, calibration_digest(images) if images else None)
+    fp32_path = export_model(weights, "onnx")
+    if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(fp32_path):
+        return target
+
+    prepared = target + ".prep.onnx"
+    quant_pre_process(fp32_path, prepared)
+    fp32_model = onnx.load(fp32_path)
+    exclude = _head_nodes(fp32_model)
+
+    try:
+        if mode == "dynamic":
+            quantize_dynamic(prepared, target, weight_type=QuantType.QUInt8, nodes_to_exclude=exclude)
+        else:
+            input_name = fp32_model.graph.input[0].name
+
+            class ImageReader(CalibrationDataReader):
+                def __init__(self):
+                    self._inputs = _calibration_inputs(images, settings.EXPORT_IMAGE_SIZE)
+
+                def get_next(self):
+                    tensor = next(self._inputs, None)
+                    return None if tensor is None else {input_name: tensor}
+
+            quantize_static(prepared, target, ImageReader(),
+                            quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8,
+                            per_channel=True,
+                            nodes_to_exclude=exclude)
+    finally:
+        if os.path.exists(prepared):
+            os.remove(prepared)
+
+    # 保留 ultralytics 写入的元数据（类别名、输入尺寸等），加载时依赖这些信息
+    quantized = onnx.load(target)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(quantized, target)
+    return target
+
+
+def _load_labels(image_path: str, shape, names: Dict[int, str]) -> Optional[List[Dict[str, Any]]]:
+    """读取 YOLO 格式标注（同名 .txt 或同级 labels 目录），没有标注时返回 None"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    folder = os.path.dirname(image_path)
+    for candidate in (os.path.join(folder, stem + ".txt"),
+                      os.path.join(os.path.dirname(folder), "labels", stem + ".txt")):
+        if os.path.exists(candidate):
+            break
+    else:
+        return None
+
+    height, width = shape[:2]
+    labels = []
+    with open(candidate, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, cx, cy, w, h = int(parts[0]), *map(float, parts[1:5])
+            labels.append({
+                "class_name": names.get(cls, str(cls)),
+                "bbox": [(cx - w / 2) * width, (cy - h / 2) * height,
+                         (cx + w / 2) * width, (cy + h / 2) * height],
+            })
+    return labels
+
+
+def mean_average_precision(predictions: List[List[Dict[str, Any]]],
+                           ground_truths: List[List[Dict[str, Any]]], iou_threshold: float = 0.5) -> float:
+    """按类别计算 AP（全点插值）后取平均"""
+    classes = {d["class_name"] for gts in ground_truths for d in gts}
+    if not classes:
+        return 0.0
+
+    aps = []
+    for class_name in sorted(classes):
+        records = []
+        total = 0
+        for image_index, (preds, gts) in enumerate(zip(predictions, ground_truths)):
+            gt_boxes = np.array([g["bbox"] for g in gts if g["class_name"] == class_name]).reshape(-1, 4)
+            total += len(gt_boxes)
+            preds = sorted((p for p in preds if p["class_name"] == class_name), key=lambda p: -p["confidence"])
+            matched = set()
+            if preds:
+                ious = iou_matrix(np.array([p["bbox"] for p in preds]).reshape(-1, 4), gt_boxes)
+            for i, pred in enumerate(preds):
+                hit = False
+                if len(gt_boxes):
+                    j = int(np.argmax(ious[i]))
+                    if ious[i, j] >= iou_threshold and j not in matched:
+                        matched.add(j)
+                        hit = True
+                records.append((pred["confidence"], hit))
+        if total == 0:
+            continue
+
+        records.sort(key=lambda r: -r[0])
+        tp = np.cumsum([r[1] for r in records], dtype=np.float64)
+        fp = np.cumsum([not r[1] for r in records], dtype=np.float64)
+        recall = tp / total if len(records) else np.zeros(0)
+        precision = tp / np.maximum(tp + fp, 1e-9) if len(records) else np.zeros(0)
+
+        mrec = np.concatenate(([0.0], recall, [1.0]))
+        mpre = np.concatenate(([1.0], precision, [0.0]))
+        mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+        steps = np.where(mrec[1:] != mrec[:-1])[0]
+        aps.append(float(np.sum((mrec[steps + 1] - mrec[steps]) * mpre[steps + 1])))
+    return float(np.mean(aps)) if aps else 0.0
+
+
+def _run(model: YOLO, images: List[np.ndarray], warmup: int = 3) -> Dict[str, Any]:
+    """逐张推理，返回检测结果和延迟统计"""
+    options = dict(conf=settings.CONFIDENCE_THRESHOLD, iou=settings.IOU_THRESHOLD, device="cpu", verbose=False)
+    for image in images[:warmup]:
+        model.predict(source=image, **options)
+
+    latencies = []
+    predictions = []
+    for image in images:
+        start = time.perf_counter()
+        results = model.predict(source=image, **options)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        predictions.append([
+            {"class_name": results.names[int(c)], "confidence": float(s), "bbox": b}
+            for b, c, s in zip(results.boxes.xyxy.tolist(), results.boxes.cls.tolist(), results.boxes.conf.tolist())
+        ])
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "predictions": predictions,
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+        },
+    }
+
+
+def compare_report(weights: str = None, mode: str = None, calibration_dir: str = None) -> Dict[str, Any]:
+    """在校准图片上对比 FP32 与 INT8 模型的 mAP@0.5 和延迟
+
+    图片带有 YOLO 格式标注时以标注为真值；否则以 FP32 模型的输出为参考，
+    此时 INT8 的 mAP 表示与 FP32 结果的一致程度。
+    """
+    weights = weights or settings.MODEL_PATH
+    mode = mode or (settings.QUANTIZATION if settings.QUANTIZATION in QUANT_MODES else "static")
+    paths = list_images(calibration_dir or settings.CALIBRATION_DIR)[:settings.CALIBRATION_MAX_IMAGES]
+    images = [img for img in (_read_image(p) for p in paths) if img is not None]
+    if not images:
+        raise ValueError("没有可用于评估的图片")
+
+    fp32 = YOLO(weights)
+    int8 = YOLO(quantize_model(weights, mode, calibration_dir), task="detect")
+    fp32_run = _run(fp32, images)
+    int8_run = _run(int8, images)
+
+    labels = [_load_labels(p, img.shape, fp32.names) for p, img in zip(paths, images)]
+    report = {
+        "mode": mode,
+        "images": len(images),
+        "latency_ms": {"fp32": fp32_run["latency_ms"], "int8": int8_run["latency_ms"]},
+        "speedup": fp32_run["latency_ms"]["mean"] / max(int8_run["latency_ms"]["mean"], 1e-9),
+    }
+    if all(l is not None for l in labels):
+        report["reference"] = "labels"
+        report["map50"] = {
+            "fp32": mean_average_precision(fp32_run["predictions"], labels),
+            "int8": mean_average_precision(int8_run["predictions"], labels),
+        }
+    else:
+        report["reference"] = "fp32"
+        report["map50"] = {
+            "fp32": 1.0,
+            "int8": mean_average_precision(int8_run["predictions"], fp32_run["predictions"]),
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="INT8 量化并对比 FP32 / INT8 的精度与延迟")
+    parser.add_argument("--mode", choices=QUANT_MODES, default="static")
+    parser.add_argument("--weights", default=settings.MODEL_PATH)
+    parser.add_argument("--calibration-dir", default=settings.CALIBRATION_DIR)
+    parser.add_argument("--force", action="store_true", help="忽略缓存重新量化")
+    parser.add_argument("--report", action="store_true", help="量化后输出对比报告")
+    args = parser.parse_args(argv)
+
+    path = quantize_model(args.weights, args.mode, args.calibration_dir, force=args.force)
+    print(f"量化完成: {path}")
+    if args.report:
+        report = compare_report(args.weights, args.mode, args.calibration_dir)
+        latency = report["latency_ms"]
+        print(f"参考: {report['reference']}，图片数 {report['images']}")
+        print(f"mAP@0.5  FP32 {report['map50']['fp32']:.4f}  INT8 {report['map50']['int8']:.4f}")
+        print(f"延迟(ms) FP32 {latency['fp32']['mean']:.2f} (p95 {latency['fp32']['p95']:.2f})  "
+              f"INT8 {latency['int8']['mean']:.2f} (p95 {latency['int8']['p95']:.2f})  "
+              f"加速 {report['speedup']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import itertools
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import registry
+
+rate_control_changes = registry.counter(
+    "rate_control_changes_total", "实时会话输出档位的调整次数", ("direction",)
+)
+
+
+class OutputParams(NamedTuple):
+    """单帧标注图像的输出参数"""
+    render: bool  # 本帧是否发送标注图像，检测结果总是发送
+    quality: int
+    scale: float
+    max_size: Optional[Tuple[int, int]]  # 客户端显示尺寸（宽, 高），输出不超过该尺寸
+
+    def encode_options(self) -> Dict[str, Any]:
+        return {"quality": self.quality, "scale": self.scale, "max_size": self.max_size}
+
+
+class StreamRateController:
+    """按会话自适应调整标注图像的编码质量、分辨率和发送帧率
+
+    服务端定期发出 ping，客户端回 pong 得到 RTT；每次发送在 send 上阻塞的时间反映
+    发送缓冲区是否在积压（缓冲区超过高水位后 send 要等待排空）。RTT 的 p90 超过目标
+    或发送阻塞明显时降一档（更低的质量、更小的尺寸、隔几帧才发一次图像），两者都
+    明显低于阈值时升一档。与 LoadController 一样，两次调整之间有冷却时间。
+    不回 pong 的客户端只按发送阻塞调整。
+    """
+
+    def __init__(self, display_size: Tuple[int, int] = None, qualities: List[int] = None,
+                 scales: List[float] = None, frame_intervals: List[int] = None,
+                 target_rtt_ms: float = None, send_high_ms: float = None, window: int = None,
+                 cooldown: float = None, enabled: bool = None):
+        self.qualities = list(qualities or settings.RATE_CONTROL_QUALITIES)
+        # 缩放比例和帧间隔列表短于质量档位时沿用最后一个值
+        scales = list(scales or settings.RATE_CONTROL_SCALES)
+        intervals = list(frame_intervals or settings.RATE_CONTROL_FRAME_INTERVALS)
+        self.scales = [scales[min(i, len(scales) - 1)] for i in range(len(self.qualities))]
+        self.frame_intervals = [max(1, intervals[min(i, len(intervals) - 1)]) for i in range(len(self.qualities))]
+        self.target_rtt_ms = target_rtt_ms or settings.RATE_CONTROL_TARGET_RTT_MS
+        self.send_high_ms = send_high_ms or settings.RATE_CONTROL_SEND_HIGH_MS
+        self.cooldown = settings.RATE_CONTROL_COOLDOWN_S if cooldown is None else cooldown
+        self.enabled = settings.RATE_CONTROL_ENABLED if enabled is None else enabled
+        window = window or settings.RATE_CONTROL_WINDOW
+        self._rtts = deque(maxlen=window)
+        self._sends = deque(maxlen=window)
+        self._pings: Dict[int, float] = {}
+        self._ping_ids = itertools.count(1)
+        self._last_ping = 0.0
+        self._last_change = time.monotonic()
+        self._frames = 0
+        self.display_size: Optional[Tuple[int, int]] = None
+        self.level = 0
+        self.changes = 0
+        if display_size:
+            self.set_display_size(*display_size)
+
+    def set_display_size(self, width: Optional[int], height: Optional[int]):
+        """客户端声明的显示尺寸，0 或 None 表示该方向不限制"""
+        width, height = int(width or 0), int(height or 0)
+        self.display_size = (max(width, 0), max(height, 0)) if width > 0 or height > 0 else None
+
+    def ping(self) -> Optional[int]:
+        """到了发送 ping 的时间时返回 ping 编号，否则返回 None"""
+        now = time.monotonic()
+        if not self.enabled or now - self._last_ping < settings.RATE_CONTROL_PING_INTERVAL_S:
+            return None
+        self._last_ping = now
+        # 客户端不回 pong 时不让未完成的 ping 无限累积
+        if len(self._pings) >= 16:
+            self._pings.clear()
+        ping_id = next(self._ping_ids)
+        self._pings[ping_id] = now
+        return ping_id
+
+    def pong(self, ping_id: Any):
+        sent = self._pings.pop(ping_id, None) if isinstance(ping_id, int) else None
+        if sent is not None:
+            self._rtts.append((time.monotonic() - sent) * 1000.0)
+            self._adjust()
+
+    def observe_send(self, seconds: float):
+        """记录一次发送在 send 上阻塞的时间"""
+        self._sends.append(seconds * 1000.0)
+        self._adjust()
+
+    def next_frame(self) -> OutputParams:
+        """取下一帧的输出参数"""
+        self._frames += 1
+        return OutputParams(
+            render=(self._frames - 1) % self.frame_intervals[self.level] == 0,
+            quality=self.qualities[self.level],
+            scale=self.scales[self.level],
+            max_size=self.display_size,
+        )
+
+    def _adjust(self):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_change < self.cooldown or len(self._sends) < 3:
+            return
+        rtt_p90 = float(np.percentile(self._rtts, 90)) if self._rtts else None
+        send_mean = float(np.mean(self._sends))
+
+        congested = send_mean > self.send_high_ms or (rtt_p90 is not None and rtt_p90 > self.target_rtt_ms)
+        idle = send_mean < self.send_high_ms / 4 and (rtt_p90 is None or rtt_p90 < self.target_rtt_ms / 2)
+        if congested and self.level < len(self.qualities) - 1:
+            self.level += 1
+            rate_control_changes.inc(direction="down")
+        elif idle and self.level > 0:
+            self.level -= 1
+            rate_control_changes.inc(direction="up")
+        else:
+            return
+        # 档位变化后旧的样本不再有参考价值
+        self._rtts.clear()
+        self._sends.clear()
+        self._last_change = now
+        self.changes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "quality": self.qualities[self.level],
+            "scale": self.scales[self.level],
+            "frame_interval": self.frame_intervals[self.level],
+            "display_size": self.display_size,
+            "rtt_p90_ms": float(np.percentile(self._rtts, 90)) if self._rtts else None,
+            "changes": self.changes,
+        }
@@ -0,0 +1,86 @@
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.metrics import stage_duration, timed
+
+
+# 与 ultralytics 默认配色一致的调色板（BGR）
+_PALETTE_HEX = (
+    "FF3838", "FF9D97", "FF701F", "FFB21D", "CFD231", "48F90A", "92CC17", "3DDB86", "1A9334", "00D4BB",
+    "2C99A8", "00C2FF", "344593", "6473FF", "0018EC", "8438FF", "520085", "CB38FF", "FF95C8", "FF37C7",
+)
+PALETTE: List[Tuple[int, int, int]] = [
+    (int(h[4:6], 16), int(h[2:4], 16), int(h[0:2], 16)) for h in _PALETTE_HEX
+]
+
+# 外推（非关键帧）得到的框使用固定颜色，便于和真实检测区分
+PREDICTED_COLOR = (0, 200, 255)
+
+def class_color(class_name: str) -> Tuple[int, int, int]:
+    """按类别分配稳定的颜色
+
+    由类别名称的 CRC32 决定，与类别出现的先后顺序无关，分段处理进程、推理进程池
+    和主进程画出的同一类别颜色一致。
+    """
+    return PALETTE[zlib.crc32(class_name.encode("utf-8")) % len(PALETTE)]
+
+
+@timed(stage_duration, stage="render")
+def draw_detections(frame: np.ndarray, detections: List[Dict[str, Any]],
+                    in_place: bool = True, line_width: int = None) -> np.ndarray:
+    """直接用 OpenCV 在帧上绘制检测框和标签
+
+    只画矩形和文字，不经过 ultralytics 的 plot()；in_place 为 True 时
+    直接在传入的帧上绘制，不额外分配整帧内存。
+    """
+    annotated = frame if in_place else frame.copy()
+    height, width = annotated.shape[:2]
+    lw = line_width or max(round((height + width) / 2 * 0.003), 2)
+    font_scale = lw / 3
+    thickness = max(lw - 1, 1)
+
+    for det in detections:
+        x1, y1, x2, y2 = [int(round(v)) for v in det["bbox"]]
+        color = PREDICTED_COLOR if det.get("predicted") else class_color(det["class_name"])
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, lw, cv2.LINE_AA)
+
+        label = f'{det["class_name"]} {det["confidence"]:.2f}'
+        if det.get("track_id") is not None:
+            label = f'#{det["track_id"]} ' + label
+        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        outside = y1 - th - 3 >= 0
+        ty2 = y1 - th - 3 if outside else y1 + th + 3
+        cv2.rectangle(annotated, (x1, y1), (x1 + tw, ty2), color, -1, cv2.LINE_AA)
+        cv2.putText(annotated, label, (x1, y1 - 2 if outside else y1 + th + 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+    return annotated
+
+
+def encode_image(frame: np.ndarray, image_format: str = ".jpg", quality: int = None, scale: float = 1.0,
+                 max_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """按质量和尺寸编码图像，返回编码后的字节缓冲区
+
+    scale 为缩放比例，max_size 为（宽, 高）上限（0 表示该方向不限制），取两者中更小的结果，
+    只缩小不放大；quality 为 None 时使用 OpenCV 的默认质量。
+    """
+    height, width = frame.shape[:2]
+    factor = min(scale or 1.0, 1.0)
+    if max_size:
+        if max_size[0]:
+            factor = min(factor, max_size[0] / width)
+        if max_size[1]:
+            factor = min(factor, max_size[1] / height)
+    if factor < 1.0:
+        with stage_duration.time(stage="resize"):
+            frame = cv2.resize(frame, (max(1, round(width * factor)), max(1, round(height * factor))),
+                               interpolation=cv2.INTER_AREA)
+    params = []
+    if quality is not None:
+        flag = cv2.IMWRITE_WEBP_QUALITY if image_format == ".webp" else cv2.IMWRITE_JPEG_QUALITY
+        params = [flag, int(quality)]
+    with stage_duration.time(stage="imencode"):
+        ok, buffer = cv2.imencode(image_format, frame, params)
+    if not ok:
+        raise ValueError(f"图像编码失败: {image_format}")
+    return buffer
@@ -0,0 +1,160 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+cache_requests = registry.counter(
+    "result_cache_requests_total", "图片检测结果缓存的查询次数", ("result",)
+)
+
+
+def make_cache_key(image_bytes: bytes, signature: str) -> str:
+    """图片内容哈希 + 模型版本与检测参数组成的缓存键"""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b"\0")
+    digest.update(signature.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """图片检测结果的两级缓存
+
+    内存层为 LRU；磁盘层在 UPLOAD_DIR 下保存检测结果 JSON 和标注图片，
+    总大小超过上限时按最近访问时间淘汰。命中时返回的 result_image 指向
+    缓存目录中的标注图片，仍可通过 /uploads 访问。
+    """
+
+    def __init__(self, cache_dir: str = None, memory_entries: int = None, disk_max_bytes: int = None):
+        self.relative_dir = cache_dir or settings.RESULT_CACHE_DIR
+        self.cache_dir = os.path.join(settings.UPLOAD_DIR, self.relative_dir)
+        self.memory_entries = memory_entries or settings.RESULT_CACHE_MEMORY_ENTRIES
+        self.disk_max_bytes = disk_max_bytes or settings.RESULT_CACHE_DISK_MAX_MB * 1024 * 1024
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_bytes = self._scan_disk()
+
+        registry.gauge("result_cache_memory_entries", "内存缓存条目数").set_function(lambda: len(self._memory))
+        registry.gauge("result_cache_disk_bytes", "磁盘缓存占用字节数").set_function(lambda: self._disk_bytes)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (os.path.join(self.cache_dir, key + ".json"),
+                os.path.join(self.cache_dir, key + ".jpg"))
+
+    def _scan_disk(self) -> int:
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            try:
+                total += os.path.getsize(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+        return total
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, require_image: bool = True) -> Tuple[Optional[Dict[str, Any]], str]:
+        """查询缓存，返回 (结果, 命中层级)，层级为 memory / disk / miss
+
+        require_image 为 True 时，只有检测结果而没有标注图片的条目视为未命中。
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+        if value is not None and (value["result_image"] or not require_image):
+            cache_requests.inc(result="memory")
+            return value, "memory"
+
+        json_path, image_path = self._paths(key)
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            if value["result_image"] and not os.path.exists(image_path):
+                raise FileNotFoundError(image_path)
+            if require_image and not value["result_image"]:
+                raise FileNotFoundError(image_path)
+            # 更新访问时间，供淘汰策略使用
+            os.utime(json_path, None)
+        except (OSError, ValueError):
+            cache_requests.inc(result="miss")
+            return None, "miss"
+
+        self._remember(key, value)
+        cache_requests.inc(result="disk")
+        return value, "disk"
+
+    def put(self, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """写入缓存，返回指向缓存目录中标注图片的结果"""
+        json_path, image_path = self._paths(key)
+        value = {"detections": result["detections"], "result_image": None}
+        replace_image = bool(result.get("result_image"))
+        # 覆盖已有条目时先扣掉旧文件的大小
+        old_bytes = 0
+        for path in (json_path, image_path) if replace_image else (json_path,):
+            try:
+                old_bytes += os.path.getsize(path)
+            except OSError:
+                continue
+
+        if replace_image:
+            source = os.path.join(settings.UPLOAD_DIR, result["result_image"])
+            # 复制而不是硬链接：results/ 下的文件按上传文件名命名，同名上传会原地重写同一个 inode
+            tmp_image = image_path + ".tmp"
+            shutil.copyfile(source, tmp_image)
+            os.replace(tmp_image, image_path)
+            value["result_image"] = os.path.join(self.relative_dir, key + ".jpg").replace("\\", "/")
+        elif os.path.exists(image_path):
+            # 已有带图片的条目时保留图片
+            value["result_image"] = os.path.join(self.relative_dir, key + ".jpg").replace("\\", "/")
+
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+
+        with self._lock:
+            self._disk_bytes += os.path.getsize(json_path) - old_bytes
+            if replace_image:
+                self._disk_bytes += os.path.getsize(image_path)
+        self._remember(key, value)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict()
+        return value
+
+    def _evict(self):
+        """淘汰最久未访问的磁盘条目，直到占用降到上限的 90%"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), name[:-5]))
+                except OSError:
+                    continue
+        entries.sort()
+
+        target = self.disk_max_bytes * 0.9
+        for _, key in entries:
+            if self._disk_bytes <= target:
+                break
+            freed = 0
+            for path in self._paths(key):
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+            with self._lock:
+                self._disk_bytes -= freed
+                self._memory.pop(key, None)
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+
+def make_tiles(width: int, height: int, tile_size: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """把图像切成相互重叠的切片，返回各切片的 (x1, y1, x2, y2)
+
+    最后一行/列的切片向内对齐到图像边缘，保证每个切片都是完整尺寸。
+    """
+    tile_size = max(32, int(tile_size))
+    overlap = min(max(float(overlap), 0.0), 0.9)
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    tiles = []
+    for y in starts(height):
+        for x in starts(width):
+            tiles.append((x, y, min(x + tile_size, width), min(y + tile_size, height)))
+    return tiles
+
+
+def _pairwise(boxes: np.ndarray, box: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """返回 box 与 boxes 的交集面积及各自面积"""
+    lt = np.maximum(boxes[:, :2], box[:2])
+    rb = np.minimum(boxes[:, 2:], box[2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=1)
+    areas = (boxes[:, 2:] - boxes[:, :2]).prod(axis=1)
+    area = (box[2:] - box[:2]).prod()
+    return inter, areas, area
+
+
+def _overlap(boxes: np.ndarray, box: np.ndarray, metric: str) -> np.ndarray:
+    inter, areas, area = _pairwise(boxes, box)
+    if metric == "ios":
+        # 交集 / 较小框面积：切片边缘被截断的半个框也能与完整框匹配
+        return inter / (np.minimum(areas, area) + 1e-9)
+    return inter / (areas + area - inter + 1e-9)
+
+
+def merge_detections(detections: List[Dict[str, Any]], strategy: str = "nms",
+                     iou_threshold: float = 0.5) -> List[Dict[str, Any]]:
+    """按类别合并跨切片的重复检测
+
+    nms：IoU 超过阈值的框只保留置信度最高的一个；
+    nmm：交集/较小框面积超过阈值的框合并为外接框，置信度取最大值，
+    适合目标被切片边界切开的情况。
+    """
+    if strategy not in ("nms", "nmm"):
+        raise ValueError(f"不支持的合并策略: {strategy}")
+
+    merged = []
+    by_class: Dict[str, List[Dict[str, Any]]] = {}
+    for det in detections:
+        by_class.setdefault(det["class_name"], []).append(det)
+
+    for class_name, dets in by_class.items():
+        boxes = np.array([d["bbox"] for d in dets], dtype=np.float64)
+        scores = np.array([d["confidence"] for d in dets], dtype=np.float64)
+        order = np.argsort(-scores)
+        while order.size:
+            best = order[0]
+            rest = order[1:]
+            if strategy == "nms":
+                overlap = _overlap(boxes[rest], boxes[best], "iou")
+                group = rest[overlap >= iou_threshold]
+                box = boxes[best]
+            else:
+                overlap = _overlap(boxes[rest], boxes[best], "ios")
+                group = rest[overlap >= iou_threshold]
+                members = np.concatenate(([best], group))
+                box = np.concatenate((boxes[members, :2].min(axis=0), boxes[members, 2:].max(axis=0)))
+            merged.append({
+                "class_name": class_name,
+                "confidence": float(scores[best]),
+                "bbox": [float(v) for v in box],
+            })
+            order = rest[~np.isin(rest, group)]
+
+    merged.sort(key=lambda d: -d["confidence"])
+    return merged
+
+
+def offset_detections(detections: List[Dict[str, Any]], dx: int, dy: int) -> List[Dict[str, Any]]:
+    """把切片坐标系下的检测框平移回原图坐标"""
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        det["bbox"] = [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+    return detections
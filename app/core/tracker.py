@@ -0,0 +1,262 @@
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def _xyxy_to_cxcywh(box) -> np.ndarray:
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+
+def _cxcywh_to_xyxy(state) -> List[float]:
+    cx, cy, w, h = state[:4]
+    w, h = max(float(w), 1.0), max(float(h), 1.0)
+    return [float(cx - w / 2), float(cy - h / 2), float(cx + w / 2), float(cy + h / 2)]
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """计算两组 xyxy 框的 IoU 矩阵"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float64)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _greedy_match(iou: np.ndarray, threshold: float) -> Tuple[List[Tuple[int, int]], List[int], List[int]]:
+    """按 IoU 从大到小贪心匹配，返回 (匹配对, 未匹配行, 未匹配列)"""
+    matches = []
+    if iou.size:
+        rows, cols = np.unravel_index(np.argsort(-iou, axis=None), iou.shape)
+        used_r, used_c = set(), set()
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            if iou[r, c] < threshold:
+                break
+            if r in used_r or c in used_c:
+                continue
+            used_r.add(r)
+            used_c.add(c)
+            matches.append((r, c))
+    matched_r = {r for r, _ in matches}
+    matched_c = {c for _, c in matches}
+    return (matches,
+            [r for r in range(iou.shape[0]) if r not in matched_r],
+            [c for c in range(iou.shape[1]) if c not in matched_c])
+
+
+class _KalmanBox:
+    """匀速模型的卡尔曼滤波，状态为 (cx, cy, w, h) 及其速度"""
+
+    _F = np.eye(8)
+    _F[:4, 4:] = np.eye(4)
+    _H = np.eye(4, 8)
+
+    def __init__(self, box):
+        self.x = np.zeros(8)
+        self.x[:4] = _xyxy_to_cxcywh(box)
+        scale = max(self.x[2], self.x[3])
+        self.P = np.diag([scale, scale, scale, scale, 10 * scale, 10 * scale, 10 * scale, 10 * scale]) ** 2 / 100
+        self._q = 1.0 / 20
+        self._r = 1.0 / 20
+
+    def predict(self):
+        scale = max(self.x[2], self.x[3], 1.0)
+        Q = np.diag([self._q * scale] * 4 + [self._q * scale / 8] * 4) ** 2
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + Q
+
+    def update(self, box):
+        z = _xyxy_to_cxcywh(box)
+        scale = max(z[2], z[3], 1.0)
+        R = np.diag([self._r * scale] * 4) ** 2
+        S = self._H @ self.P @ self._H.T + R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self._H @ self.x)
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+    @property
+    def box(self) -> List[float]:
+        return _cxcywh_to_xyxy(self.x)
+
+
+# 轨迹状态：上个关键帧匹配到检测框的为 tracked，未匹配到的为 lost（保留 max_age 帧以便重新匹配）
+TRACKED = "tracked"
+LOST = "lost"
+
+
+class _Track:
+    def __init__(self, track_id: int, detection: Dict[str, Any]):
+        self.track_id = track_id
+        self.state = TRACKED
+        self.kalman = _KalmanBox(detection["bbox"])
+        self.class_name = detection["class_name"]
+        self.confidence = detection["confidence"]
+        self.hits = 1
+        self.time_since_update = 0
+
+    def to_detection(self, predicted: bool) -> Dict[str, Any]:
+        return {
+            "class_name": self.class_name,
+            "confidence": float(self.confidence),
+            "bbox": self.kalman.box,
+            "track_id": self.track_id,
+            "predicted": predicted,
+        }
+
+
+class ByteTracker:
+    """ByteTrack 风格的多目标跟踪器
+
+    关键帧上先用高置信度检测框与轨迹做 IoU 匹配，剩余轨迹再与低置信度框
+    匹配，以便在遮挡或模糊时保住轨迹；非关键帧只做卡尔曼外推。
+    """
+
+    def __init__(self, high_threshold: float = 0.5, match_iou: float = 0.3,
+                 max_age: int = 30, min_hits: int = 1, first_id: int = 1):
+        self.high_threshold = high_threshold
+        self.match_iou = match_iou
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self._tracks: List[_Track] = []
+        self._ids = itertools.count(first_id)
+        self.last_new_tracks = 0
+        self.last_lost_tracks = 0
+
+    def _associate(self, tracks: List[_Track], detections: List[Dict[str, Any]]):
+        boxes_t = np.array([t.kalman.box for t in tracks], dtype=np.float64).reshape(-1, 4)
+        boxes_d = np.array([d["bbox"] for d in detections], dtype=np.float64).reshape(-1, 4)
+        iou = iou_matrix(boxes_t, boxes_d)
+        # 不同类别之间不允许匹配
+        for i, track in enumerate(tracks):
+            for j, detection in enumerate(detections):
+                if track.class_name != detection["class_name"]:
+                    iou[i, j] = 0
+        return _greedy_match(iou, self.match_iou)
+
+    def predict(self) -> List[Dict[str, Any]]:
+        """非关键帧：外推所有轨迹的位置，只输出上个关键帧匹配到的轨迹
+
+        已丢失的轨迹继续外推以便在后续关键帧重新匹配，但不再输出，
+        否则离开画面的目标会在非关键帧上反复出现。
+        """
+        for track in self._tracks:
+            track.kalman.predict()
+            track.time_since_update += 1
+        self._tracks = [t for t in self._tracks if t.time_since_update <= self.max_age]
+        return [t.to_detection(predicted=True) for t in self._tracks
+                if t.state == TRACKED and t.hits >= self.min_hits]
+
+    def update(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """关键帧：用检测结果更新轨迹，返回带 track_id 的检测结果"""
+        for track in self._tracks:
+            track.kalman.predict()
+            track.time_since_update += 1
+
+        high = [d for d in detections if d["confidence"] >= self.high_threshold]
+        low = [d for d in detections if d["confidence"] < self.high_threshold]
+
+        output = []
+        matches, unmatched_tracks, unmatched_high = self._associate(self._tracks, high)
+        for ti, di in matches:
+            self._apply(self._tracks[ti], high[di], output)
+
+        remaining = [self._tracks[i] for i in unmatched_tracks]
+        matches_low, unmatched_remaining, _ = self._associate(remaining, low)
+        for ti, di in matches_low:
+            self._apply(remaining[ti], low[di], output)
+
+        # 未匹配的高置信度框创建新轨迹
+        self.last_new_tracks = len(unmatched_high)
+        for di in unmatched_high:
+            track = _Track(next(self._ids), high[di])
+            self._tracks.append(track)
+            if track.hits >= self.min_hits:
+                output.append(dict(high[di], track_id=track.track_id, predicted=False))
+
+        # 只在从 tracked 变为 lost 时计一次丢失，已丢失的轨迹在之后的关键帧上不重复计数
+        self.last_lost_tracks = 0
+        for i in unmatched_remaining:
+            track = remaining[i]
+            if track.state == TRACKED:
+                track.state = LOST
+                self.last_lost_tracks += 1
+        self._tracks = [t for t in self._tracks if t.time_since_update <= self.max_age]
+        return output
+
+    def _apply(self, track: _Track, detection: Dict[str, Any], output: List[Dict[str, Any]]):
+        track.kalman.update(detection["bbox"])
+        track.confidence = detection["confidence"]
+        track.hits += 1
+        track.time_since_update = 0
+        track.state = TRACKED
+        if track.hits >= self.min_hits:
+            output.append(dict(detection, track_id=track.track_id, predicted=False))
+
+    def reset(self):
+        self._tracks = []
+
+
+class TrackedStream:
+    """关键帧检测 + 中间帧跟踪
+
+    只在关键帧调用检测器，其他帧由跟踪器外推。启用自适应时，场景中出现
+    新目标或丢失目标就缩短关键帧间隔，画面稳定时逐步拉长。
+    """
+
+    def __init__(self, detect: Callable[[np.ndarray], Any],
+                 interval: int = 5, adaptive: bool = True,
+                 min_interval: int = 1, max_interval: int = 10,
+                 tracker: Optional[ByteTracker] = None,
+                 interval_floor: Optional[Callable[[], int]] = None):
+        self.detect = detect
+        # 外部给出的最小关键帧间隔（例如负载控制器在过载时拉长间隔）
+        self.interval_floor = interval_floor
+        self.last_imgsz = None
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.adaptive = adaptive
+        self.tracker = tracker or ByteTracker()
+        self._since_keyframe = None
+        self.frames = 0
+        self.keyframes = 0
+
+    def _adapt(self):
+        if not self.adaptive:
+            return
+        if self.tracker.last_new_tracks or self.tracker.last_lost_tracks:
+            self.interval = max(self.min_interval, self.interval // 2)
+        else:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def step(self, frame: np.ndarray) -> Tuple[List[Dict[str, Any]], bool]:
+        """处理一帧，返回 (检测结果, 是否为关键帧)"""
+        self.frames += 1
+        interval = self.interval
+        if self.interval_floor is not None:
+            interval = max(interval, self.interval_floor())
+        if self._since_keyframe is None or self._since_keyframe + 1 >= interval:
+            output = self.detect(frame)
+            # 检测函数也可以返回带推理尺寸的字典
+            if isinstance(output, dict):
+                self.last_imgsz = output.get("imgsz")
+                output = output["detections"]
+            detections = self.tracker.update(output)
+            self._since_keyframe = 0
+            self.keyframes += 1
+            self._adapt()
+            return detections, True
+
+        self._since_keyframe += 1
+        return self.tracker.predict(), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "interval": self.interval,
+            "inference_ratio": self.keyframes / self.frames if self.frames else 0.0,
+        }
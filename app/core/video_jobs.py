@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+import cv2
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.video_pipeline import DetectionLogWriter
+from app.core.video_segments import SegmentCapture, concat_logs, concat_videos
+
+
+class JobCancelled(Exception):
+    """任务在处理过程中被取消"""
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS video_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    output_path TEXT,
+    parts TEXT NOT NULL DEFAULT '[]',
+    checkpoint_frame INTEGER NOT NULL DEFAULT 0,
+    total_frames INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_video_jobs_status ON video_jobs (status, created_at);
+"""
+
+# 已结束的状态，不会再被调度
+FINAL_STATES = ("completed", "failed", "cancelled")
+# 旧版本数据库中没有的列，打开时补上
+_ADDED_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+
+
+class VideoJobQueue:
+    """持久化的视频检测任务队列
+
+    任务记录保存在本地 SQLite 中，固定数量的工作线程按提交顺序领取任务，
+    同时处理的视频数有上限，不会因并发上传而争抢模型和 CPU。视频按
+    VIDEO_JOB_CHECKPOINT_FRAMES 帧一段处理，每段写成独立的分段文件并记录
+    检查点；服务重启后，未完成的任务从最后一个检查点继续，结束时按顺序拼接。
+
+    多个进程（例如 uvicorn 多 worker）可以共用同一个数据库：领取任务时记录所属进程，
+    运行期间定期刷新心跳，只有心跳过期的任务（所属进程已退出）才会被重新排队。
+    """
+
+    def __init__(self, detector, db_path: str = None, workers: int = None, checkpoint_frames: int = None):
+        self.detector = detector
+        self.db_path = db_path or os.path.join(settings.UPLOAD_DIR, settings.VIDEO_JOB_DB)
+        self.workers = max(1, workers or settings.VIDEO_JOB_WORKERS)
+        self.checkpoint_frames = max(1, checkpoint_frames or settings.VIDEO_JOB_CHECKPOINT_FRAMES)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(video_jobs)")}
+        for name, column_type in _ADDED_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE video_jobs ADD COLUMN {name} {column_type}")
+        # 本进程的标识：主机名 + pid + 随机后缀，pid 被复用时也不会混淆
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        # 运行中任务的实时进度和取消标记，只在内存中保存
+        self._progress: Dict[str, int] = {}
+        self._cancelled: Dict[str, threading.Event] = {}
+        self._threads: List[threading.Thread] = []
+
+        # 上次退出时仍在运行的任务重新排队，从检查点继续；其他存活进程正在运行的任务不动
+        self._requeue_stale()
+
+        jobs_gauge = registry.gauge("video_jobs", "视频检测任务数", ("status",))
+        for status in ("queued", "running"):
+            jobs_gauge.set_function(lambda status=status: self._count(status), status=status)
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"video-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="video-job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _requeue_stale(self) -> int:
+        """把心跳过期的运行中任务重新排队，返回重新排队的任务数"""
+        deadline = time.time() - settings.VIDEO_JOB_STALE_S
+        cursor = self._execute(
+            "UPDATE video_jobs SET status = 'queued', owner = NULL "
+            "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (deadline,)
+        )
+        if cursor.rowcount:
+            with self._wakeup:
+                self._wakeup.notify_all()
+        return cursor.rowcount
+
+    def _heartbeat(self):
+        """刷新本进程运行中任务的心跳，并接管心跳过期的任务；其他进程取消的任务在这里通知到工作线程"""
+        while True:
+            time.sleep(settings.VIDEO_JOB_HEARTBEAT_S)
+            try:
+                self._execute("UPDATE video_jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                              (time.time(), self.owner))
+                with self._lock:
+                    running = list(self._cancelled.items())
+                for job_id, event in running:
+                    row = self._execute("SELECT status FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+                    if row is not None and row["status"] == "cancelled":
+                        event.set()
+                self._requeue_stale()
+            except sqlite3.Error as e:
+                print(f"视频任务心跳更新失败: {e}")
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _update(self, job_id: str, when: str = None, **fields) -> bool:
+        """更新任务字段；指定 when 时只在任务仍处于该状态且属于本进程时更新，返回是否更新了记录"""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        sql, params = f"UPDATE video_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        if when is not None:
+            sql, params = sql + " AND status = ? AND owner = ?", (*params, when, self.owner)
+        return self._execute(sql, params).rowcount > 0
+
+    def _owned(self, job_id: str) -> bool:
+        row = self._execute("SELECT owner FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["owner"] == self.owner
+
+    def _count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM video_jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def submit(self, video_path: str, tracking: bool = None, render: bool = True,
+               model: str = None, job_id: str = None) -> Dict[str, Any]:
+        """提交任务，立即返回任务记录"""
+        job_id = job_id or uuid.uuid4().hex
+        options = {"tracking": tracking, "render": render, "model": model}
+        self._execute(
+            "INSERT INTO video_jobs (id, status, video_path, options, created_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, video_path, json.dumps(options), time.time())
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)
+
+    def _describe(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job.pop("parts")
+        job["processed_frames"] = self._progress.get(job["id"], job["checkpoint_frame"])
+        total = job["total_frames"]
+        job["progress"] = min(1.0, job["processed_frames"] / total) if total else None
+        if job["status"] == "completed":
+            job["progress"] = 1.0
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM video_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._describe(row) for row in rows]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """取消排队中或运行中的任务；运行中的任务在下一帧写出时停止，由其他进程运行的任务在其下次心跳后停止"""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] not in FINAL_STATES:
+                self._conn.execute("UPDATE video_jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                                   (time.time(), job_id))
+            event = self._cancelled.get(job_id)
+        if event is not None:
+            event.set()
+        return self.get(job_id)
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """领取最早排队的任务"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM video_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE video_jobs SET status = 'running', owner = ?, heartbeat_at = ?, "
+                        "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                        (self.owner, now, now, row["id"])
+                    )
+                    self._cancelled[row["id"]] = threading.Event()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row
+
+    def _work(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                with self._wakeup:
+                    self._wakeup.wait(1.0)
+                continue
+            job_id = row["id"]
+            try:
+                output_path = self._run(row)
+                # 拼接期间任务可能已被取消，此时不能覆盖为 completed
+                if not self._update(job_id, when="running", status="completed", output_path=output_path,
+                                    finished_at=time.time()) and self._owned(job_id):
+                    _remove_files([output_path])
+            except JobCancelled:
+                pass
+            except Exception as e:
+                self._update(job_id, when="running", status="failed", error=str(e), finished_at=time.time())
+            finally:
+                with self._lock:
+                    self._cancelled.pop(job_id, None)
+                self._progress.pop(job_id, None)
+
+    def _run(self, row: sqlite3.Row) -> str:
+        """处理一个任务，从检查点继续，返回结果文件路径"""
+        job_id = row["id"]
+        options = json.loads(row["options"])
+        tracking = settings.TRACKING_ENABLED if options["tracking"] is None else options["tracking"]
+        render = options["render"]
+        cancelled = self._cancelled[job_id]
+        parts: List[str] = json.loads(row["parts"])
+        frame = row["checkpoint_frame"]
+
+        cap = cv2.VideoCapture(row["video_path"])
+        if not cap.isOpened():
+            raise ValueError("无法打开视频文件")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._update(job_id, total_frames=total_frames)
+
+        ext = ".mp4" if render else ".jsonl"
+        base = os.path.join(settings.UPLOAD_DIR, "results",
+                            f"{job_id}_{os.path.splitext(os.path.basename(row['video_path']))[0]}")
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        # 检查点之前的分段必须完整保留，检查点之后残留的不完整分段会被覆盖
+        for part in parts:
+            if not os.path.exists(part):
+                raise ValueError(f"分段文件丢失: {part}")
+
+        part = None
+        stream = None
+
+        def report(done: int, _total: int):
+            if cancelled.is_set():
+                raise JobCancelled()
+            self._progress[job_id] = chunk_start + done
+
+        try:
+            with self.detector.registry.use(options["model"]) as version:
+                if tracking:
+                    # 同一次运行的各分段共用一个跟踪器，轨迹 ID 跨分段保持不变；
+                    # 从检查点恢复时跟踪状态已丢失，按已有分段数错开 ID，避免与之前的轨迹重复
+                    stream = self.detector.create_tracked_stream(
+                        model=version.key, first_track_id=len(parts) * 1_000_000 + 1)
+                while True:
+                    if cancelled.is_set():
+                        raise JobCancelled()
+                    chunk_start = frame
+                    part = f"{base}.part{len(parts):05d}{ext}"
+                    if render:
+                        out = cv2.VideoWriter(part, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                    else:
+                        out = DetectionLogWriter(part, fps, start_index=chunk_start)
+                    try:
+                        written = self.detector.run_video_pipeline(
+                            SegmentCapture(cap, chunk_start, chunk_start + self.checkpoint_frames),
+                            out, total_frames, tracking, render,
+                            model=version.key, on_progress=report, stream=stream
+                        )
+                    finally:
+                        out.release()
+                    if written == 0:
+                        os.remove(part)
+                        break
+                    # 分段写完才记录检查点，重启后从下一段开始
+                    parts.append(part)
+                    frame = chunk_start + written
+                    if not self._update(job_id, when="running", parts=json.dumps(parts), checkpoint_frame=frame):
+                        # 任务已被取消，或心跳过期后被其他进程接管
+                        raise JobCancelled()
+                    if written < self.checkpoint_frames:
+                        break
+        except Exception:
+            # 取消或失败的任务不会再从检查点继续，已完成的分段和写了一半的当前分段一并删除；
+            # 进程退出时不经过这里，分段保留下来供重启后继续。任务已被其他进程接管时分段归对方所有
+            if self._owned(job_id):
+                _remove_files(parts + ([part] if part is not None else []))
+            raise
+        finally:
+            cap.release()
+
+        output_path = base + ext
+        try:
+            if len(parts) == 1:
+                os.replace(parts[0], output_path)
+            elif render:
+                concat_videos(parts, output_path, fps, size)
+            else:
+                concat_logs(parts, output_path)
+        except Exception:
+            _remove_files([output_path])
+            raise
+        finally:
+            _remove_files(parts)
+        return output_path
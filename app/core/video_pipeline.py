@@ -0,0 +1,229 @@
+import heapq
+import json
+import queue
+import threading
+import weakref
+from typing import Any, Callable, List, Optional
+import numpy as np
+from app.core.metrics import registry, stage_duration
+
+
+# 流结束标记
+_END = object()
+
+# 正在运行的流水线，用于统计各队列中积压的帧数
+_active_pipelines: "weakref.WeakSet[VideoPipeline]" = weakref.WeakSet()
+
+
+def _queued_frames(name: str) -> int:
+    return sum(q.qsize() for q in (getattr(p, name, None) for p in list(_active_pipelines)) if q is not None)
+
+
+_queue_depth = registry.gauge("video_pipeline_queue_frames", "视频流水线各阶段队列中积压的帧数", ("queue",))
+for _name, _attr in (("decoded", "_decoded"), ("inferred", "_inferred"), ("annotated", "_annotated")):
+    _queue_depth.set_function(lambda attr=_attr: _queued_frames(attr), queue=_name)
+
+
+class DetectionLogWriter:
+    """按帧写出 NDJSON 检测日志，接口与 cv2.VideoWriter 的 write/release 一致"""
+
+    def __init__(self, path: str, fps: float, start_index: int = 0, frame_indices: List[int] = None):
+        self.path = path
+        self.fps = fps or 0.0
+        # 分段处理时从该段在整段视频中的起始帧号开始编号
+        self.frame_index = start_index
+        # 抽帧时第 k 条记录对应的源帧号，由抽帧器在解码时追加
+        self.frame_indices = frame_indices
+        self._written = 0
+        self._file = open(path, "w", encoding="utf-8")
+
+    def isOpened(self) -> bool:
+        return not self._file.closed
+
+    def write(self, detections):
+        if self.frame_indices is not None:
+            self.frame_index = self.frame_indices[self._written]
+        record = {
+            "frame_index": self.frame_index,
+            "timestamp": self.frame_index / self.fps if self.fps > 0 else None,
+            "detections": detections,
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.frame_index += 1
+        self._written += 1
+
+    def release(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class VideoPipeline:
+    """解码 → 推理 → 标注 → 写入 的多线程流水线
+
+    各阶段之间使用有界队列，下游变慢时上游会阻塞，内存占用保持恒定；
+    推理和标注可以有多个工作线程，写入线程按帧序号重排后顺序写出。
+    """
+
+    def __init__(self, infer_batch: Callable[[List[np.ndarray]], List[Any]],
+                 annotate: Callable[[np.ndarray, Any], np.ndarray],
+                 batch_size: int = 8, queue_size: int = 32,
+                 infer_workers: int = 1, annotate_workers: int = 2,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 on_result: Optional[Callable[[int, Any], None]] = None):
+        self.infer_batch = infer_batch
+        self.annotate = annotate
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+        self.infer_workers = max(1, infer_workers)
+        self.annotate_workers = max(1, annotate_workers)
+        self.on_progress = on_progress
+        # 每帧推理结果的回调（帧序号, 结果），在标注线程中调用，不保证顺序
+        self.on_result = on_result
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """带停止检查的阻塞写入，返回 False 表示流水线已中止"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """带停止检查的阻塞读取，流水线中止时返回结束标记"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _finish_stage(self, name: str, downstream: queue.Queue, consumers: int):
+        """某阶段的最后一个线程退出时，向下游每个消费者发送结束标记"""
+        with self._lock:
+            self._remaining[name] -= 1
+            last = self._remaining[name] == 0
+        if last:
+            for _ in range(consumers):
+                self._put(downstream, _END)
+
+    def _decode(self, cap):
+        try:
+            index = 0
+            while not self._stop.is_set():
+                with stage_duration.time(stage="video_decode"):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                if not self._put(self._decoded, (index, frame)):
+                    return
+                index += 1
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.infer_workers):
+                self._put(self._decoded, _END)
+
+    def _infer(self):
+        try:
+            finished = False
+            while not finished and not self._stop.is_set():
+                item = self._get(self._decoded)
+                if item is _END:
+                    break
+                batch = [item]
+                # 已经解码好的帧直接凑进同一批次
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._decoded.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+
+                with stage_duration.time(stage="video_infer"):
+                    results = self.infer_batch([frame for _, frame in batch])
+                for (index, frame), result in zip(batch, results):
+                    if not self._put(self._inferred, (index, frame, result)):
+                        return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._finish_stage("infer", self._inferred, self.annotate_workers)
+
+    def _annotate(self):
+        try:
+            while not self._stop.is_set():
+                item = self._get(self._inferred)
+                if item is _END:
+                    break
+                index, frame, result = item
+                if self.on_result is not None:
+                    self.on_result(index, result)
+                with stage_duration.time(stage="video_annotate"):
+                    annotated = self.annotate(frame, result)
+                if not self._put(self._annotated, (index, annotated)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._finish_stage("annotate", self._annotated, 1)
+
+    def _write(self, writer, total_frames: int):
+        try:
+            pending = []
+            next_index = 0
+            while not self._stop.is_set():
+                item = self._get(self._annotated)
+                if item is _END:
+                    break
+                heapq.heappush(pending, (item[0], item[1]))
+                # 按帧序号顺序写出，乱序到达的帧暂存在小顶堆中
+                while pending and pending[0][0] == next_index:
+                    _, frame = heapq.heappop(pending)
+                    with stage_duration.time(stage="video_write"):
+                        writer.write(frame)
+                    next_index += 1
+                    if self.on_progress is not None:
+                        self.on_progress(next_index, total_frames)
+            self.frames_written = next_index
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, cap, writer, total_frames: int = 0) -> int:
+        """处理整段视频，返回写入的帧数；任一阶段出错时抛出该异常"""
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._remaining = {"infer": self.infer_workers, "annotate": self.annotate_workers}
+        self._decoded: queue.Queue = queue.Queue(self.queue_size)
+        self._inferred: queue.Queue = queue.Queue(self.queue_size)
+        self._annotated: queue.Queue = queue.Queue(self.queue_size)
+        self.frames_written = 0
+        _active_pipelines.add(self)
+
+        threads = [threading.Thread(target=self._decode, args=(cap,), name="video-decode", daemon=True)]
+        threads += [threading.Thread(target=self._infer, name=f"video-infer-{i}", daemon=True)
+                    for i in range(self.infer_workers)]
+        threads += [threading.Thread(target=self._annotate, name=f"video-annotate-{i}", daemon=True)
+                    for i in range(self.annotate_workers)]
+        threads.append(threading.Thread(target=self._write, args=(writer, total_frames),
+                                        name="video-write", daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        _active_pipelines.discard(self)
+
+        if self._error is not None:
+            raise self._error
+        return self.frames_written
@@ -0,0 +1,281 @@
+import os
+import json
+import bisect
+import shutil
+import subprocess
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import cv2
+from app.core.config import settings
+
+
+# 分段进程内的进度队列，由进程池的 initializer 设置
+_progress_queue = None
+
+
+def _ffprobe(video_path: str, *args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", *args, "-of", "csv=p=0", video_path],
+            capture_output=True, text=True, timeout=300, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def keyframe_indices(video_path: str, fps: float) -> List[int]:
+    """用 ffprobe 读取关键帧位置（帧号），没有 ffprobe 时返回空列表
+
+    帧号按 (pts - 视频流 start_time) × fps 换算，与 OpenCV 从 0 开始的帧号对齐；
+    MP4 的编辑列表或 TS 流的起始时间戳不为 0 时，直接用 pts 换算会整体偏移。
+    """
+    if shutil.which("ffprobe") is None or not fps:
+        return []
+    output = _ffprobe(video_path, "-skip_frame", "nokey", "-show_entries", "frame=pts_time")
+    if output is None:
+        return []
+    try:
+        start_time = float((_ffprobe(video_path, "-show_entries", "stream=start_time") or "").strip().rstrip(","))
+    except ValueError:
+        # 读不到（N/A）时按 0 处理
+        start_time = 0.0
+    indices = []
+    for line in output.splitlines():
+        try:
+            index = int(round((float(line.strip().rstrip(",")) - start_time) * fps))
+        except ValueError:
+            continue
+        if index >= 0:
+            indices.append(index)
+    return sorted(set(indices))
+
+
+def plan_segments(video_path: str, total_frames: int, fps: float, count: int,
+                  min_frames: int = None) -> List[Tuple[int, Optional[int]]]:
+    """把视频切成约 count 段，返回各段的 (起始帧, 结束帧)，最后一段结束帧为 None（读到文件末尾）
+
+    切分点取离均分位置最近的关键帧，各段从关键帧开始解码，定位准确且不用回退解码；
+    读不到关键帧信息时按均分位置切分。每段至少 min_frames 帧，视频过短时不切分。
+    """
+    min_frames = min_frames or settings.VIDEO_SEGMENT_MIN_FRAMES
+    count = min(count, total_frames // max(1, min_frames))
+    if count <= 1:
+        return [(0, None)]
+
+    keyframes = keyframe_indices(video_path, fps)
+    bounds = [0]
+    for i in range(1, count):
+        target = total_frames * i // count
+        if keyframes:
+            pos = bisect.bisect_left(keyframes, target)
+            candidates = keyframes[max(0, pos - 1):pos + 1]
+            target = min(candidates, key=lambda k: abs(k - target))
+        if bounds[-1] < target < total_frames:
+            bounds.append(target)
+    ends = bounds[1:] + [None]
+    return list(zip(bounds, ends))
+
+
+class SegmentCapture:
+    """只读出一段帧的 VideoCapture 包装"""
+
+    def __init__(self, cap, start: int, end: Optional[int]):
+        self.cap = cap
+        # 连续读取相邻的段时已经位于起始帧，不必再定位
+        if start and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self.remaining = None if end is None else end - start
+
+    def read(self):
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False, None
+            self.remaining -= 1
+        return self.cap.read()
+
+
+def _init_worker(progress_queue, torch_threads: int):
+    """分段进程初始化：固定 torch 线程数，避免多个进程争抢 CPU"""
+    global _progress_queue
+    _progress_queue = progress_queue
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(torch_threads)
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def _process_segment(index: int, video_path: str, output_path: str, start: int, end: Optional[int],
+                     fps: float, size: Tuple[int, int], render: bool, tracking: bool,
+                     weights: str, backend: str, options: Dict[str, Any],
+                     detections_path: Optional[str] = None, quantization: str = "none") -> int:
+    """在子进程中处理一段视频，返回写入的帧数
+
+    detections_path 不为空时，额外把每帧的检测结果（使用全局帧号）写入该 NDJSON 文件，
+    供主进程回放给 on_detections。
+    """
+    from app.core.video_pipeline import DetectionLogWriter
+    from app.core.yolo_detector import YOLODetector
+
+    detector = YOLODetector(weights, backend, extra_models=False, quantization=quantization)
+    detector.update_settings(**options)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"无法打开视频文件: {video_path}")
+    if render:
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    else:
+        out = DetectionLogWriter(output_path, fps, start_index=start)
+
+    detections_log = open(detections_path, "w", encoding="utf-8") if detections_path else None
+    log_lock = threading.Lock()
+
+    def log_detections(frame: int, detections):
+        # 标注线程有多个，结果不按帧序到达，每行自带帧号
+        line = json.dumps({"frame_index": start + frame, "detections": detections}, ensure_ascii=False)
+        with log_lock:
+            detections_log.write(line + "\n")
+
+    reported = 0
+
+    def report(done: int, _total: int):
+        nonlocal reported
+        # 每 25 帧汇报一次，减少跨进程消息
+        if done - reported >= 25:
+            _progress_queue.put((index, done))
+            reported = done
+
+    try:
+        frames = detector.run_video_pipeline(
+            SegmentCapture(cap, start, end), out, 0, tracking, render,
+            on_progress=report,
+            # 各段的跟踪器相互独立，错开轨迹 ID 避免拼接后重复
+            first_track_id=index * 1_000_000 + 1,
+            on_result=log_detections if detections_log is not None else None
+        )
+    finally:
+        cap.release()
+        out.release()
+        if detections_log is not None:
+            detections_log.close()
+    _progress_queue.put((index, frames))
+    return frames
+
+
+def concat_videos(parts: List[str], output_path: str, fps: float, size: Tuple[int, int]):
+    """拼接各段标注视频：有 ffmpeg 时直接复制码流，否则用 OpenCV 逐帧重写"""
+    if shutil.which("ffmpeg") is not None:
+        list_path = output_path + ".concat.txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        try:
+            subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0",
+                            "-i", list_path, "-c", "copy", output_path], check=True)
+            return
+        except (OSError, subprocess.SubprocessError):
+            pass
+        finally:
+            os.remove(list_path)
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    try:
+        for part in parts:
+            cap = cv2.VideoCapture(part)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+
+
+def concat_logs(parts: List[str], output_path: str):
+    """拼接各段检测日志，各段写入时已使用全局帧号"""
+    with open(output_path, "wb") as out:
+        for part in parts:
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, out)
+
+
+def replay_detections(path: str, on_detections: Callable[[int, Any], None]):
+    """把 NDJSON 检测日志中的每帧结果按 on_detections(源帧号, 检测结果) 回放"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                on_detections(record["frame_index"], record["detections"])
+
+
+def process_segments(video_path: str, output_path: str, plan: List[Tuple[int, Optional[int]]],
+                     fps: float, size: Tuple[int, int], render: bool, tracking: bool,
+                     weights: str, backend: str, options: Dict[str, Any], total_frames: int = 0,
+                     on_progress: Callable[[int, int], None] = None,
+                     on_detections: Callable[[int, Any], None] = None, quantization: str = "none") -> int:
+    """按分段计划在多个进程中并行处理视频，结果按顺序拼接到 output_path，返回总帧数
+
+    检测结果不能跨进程回调，各段写入 NDJSON（不渲染时就是输出本身），全部完成后
+    在主进程中回放给 on_detections。
+    """
+    ctx = mp.get_context("spawn")
+    progress_queue = ctx.Queue()
+    torch_threads = max(1, (os.cpu_count() or 1) // len(plan))
+    ext = ".mp4" if render else ".jsonl"
+    parts = [f"{os.path.splitext(output_path)[0]}.part{i:03d}{ext}" for i in range(len(plan))]
+    if on_detections is not None and render:
+        detection_parts = [f"{os.path.splitext(part)[0]}.detections.jsonl" for part in parts]
+    else:
+        detection_parts = [None] * len(plan)
+    done = [0] * len(plan)
+
+    stop = threading.Event()
+
+    def collect_progress():
+        # 汇总各段进度，统一回调
+        while not stop.is_set():
+            try:
+                index, frames = progress_queue.get(timeout=0.2)
+            except Exception:
+                continue
+            done[index] = frames
+            if on_progress is not None:
+                on_progress(sum(done), total_frames)
+
+    collector = threading.Thread(target=collect_progress, name="video-segment-progress", daemon=True)
+    collector.start()
+    try:
+        with ProcessPoolExecutor(max_workers=len(plan), mp_context=ctx, initializer=_init_worker,
+                                 initargs=(progress_queue, torch_threads)) as executor:
+            futures = [
+                executor.submit(_process_segment, i, video_path, part, start, end, fps, size,
+                                render, tracking, weights, backend, options, detection_parts[i], quantization)
+                for i, (part, (start, end)) in enumerate(zip(parts, plan))
+            ]
+            wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    for other in futures:
+                        other.cancel()
+                    raise future.exception()
+            frames = sum(future.result() for future in futures)
+        if on_progress is not None:
+            on_progress(frames, frames)
+        if on_detections is not None:
+            for part, detection_part in zip(parts, detection_parts):
+                replay_detections(detection_part or part, on_detections)
+
+        if render:
+            concat_videos(parts, output_path, fps, size)
+        else:
+            concat_logs(parts, output_path)
+        return frames
+    finally:
+        stop.set()
+        collector.join()
+        for part in parts + [p for p in detection_parts if p]:
+            if os.path.exists(part):
+                os.remove(part)
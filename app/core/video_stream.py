@@ -0,0 +1,242 @@
+import queue
+import shutil
+import subprocess
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from app.core.config import settings
+from app.core.renderer import draw_detections
+
+
+class StreamCancelled(Exception):
+    """客户端断开，流式任务被取消"""
+
+
+class _ChunkSink:
+    """输出分块的有界队列，客户端读得慢时反压到编码和推理"""
+
+    def __init__(self, job: "VideoStreamJob"):
+        self.job = job
+        self.chunks: "queue.Queue[Optional[bytes]]" = queue.Queue(settings.VIDEO_STREAM_QUEUE_CHUNKS)
+
+    def put(self, chunk: Optional[bytes]):
+        while True:
+            if self.job.cancelled.is_set():
+                raise StreamCancelled()
+            try:
+                self.chunks.put(chunk, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+
+class FragmentedMP4Writer:
+    """把帧送入 ffmpeg 编码为分片 MP4（fMP4），编码输出边产生边交给 sink
+
+    每个关键帧开始一个新分片，客户端收到首个分片即可开始播放，
+    不用等整段视频处理完毕。
+    """
+
+    media_type = "video/mp4"
+
+    def __init__(self, sink: _ChunkSink, fps: float, size: Tuple[int, int]):
+        width, height = size
+        fps = fps or 25.0
+        self.sink = sink
+        self._process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-f", "rawvideo", "-pix_fmt", "bgr24",
+             "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+             "-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", "-pix_fmt", "yuv420p",
+             # 约每秒一个关键帧，即每秒一个分片
+             "-g", str(max(1, int(round(fps)))),
+             "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+             "-f", "mp4", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self._reader = threading.Thread(target=self._pump, name="fmp4-reader", daemon=True)
+        self._reader.start()
+
+    def _pump(self):
+        try:
+            while True:
+                chunk = self._process.stdout.read1(64 * 1024)
+                if not chunk:
+                    break
+                self.sink.put(chunk)
+        except StreamCancelled:
+            self._process.kill()
+        finally:
+            self._process.stdout.close()
+
+    def isOpened(self) -> bool:
+        return self._process.poll() is None
+
+    def write(self, frame: np.ndarray):
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            raise StreamCancelled()
+
+    def release(self):
+        if self._process.stdin and not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self._reader.join()
+        self._process.wait()
+
+
+class MJPEGWriter:
+    """没有 ffmpeg 时的退化方案：multipart/x-mixed-replace 的 JPEG 帧序列"""
+
+    boundary = "frame"
+    media_type = f"multipart/x-mixed-replace; boundary={boundary}"
+
+    def __init__(self, sink: _ChunkSink, fps: float, size: Tuple[int, int]):
+        self.sink = sink
+
+    def isOpened(self) -> bool:
+        return True
+
+    def write(self, frame: np.ndarray):
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        header = f"--{self.boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(buffer)}\r\n\r\n"
+        self.sink.put(header.encode("ascii") + buffer.tobytes() + b"\r\n")
+
+    def release(self):
+        pass
+
+
+class _StreamWriter:
+    """流水线写入端：标注帧交给视频编码，检测结果追加到 NDJSON 旁路"""
+
+    def __init__(self, job: "VideoStreamJob", video_writer):
+        self.job = job
+        self.video_writer = video_writer
+
+    def isOpened(self) -> bool:
+        return self.video_writer.isOpened()
+
+    def write(self, item):
+        frame, detections = item
+        self.video_writer.write(frame)
+        self.job.add_detections(detections)
+
+    def release(self):
+        self.video_writer.release()
+
+
+class VideoStreamJob:
+    """一次流式视频检测：后台线程处理视频，视频分块和检测结果分别供两个 HTTP 响应读取"""
+
+    def __init__(self, detector, video_path: str, tracking: bool = None, model: str = None):
+        self.id = uuid.uuid4().hex
+        self.detector = detector
+        self.video_path = video_path
+        self.tracking = settings.TRACKING_ENABLED if tracking is None else tracking
+        self.model = model
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.error: Optional[str] = None
+        self.sink = _ChunkSink(self)
+        self._records: List[Dict[str, Any]] = []
+        self._records_changed = threading.Condition()
+
+        self._cap = cv2.VideoCapture(video_path)
+        if not self._cap.isOpened():
+            raise ValueError("无法打开视频文件")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        writer_cls = FragmentedMP4Writer if shutil.which("ffmpeg") is not None else MJPEGWriter
+        self.media_type = writer_cls.media_type
+        self._writer = _StreamWriter(self, writer_cls(self.sink, self.fps, size))
+
+    def start(self) -> "VideoStreamJob":
+        threading.Thread(target=self._run, name=f"video-stream-{self.id[:8]}", daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            with self.detector.registry.use(self.model) as version:
+                self.detector.run_video_pipeline(
+                    self._cap, self._writer, self.total_frames, self.tracking, render=True,
+                    model=version.key,
+                    annotate=lambda frame, detections: (draw_detections(frame, detections), detections)
+                )
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._cap.release()
+            try:
+                self._writer.release()
+            except StreamCancelled:
+                pass
+            self.finished.set()
+            with self._records_changed:
+                self._records_changed.notify_all()
+            try:
+                # 结束标记
+                self.sink.put(None)
+            except StreamCancelled:
+                pass
+
+    def add_detections(self, detections: List[Dict[str, Any]]):
+        with self._records_changed:
+            index = len(self._records)
+            self._records.append({
+                "frame_index": index,
+                "timestamp": index / self.fps if self.fps else None,
+                "detections": detections,
+            })
+            self._records_changed.notify_all()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def next_chunk(self, timeout: float = 0.5) -> Optional[bytes]:
+        """读取下一个视频分块；暂时没有数据时返回空字节串，结束或已取消时返回 None"""
+        try:
+            return self.sink.chunks.get(timeout=timeout)
+        except queue.Empty:
+            return None if self.cancelled.is_set() else b""
+
+    def wait_records(self, start: int, timeout: float = 1.0) -> Tuple[List[Dict[str, Any]], bool]:
+        """读取第 start 帧之后的检测记录，返回 (记录, 是否已全部结束)"""
+        with self._records_changed:
+            if len(self._records) <= start and not self.finished.is_set():
+                self._records_changed.wait(timeout)
+            return self._records[start:], self.finished.is_set() and len(self._records) <= start
+
+
+class VideoStreamRegistry:
+    """正在进行或刚结束的流式任务，检测结果旁路按任务 ID 查找"""
+
+    def __init__(self):
+        self._jobs: Dict[str, VideoStreamJob] = {}
+        self._lock = threading.Lock()
+
+    def start(self, detector, video_path: str, tracking: bool = None, model: str = None) -> VideoStreamJob:
+        job = VideoStreamJob(detector, video_path, tracking, model)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.start()
+        threading.Thread(target=self._expire, args=(job,), daemon=True).start()
+        return job
+
+    def _expire(self, job: VideoStreamJob):
+        # 结束后保留一段时间，供较晚连上的检测结果旁路读取
+        job.finished.wait()
+        job.cancelled.wait(settings.VIDEO_STREAM_RETENTION_S)
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[VideoStreamJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
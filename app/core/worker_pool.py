@@ -0,0 +1,372 @@
+import os
+import time
+import zlib
+import itertools
+import threading
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from concurrent.futures import Future
+from typing import Any, Dict, List
+from app.core.config import settings
+from app.core.metrics import frames_dropped, registry as metrics_registry
+
+
+# 同一批次内会被合并成 process_frames_detailed 调用的方法
+_BATCHABLE_METHODS = {"process_frame", "process_frame_detailed"}
+
+
+def _worker_main(worker_id: int, task_queue, result_conn, torch_threads: int,
+                 batch_size: int, heartbeat_interval: float):
+    """推理进程入口：加载模型，循环处理任务并定期发送心跳"""
+    # 必须在导入 torch 之前固定线程数，避免多个进程互相争抢 CPU
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(torch_threads)
+
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    from app.core.yolo_detector import YOLODetector
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            result_conn.send(message)
+
+    detector = YOLODetector()
+    send(("ready", worker_id, None, None))
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(heartbeat_interval):
+            try:
+                # 心跳附带本进程计数器和直方图的快照，由主进程汇总到 /metrics
+                send(("heartbeat", worker_id, time.time(), metrics_registry.snapshot()))
+            except (OSError, EOFError):
+                return
+
+    threading.Thread(target=heartbeat, name="worker-heartbeat", daemon=True).start()
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            # 尽量把队列中已有的任务凑成一批
+            tasks = [task]
+            while len(tasks) < batch_size:
+                try:
+                    nxt = task_queue.get_nowait()
+                except Exception:
+                    break
+                if nxt is None:
+                    task_queue.put(None)
+                    break
+                tasks.append(nxt)
+
+            # 是否绘制、使用的模型不同的任务分开成批
+            groups = {}
+            for t in tasks:
+                if t[1] in _BATCHABLE_METHODS:
+                    groups.setdefault((t[3].get("render", True), t[3].get("model")), []).append(t)
+            for (render, model), batchable in groups.items():
+                # 通知主进程任务开始执行，任务超时从这里开始计时，不包括排队时间
+                send(("started", worker_id, None, [t[0] for t in batchable]))
+                try:
+                    outputs = detector.process_frames_detailed(
+                        [t[2][0] for t in batchable],
+                        [t[3].get("stream_id") for t in batchable],
+                        render,
+                        model
+                    )
+                    for t, output in zip(batchable, outputs):
+                        if t[1] == "process_frame":
+                            output = (output["frame"], output["detections"])
+                        send(("result", worker_id, t[0], (True, output)))
+                except Exception:
+                    error = traceback.format_exc()
+                    for t in batchable:
+                        send(("result", worker_id, t[0], (False, error)))
+
+            for task_id, method, args, kwargs in tasks:
+                if method in _BATCHABLE_METHODS:
+                    continue
+                send(("started", worker_id, None, [task_id]))
+                try:
+                    value = getattr(detector, method)(*args, **kwargs)
+                    send(("result", worker_id, task_id, (True, value)))
+                except Exception:
+                    send(("result", worker_id, task_id, (False, traceback.format_exc())))
+    finally:
+        stop.set()
+
+
+class _WorkerHandle:
+    """主进程中对单个推理进程的记录"""
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process = None
+        self.task_queue = None
+        self.result_conn = None
+        self.inflight: Dict[int, Future] = {}
+        self.running_since: Dict[int, float] = {}  # 已开始执行的在途任务及其开始时间（主进程时钟）
+        self.ready = False
+        self.started_at = 0.0
+        self.last_heartbeat = 0.0
+        self.restarts = 0
+        self.completed = 0
+        self.broken = False
+
+
+class InferenceWorkerPool:
+    """多进程推理池
+
+    每个进程持有独立的 YOLO 模型并固定 torch 线程数，主进程通过
+    submit_nowait() 提交任务。监控线程检查进程存活、心跳以及已开始执行的任务是否
+    超过期限（心跳在独立线程中发送，推理卡死时心跳仍然正常；排队时间不计入），
+    崩溃或卡死的进程会被自动重启，其未完成的任务以异常结束。
+    """
+
+    def __init__(self, size: int = None, torch_threads: int = None,
+                 batch_size: int = None, heartbeat_interval: float = None,
+                 heartbeat_timeout: float = None, task_timeout: float = None):
+        self.size = max(1, size or settings.WORKER_POOL_SIZE)
+        self.torch_threads = torch_threads or settings.WORKER_TORCH_THREADS
+        self.batch_size = batch_size or settings.BATCH_MAX_SIZE
+        self.heartbeat_interval = heartbeat_interval or settings.WORKER_HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = heartbeat_timeout or settings.WORKER_HEARTBEAT_TIMEOUT
+        self.task_timeout = settings.WORKER_TASK_TIMEOUT if task_timeout is None else task_timeout
+        self._ctx = mp.get_context("spawn")
+        self._workers: List[_WorkerHandle] = [_WorkerHandle(i) for i in range(self.size)]
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._started = False
+        self._closing = threading.Event()
+        # 需要在重启后的进程上重放的广播（模型加载、切换、参数修改等），同一键只保留最后一次
+        self._replay: Dict[tuple, tuple] = {}
+        metrics_registry.gauge("worker_pool_inflight_tasks", "推理进程池中已提交未完成的任务数").set_function(
+            self.queue_depth)
+
+    def start(self):
+        """启动所有推理进程以及结果收集、健康检查线程"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for worker in self._workers:
+                self._spawn(worker)
+        threading.Thread(target=self._collect_results, name="worker-pool-collector", daemon=True).start()
+        threading.Thread(target=self._monitor, name="worker-pool-monitor", daemon=True).start()
+
+    def _spawn(self, worker: _WorkerHandle):
+        """（重新）创建推理进程，调用方需持有锁"""
+        receiver, sender = self._ctx.Pipe(duplex=False)
+        worker.task_queue = self._ctx.Queue()
+        worker.result_conn = receiver
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.worker_id, worker.task_queue, sender, self.torch_threads,
+                  self.batch_size, self.heartbeat_interval),
+            name=f"yolo-worker-{worker.worker_id}",
+            daemon=True,
+        )
+        worker.ready = False
+        worker.broken = False
+        worker.started_at = time.time()
+        worker.last_heartbeat = worker.started_at
+        worker.process.start()
+        sender.close()
+        # 新进程只加载了配置中的模型，按顺序重放之前的状态变更；结果无人等待，直接丢弃
+        for method, args, kwargs in self._replay.values():
+            worker.task_queue.put((next(self._task_ids), method, args, kwargs))
+
+    def _respawn(self, worker: _WorkerHandle, reason: str):
+        """重启异常的推理进程，并让其在途任务失败"""
+        with self._lock:
+            if self._closing.is_set():
+                return
+            inflight, worker.inflight = worker.inflight, {}
+            worker.running_since = {}
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.kill()
+            if worker.result_conn is not None:
+                worker.result_conn.close()
+            worker.restarts += 1
+            self._spawn(worker)
+        frames_dropped.inc(len(inflight), reason="worker_restart")
+        for future in inflight.values():
+            if not future.done():
+                future.set_exception(RuntimeError(f"推理进程 {worker.worker_id} 异常: {reason}"))
+
+    def _collect_results(self):
+        while not self._closing.is_set():
+            with self._lock:
+                conns = {w.result_conn: w for w in self._workers
+                         if w.result_conn is not None and not w.broken}
+            try:
+                ready = wait(list(conns), timeout=0.5)
+            except OSError:
+                continue
+            for conn in ready:
+                worker = conns[conn]
+                try:
+                    kind, _, payload_id, payload = conn.recv()
+                except (EOFError, OSError):
+                    # 管道断开说明进程已退出，由监控线程负责重启
+                    worker.broken = True
+                    continue
+                worker.last_heartbeat = time.time()
+                if kind == "ready":
+                    worker.ready = True
+                elif kind == "started":
+                    with self._lock:
+                        for task_id in payload:
+                            if task_id in worker.inflight:
+                                worker.running_since[task_id] = worker.last_heartbeat
+                elif kind == "heartbeat":
+                    metrics_registry.set_external(f"worker-{worker.worker_id}", payload)
+                elif kind == "result":
+                    with self._lock:
+                        future = worker.inflight.pop(payload_id, None)
+                        worker.running_since.pop(payload_id, None)
+                    if future is None or future.done():
+                        continue
+                    ok, value = payload
+                    worker.completed += 1
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(RuntimeError(value))
+
+    def _monitor(self):
+        while not self._closing.wait(self.heartbeat_interval):
+            now = time.time()
+            for worker in self._workers:
+                if worker.process is None:
+                    continue
+                if not worker.process.is_alive():
+                    self._respawn(worker, f"进程退出，exitcode={worker.process.exitcode}")
+                elif worker.ready and now - worker.last_heartbeat > self.heartbeat_timeout:
+                    self._respawn(worker, "心跳超时")
+                elif (worker.ready and self.task_timeout > 0
+                      and self._longest_running(worker, now) > self.task_timeout):
+                    self._respawn(worker, "任务超时")
+
+    def _longest_running(self, worker: _WorkerHandle, now: float) -> float:
+        """已开始执行的任务中运行最久的时长（秒），没有正在执行的任务时返回 0"""
+        with self._lock:
+            oldest = min(worker.running_since.values(), default=None)
+        return 0.0 if oldest is None else now - oldest
+
+    def _pick_worker(self) -> _WorkerHandle:
+        """选择在途任务最少的进程，优先已就绪的进程"""
+        alive = [w for w in self._workers if w.process is not None and w.process.is_alive()]
+        candidates = [w for w in alive if w.ready] or alive or self._workers
+        return min(candidates, key=lambda w: len(w.inflight))
+
+    def submit_nowait(self, method: str, *args, affinity: str = None, **kwargs) -> Future:
+        """提交任务，返回 concurrent.futures.Future
+
+        指定 affinity 时同一键的任务总是发往同一进程，便于进程内保留按流的状态。
+        """
+        if not self._started:
+            self.start()
+        future: Future = Future()
+        task_id = next(self._task_ids)
+        with self._lock:
+            if affinity is not None:
+                worker = self._workers[zlib.crc32(affinity.encode("utf-8")) % self.size]
+            else:
+                worker = self._pick_worker()
+            self._enqueue(worker, task_id, future, method, args, kwargs)
+        return future
+
+    def _enqueue(self, worker: _WorkerHandle, task_id: int, future: Future, method: str, args, kwargs):
+        """把任务放入进程的队列，调用方需持有锁"""
+        worker.inflight[task_id] = future
+        worker.task_queue.put((task_id, method, args, kwargs))
+
+    def _remember(self, method: str, args, kwargs):
+        """记录需要重放的广播，调用方需持有锁
+
+        参数修改只带有变化的字段，与之前的记录合并为一条；模型的加载和卸载按模型名称
+        只保留最后一次。默认模型的切换始终排在最后，保证重放时对应的模型已经加载。
+        """
+        if method in ("load_model", "unload_model"):
+            key = ("model", args[0] if args else kwargs.get("name"))
+        else:
+            key = (method,)
+        previous = self._replay.pop(key, None)
+        if method == "update_settings":
+            changed = {k: v for k, v in kwargs.items() if v is not None}
+            kwargs = {**previous[2], **changed} if previous is not None else changed
+        self._replay[key] = (method, args, kwargs)
+        default = self._replay.pop(("set_default_model",), None)
+        if default is not None:
+            self._replay[("set_default_model",)] = default
+
+    def broadcast(self, method: str, *args, replay: bool = False, **kwargs) -> List[Future]:
+        """在所有进程上执行同一方法，例如同步检测参数
+
+        replay 为 True 时记录该调用，进程崩溃重启后会重新执行，使新进程与其他进程状态一致。
+        """
+        if not self._started:
+            self.start()
+        futures = []
+        with self._lock:
+            if replay:
+                self._remember(method, args, kwargs)
+            for worker in self._workers:
+                future: Future = Future()
+                self._enqueue(worker, next(self._task_ids), future, method, args, kwargs)
+                futures.append(future)
+        return futures
+
+    def queue_depth(self) -> int:
+        """所有进程的在途任务总数"""
+        return sum(len(w.inflight) for w in self._workers)
+
+    def health(self) -> List[Dict[str, Any]]:
+        """各推理进程的健康状态"""
+        now = time.time()
+        return [
+            {
+                "worker_id": w.worker_id,
+                "pid": w.process.pid if w.process is not None else None,
+                "alive": bool(w.process is not None and w.process.is_alive()),
+                "ready": w.ready,
+                "inflight": len(w.inflight),
+                "completed": w.completed,
+                "restarts": w.restarts,
+                "seconds_since_heartbeat": round(now - w.last_heartbeat, 3) if w.last_heartbeat else None,
+            }
+            for w in self._workers
+        ]
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止所有推理进程"""
+        self._closing.set()
+        with self._lock:
+            workers = list(self._workers)
+            for worker in workers:
+                if worker.task_queue is not None:
+                    worker.task_queue.put(None)
+        for worker in workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+            for future in worker.inflight.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("推理进程池已关闭"))
+            worker.inflight.clear()
+            worker.running_since.clear()
@@ -0,0 +1,96 @@
+import struct
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+# 实时检测 WebSocket 的二进制协议（版本 1）
+#
+# 图像以原始 JPEG / WebP 字节放在二进制消息中，不经过 Data URL、Base64 和 JSON；
+# 检测结果按定长结构体打包。所有整数和浮点数均为小端。
+#
+# 请求（客户端 → 服务端）：
+#     头部 8 字节：uint8 version, uint8 flags, uint16 model_len, uint32 seq
+#         flags bit0 返回标注图像；bit1 标注图像用 WebP 编码（缺省 JPEG）
+#         seq 为客户端帧序号，响应中原样带回
+#     model_len 字节的 UTF-8 模型名称（0 表示默认模型）
+#     其余为 JPEG / WebP 图像字节
+#
+# 响应（服务端 → 客户端）：
+#     头部 12 字节：uint8 version, uint8 flags, uint16 count, uint32 seq, uint16 imgsz, uint8 classes, uint8 保留
+#         flags bit0 带标注图像；bit1 出错，头部之后为 UTF-8 错误信息
+#         imgsz 为实际推理尺寸，0 表示本帧未推理（复用了上次结果）
+#     类别名称表 classes 项，每项为 uint8 长度 + UTF-8 名称
+#     count 个检测框，每个 26 字节：float32 x1, y1, x2, y2, confidence, uint16 类别表下标, int32 track_id（-1 表示无）
+#     其余为标注图像字节
+#
+# 流控：服务端只处理每个连接最新的一帧，处理期间到达的旧帧不会有响应；服务端还会定期发送文本消息
+#     {"type": "flow", "fps": 可达帧率, "received": 已收帧数, "dropped": 丢弃的过期帧数}，客户端据此限速。
+#
+# 输出自适应：服务端定期发送文本消息 {"type": "ping", "t": 编号}，客户端回文本消息 {"type": "pong", "t": 编号}
+#     用于测量 RTT；客户端可随时发送 {"type": "display", "width", "height"} 更新显示尺寸。标注图像的质量、
+#     尺寸随之调整，拥塞时部分响应不带标注图像（flags bit0 为 0），检测结果总是带上。
+VERSION = 1
+
+FLAG_RENDER = 0x01
+FLAG_WEBP = 0x02
+FLAG_IMAGE = 0x01
+FLAG_ERROR = 0x02
+
+_REQUEST_HEADER = struct.Struct("<BBHI")
+_RESPONSE_HEADER = struct.Struct("<BBHIHBx")
+_DETECTION = struct.Struct("<5fHi")
+
+
+class ProtocolError(ValueError):
+    """二进制消息格式错误"""
+
+
+class FrameRequest(NamedTuple):
+    seq: int
+    render: bool
+    image_format: str
+    model: Optional[str]
+    image: memoryview
+
+
+def decode_request(data: bytes) -> FrameRequest:
+    """解析请求，图像部分以 memoryview 返回，不复制"""
+    if len(data) < _REQUEST_HEADER.size:
+        raise ProtocolError("消息长度不足")
+    version, flags, model_len, seq = _REQUEST_HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ProtocolError(f"不支持的协议版本: {version}")
+    view = memoryview(data)
+    offset = _REQUEST_HEADER.size
+    model = bytes(view[offset:offset + model_len]).decode("utf-8") if model_len else None
+    image = view[offset + model_len:]
+    if not len(image):
+        raise ProtocolError("缺少图像数据")
+    return FrameRequest(seq, bool(flags & FLAG_RENDER), ".webp" if flags & FLAG_WEBP else ".jpg", model, image)
+
+
+def encode_response(seq: int, detections: List[Dict[str, Any]], imgsz: Optional[int] = None,
+                    image: Optional[bytes] = None) -> bytes:
+    """打包检测结果和可选的标注图像"""
+    classes: Dict[str, int] = {}
+    for det in detections:
+        classes.setdefault(det["class_name"], len(classes))
+    if len(classes) > 255:
+        raise ProtocolError("单帧类别数超过 255")
+
+    parts = [_RESPONSE_HEADER.pack(VERSION, FLAG_IMAGE if image is not None else 0, len(detections),
+                                   seq & 0xFFFFFFFF, imgsz or 0, len(classes))]
+    for name in classes:
+        encoded = name.encode("utf-8")[:255]
+        parts.append(bytes((len(encoded),)) + encoded)
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        track_id = det.get("track_id")
+        parts.append(_DETECTION.pack(x1, y1, x2, y2, det["confidence"], classes[det["class_name"]],
+                                     -1 if track_id is None else track_id))
+    if image is not None:
+        parts.append(image)
+    return b"".join(parts)
+
+
+def encode_error(seq: int, message: str) -> bytes:
+    return _RESPONSE_HEADER.pack(VERSION, FLAG_ERROR, 0, seq & 0xFFFFFFFF, 0, 0) + message.encode("utf-8")
@@ -1,34 +1,177 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
-from typing import List, Dict, Any, Generator, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 import os
 import base64
 from ..core.config import settings
-import datetime
+from ..core.metrics import method_duration, stage_duration, timed
+from ..core.batch_scheduler import BatchScheduler
+from ..core.model_registry import ModelRegistry
+from ..core.fast_path import FastPath
+from ..core.video_pipeline import VideoPipeline, DetectionLogWriter
+from ..core.video_segments import plan_segments, process_segments
+from ..core.frame_sampler import FrameSampler
+from ..core.renderer import draw_detections, encode_image
+from ..core.image_ingest import decode_image, ingest_signature, read_image, scale_detections
+from ..core.load_controller import LoadController
+import time
+from ..core.tracker import ByteTracker, TrackedStream
+from ..core.motion_gate import MotionGate
+from ..core.tiling import make_tiles, merge_detections, offset_detections
+from collections import OrderedDict
+import threading
 
 
-settings.MODEL_PATH = r'D:\code\manhole-cover\app\core\best.pt'
-
 class YOLODetector:
-    def __init__(self):
-        self.model = YOLO(settings.MODEL_PATH)
+    def __init__(self, weights: str = None, backend: str = None, extra_models: bool = True,
+                 quantization: str = None):
+        # 模型注册表：默认模型同步加载，其余模型在后台加载预热
+        self.registry = ModelRegistry(on_change=self._clear_gates)
+        self.registry.load(settings.MODEL_DEFAULT_NAME, weights or settings.MODEL_PATH, backend,
+                           make_default=True, background=False, quantization=quantization)
+        if extra_models:
+            for name, weights in settings.MODELS.items():
+                self.registry.load(name, weights)
+        self.backend = backend or settings.BACKEND
         self.confidence_threshold = settings.CONFIDENCE_THRESHOLD
         self.iou_threshold = settings.IOU_THRESHOLD
         self.device = settings.DEVICE
         self.half = settings.HALF
-
-    def detect_image(self, image_path: str) -> Dict[str, Any]:
-        """检测单张图片"""
-        results = self.model.predict(
-            source=image_path,
-            conf=self.confidence_threshold,
-            iou=self.iou_threshold,
-            device=self.device,
-            half=self.half
-        )[0]
-
-        # 处理检测结果
+        self.scheduler = None
+        # 实时流的负载自适应控制；静态形状的 TorchScript 模型只能使用导出尺寸
+        self.load_controller = None
+        if settings.LOAD_CONTROL_ENABLED and self.backend != "torchscript":
+            self.load_controller = LoadController(queue_depth=self._queue_depth)
+        # 切片推理参数
+        self.tiled = settings.TILE_ENABLED
+        self.tile_size = settings.TILE_SIZE
+        self.tile_overlap = settings.TILE_OVERLAP
+        self.tile_merge = settings.TILE_MERGE
+        self.tile_merge_iou = settings.TILE_MERGE_IOU
+        self.tile_full_image = settings.TILE_FULL_IMAGE
+        # 直通推理路径的插桩回调，接收每次调用的分配统计
+        self.fast_path_hook = None
+        self._fast_path_lock = threading.Lock()
+        # 每路视频流各自的静态画面门控
+        self._gates: "OrderedDict[str, MotionGate]" = OrderedDict()
+        self._gates_lock = threading.Lock()
+
+    def enable_batching(self, max_batch_size: int = None, max_wait_ms: float = None) -> BatchScheduler:
+        """启用跨请求批处理，之后所有推理都经由调度线程合并成批次执行"""
+        if self.scheduler is None:
+            self.scheduler = BatchScheduler(
+                self._predict_batch,
+                max_batch_size=max_batch_size or settings.BATCH_MAX_SIZE,
+                max_wait_ms=settings.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+            )
+            self.scheduler.start()
+        return self.scheduler
+
+    def _queue_depth(self) -> int:
+        """等待推理的帧数"""
+        return self.scheduler.queue_depth() if self.scheduler is not None else 0
+
+    def _realtime_imgsz(self) -> int:
+        """实时流当前应使用的输入尺寸，None 表示使用模型默认尺寸"""
+        return self.load_controller.imgsz if self.load_controller is not None else None
+
+    @property
+    def model(self):
+        """当前默认模型"""
+        return self.registry.current().model
+
+    @property
+    def model_version(self) -> str:
+        return self.registry.current().version
+
+    def _predict_batch(self, frames: List[np.ndarray], conf: float = None, iou: float = None,
+                       imgsz: int = None, model: str = None, fast_path: bool = False) -> List[Any]:
+        """对一批帧执行一次模型推理，model 为模型版本 key
+
+        fast_path 为 True 时走直通推理路径，返回每帧的检测结果列表。
+        """
+        options = {}
+        if imgsz is not None:
+            options["imgsz"] = imgsz
+        version = self.registry.get(model) if model is not None else self.registry.current()
+        if fast_path:
+            return self._fast_path_for(version).run(
+                frames, self.confidence_threshold if conf is None else conf,
+                self.iou_threshold if iou is None else iou, imgsz
+            )
+        with stage_duration.time(stage="inference"):
+            return version.model.predict(
+                source=list(frames),
+                conf=self.confidence_threshold if conf is None else conf,
+                iou=self.iou_threshold if iou is None else iou,
+                device=self.device,
+                half=self.half,
+                **options
+            )
+
+    def _infer_many(self, frames: List[np.ndarray], imgsz: int = None, model: str = None) -> List[Any]:
+        """推理多帧；启用批处理时交给调度器，与其他调用方的帧合并
+
+        model 为模型名称，None 表示默认模型。推理期间登记为该版本的在途请求，
+        模型被替换时旧版本要等这些请求结束后才释放。
+        """
+        if not frames:
+            return []
+        with self.registry.use(model) as version:
+            if self.scheduler is None:
+                return self._predict_batch(frames, imgsz=imgsz, model=version.key)
+            # 提交时固定阈值和模型版本，避免批次执行时读到中途被修改的参数
+            futures = self.scheduler.submit_many(
+                frames, conf=self.confidence_threshold, iou=self.iou_threshold, imgsz=imgsz,
+                model=version.key
+            )
+            return [future.result() for future in futures]
+
+    def _infer(self, frame: np.ndarray, imgsz: int = None, model: str = None) -> Any:
+        """推理单帧"""
+        return self._infer_many([frame], imgsz, model)[0]
+
+    def _fast_path_for(self, version) -> FastPath:
+        """模型版本对应的直通推理路径，首次使用时创建"""
+        with self._fast_path_lock:
+            fast_path = version.cache.get("fast_path")
+            if fast_path is None:
+                fast_path = version.cache["fast_path"] = FastPath(version.model, self.device, self.half)
+            fast_path.on_frame = self.fast_path_hook
+            return fast_path
+
+    def _detect_realtime(self, frames: List[np.ndarray], model: str = None) -> Tuple[List[List[Dict[str, Any]]], int]:
+        """实时流推理：按负载选择输入尺寸并记录延迟，返回 (每帧检测结果, 实际使用的尺寸)
+
+        启用 FAST_PATH_ENABLED 时走预分配缓冲区的直通路径，否则经由 ultralytics predictor。
+        """
+        if not frames:
+            return [], None
+        imgsz = self._realtime_imgsz()
+        start = time.perf_counter()
+        if settings.FAST_PATH_ENABLED:
+            imgsz = imgsz or settings.EXPORT_IMAGE_SIZE
+            with self.registry.use(model) as version:
+                if self.scheduler is not None:
+                    # 经调度线程执行：与其他请求的帧合并成批次，也不会与 predictor 同时前向
+                    futures = self.scheduler.submit_many(
+                        frames, conf=self.confidence_threshold, iou=self.iou_threshold, imgsz=imgsz,
+                        model=version.key, fast_path=True
+                    )
+                    detections = [future.result() for future in futures]
+                else:
+                    detections = self._fast_path_for(version).run(
+                        frames, self.confidence_threshold, self.iou_threshold, imgsz
+                    )
+        else:
+            detections = [self._to_detections(r) for r in self._infer_many(frames, imgsz, model)]
+        if self.load_controller is not None:
+            self.load_controller.observe((time.perf_counter() - start) * 1000, len(frames))
+        return detections, imgsz or settings.EXPORT_IMAGE_SIZE
+
+    @staticmethod
+    def _to_detections(results) -> List[Dict[str, Any]]:
+        """把 ultralytics 结果转换为检测结果列表"""
         detections = []
         for box, cls, conf in zip(results.boxes.xyxy.tolist(),
                                 results.boxes.cls.tolist(),
@@ -38,19 +181,182 @@ class YOLODetector:
                 "confidence": float(conf),
                 "bbox": [float(x) for x in box]
             })
+        return detections
+
+    @timed(method_duration, method="detect_frame")
+    def detect_frame(self, frame: np.ndarray, model: str = None) -> List[Dict[str, Any]]:
+        """检测单帧，只返回检测结果，不绘制"""
+        return self._to_detections(self._infer(frame, model=model))
+
+    @timed(method_duration, method="detect_frame_realtime")
+    def detect_frame_realtime(self, frame: np.ndarray, model: str = None) -> Dict[str, Any]:
+        """实时流检测单帧：受负载控制，返回检测结果和实际使用的输入尺寸"""
+        detections, imgsz = self._detect_realtime([frame], model)
+        return {"detections": detections[0], "imgsz": imgsz}
+
+    def create_tracked_stream(self, detect=None, realtime: bool = False, model: str = None,
+                              first_track_id: int = 1) -> TrackedStream:
+        """创建关键帧检测 + 跟踪的会话，每路视频流各自持有一个
+
+        realtime 为 True 时关键帧检测受负载控制，过载时自动拉长关键帧间隔。
+        """
+        if detect is None:
+            detect_one = self.detect_frame_realtime if realtime else self.detect_frame
+            detect = lambda frame: detect_one(frame, model)
+        floor = None
+        if realtime and self.load_controller is not None:
+            floor = lambda: self.load_controller.keyframe_interval
+        return TrackedStream(
+            detect,
+            interval=settings.TRACKING_KEYFRAME_INTERVAL,
+            adaptive=settings.TRACKING_ADAPTIVE,
+            min_interval=settings.TRACKING_MIN_INTERVAL,
+            max_interval=settings.TRACKING_MAX_INTERVAL,
+            tracker=ByteTracker(
+                high_threshold=settings.TRACKING_HIGH_THRESHOLD,
+                match_iou=settings.TRACKING_MATCH_IOU,
+                max_age=settings.TRACKING_MAX_AGE,
+                first_id=first_track_id
+            ),
+            interval_floor=floor
+        )
+
+    def cache_signature(self, tiled: bool = None, model: str = None) -> str:
+        """影响图片检测结果的全部参数，用作结果缓存键的一部分"""
+        if tiled is None:
+            tiled = self.tiled
+        version = self.registry.current(model)
+        parts = [version.version, f"quant={version.quantization}", f"conf={self.confidence_threshold}",
+                 f"iou={self.iou_threshold}", ingest_signature()]
+        if tiled:
+            parts.append(f"tile={self.tile_size},{self.tile_overlap},{self.tile_merge},"
+                         f"{self.tile_merge_iou},{self.tile_full_image}")
+        return "|".join(parts)
+
+    @timed(method_duration, method="detect_tiled")
+    def detect_tiled(self, image: np.ndarray, model: str = None) -> List[Dict[str, Any]]:
+        """切片推理：在原始分辨率上切出重叠切片，整批推理后映射回原图并跨切片合并"""
+        height, width = image.shape[:2]
+        tiles = make_tiles(width, height, self.tile_size, self.tile_overlap)
+        # 切片只是原图的视图，不复制像素
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        if self.tile_full_image:
+            crops.append(image)
+
+        results_list = self._infer_many(crops, model=model)
+        detections = []
+        for (x1, y1, _, _), results in zip(tiles, results_list):
+            detections.extend(offset_detections(self._to_detections(results), x1, y1))
+        if self.tile_full_image:
+            detections.extend(self._to_detections(results_list[-1]))
+
+        return merge_detections(detections, self.tile_merge, self.tile_merge_iou)
+
+    @timed(method_duration, method="detect_image")
+    def detect_image(self, image_path: str, tiled: bool = None, render: bool = True,
+                     model: str = None) -> Dict[str, Any]:
+        """检测单张图片
+
+        tiled 为 True 且图片大于切片尺寸时使用切片推理，保留远处小目标；
+        render 为 False 时只返回检测结果，不绘制也不保存标注图片；
+        model 指定注册表中的模型名称，None 表示默认模型。
+
+        render 为 False 时远大于模型输入的 JPEG 按缩小后的尺寸解码（见 image_ingest）；
+        需要标注图片时按原图尺寸解码，标注图片与原图同样大小。返回的检测框坐标总是对应原图。
+        """
+        if tiled is None:
+            tiled = self.tiled
+        # 切片推理需要原图细节，全尺寸解码
+        try:
+            decoded = read_image(image_path, full=tiled, output_scale=1.0 if render else None)
+        except ValueError:
+            raise ValueError(f"无法读取图片: {image_path}")
+        image = decoded.image
+
+        if tiled and max(image.shape[:2]) > self.tile_size:
+            detections = self.detect_tiled(image, model)
+        else:
+            # 处理检测结果
+            detections = self.detect_frame(image, model)
+
+        if not render:
+            return {
+                "detections": scale_detections(detections, decoded.scale),
+                "result_image": None
+            }
 
         # 保存带标注的图片
         output_path = os.path.join("results", os.path.basename(image_path))
         os.makedirs(os.path.dirname(os.path.join(settings.UPLOAD_DIR, output_path)), exist_ok=True)
-        cv2.imwrite(os.path.join(settings.UPLOAD_DIR, output_path), results.plot())
+        annotated = draw_detections(image, detections)
+        with stage_duration.time(stage="imwrite"):
+            cv2.imwrite(os.path.join(settings.UPLOAD_DIR, output_path), annotated)
 
         return {
-            "detections": detections,
+            "detections": scale_detections(detections, decoded.scale),
             "result_image": output_path
         }
 
-    def detect_video(self, video_path: str) -> str:
-        """检测视频并保存结果到uploads目录"""
+    @timed(method_duration, method="run_video_pipeline")
+    def run_video_pipeline(self, cap, writer, total_frames: int, tracking: bool, render: bool,
+                           model: str = None, on_progress=None, first_track_id: int = 1,
+                           annotate=None, on_result=None, stream: TrackedStream = None) -> int:
+        """用流水线处理 cap 中的全部帧并写入 writer，返回写入的帧数
+
+        annotate 可替换默认的标注函数，其返回值原样交给 writer.write；
+        on_result(帧序号, 检测结果) 在每帧推理完成后调用；
+        stream 为跟踪会话，分多次处理同一视频时传入同一个会话以保持轨迹 ID 连续。
+        """
+        if annotate is None:
+            annotate = draw_detections if render else (lambda frame, detections: detections)
+        # 解码、推理、绘制、写入分别在不同线程中并行执行
+        if tracking:
+            # 跟踪状态依赖帧顺序，只能有一个推理线程按顺序处理
+            if stream is None:
+                stream = self.create_tracked_stream(model=model, first_track_id=first_track_id)
+            infer_batch = lambda frames: [stream.step(frame)[0] for frame in frames]
+            infer_workers = 1
+        else:
+            infer_batch = lambda frames: [self._to_detections(r) for r in self._infer_many(frames, model=model)]
+            # 模型本身不是线程安全的，只有经过调度器时才允许多个推理线程
+            infer_workers = settings.VIDEO_INFER_WORKERS if self.scheduler is not None else 1
+        pipeline = VideoPipeline(
+            infer_batch=infer_batch,
+            annotate=annotate,
+            batch_size=settings.BATCH_MAX_SIZE if settings.BATCH_ENABLED or tracking else 1,
+            queue_size=settings.VIDEO_QUEUE_SIZE,
+            infer_workers=infer_workers,
+            annotate_workers=settings.VIDEO_ANNOTATE_WORKERS,
+            on_progress=on_progress,
+            on_result=on_result
+        )
+        return pipeline.run(cap, writer, total_frames)
+
+    def _segment_options(self) -> Dict[str, Any]:
+        """分段处理进程需要沿用的运行时检测参数"""
+        return {
+            "confidence": self.confidence_threshold,
+            "iou": self.iou_threshold,
+            "device": self.device,
+            "half": self.half,
+        }
+
+    @timed(method_duration, method="detect_video")
+    def detect_video(self, video_path: str, tracking: bool = None, render: bool = True,
+                     model: str = None, segments: int = None, sampling: Dict[str, Any] = None,
+                     on_detections=None) -> str:
+        """检测视频并保存结果到uploads目录
+
+        tracking 为 True 时只在关键帧运行检测，其余帧由跟踪器外推；
+        render 为 False 时不生成标注视频，而是输出逐帧检测结果的 NDJSON 文件；
+        segments 大于 1 时把长视频切成多段并行处理（缺省取 VIDEO_SEGMENTS）；
+        sampling 为抽帧选项（见 FrameSampler.from_options），只处理抽中的帧，
+        NDJSON 中的帧号和时间戳仍对应源视频。抽帧时不再分段；
+        on_detections(源帧号, 检测结果) 在每帧推理完成后调用，分段并行处理时在全部段完成后
+        于调用线程中按段回放。
+        """
+        if tracking is None:
+            tracking = settings.TRACKING_ENABLED
         if not os.path.exists(video_path):
             raise ValueError(f"视频文件不存在: {video_path}")
 
@@ -64,57 +370,72 @@ class YOLODetector:
             height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             fps = cap.get(cv2.CAP_PROP_FPS)
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            sampler = FrameSampler.from_options(cap, sampling, video_path)
 
             # 创建输出目录
             output_path = os.path.join("results", os.path.basename(video_path))
+            if not render:
+                output_path = os.path.splitext(output_path)[0] + ".jsonl"
             os.makedirs(os.path.dirname(os.path.join(settings.UPLOAD_DIR, output_path)), exist_ok=True)
             output_path = os.path.join(settings.UPLOAD_DIR, output_path)
 
-            # 创建视频写入器
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-            if not out.isOpened():
-                raise ValueError("无法创建输出视频文件")
-
-            frame_count = 0
             last_progress = -1
 
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # 检测当前帧
-                results = self.model.predict(
-                    source=frame,
-                    conf=self.confidence_threshold,
-                    iou=self.iou_threshold,
-                    device=self.device,
-                    half=self.half
-                )[0]
-
-                # 绘制结果并写入输出视频
-                annotated_frame = results.plot()
-                out.write(annotated_frame)
-
+            def report_progress(frame_count: int, total: int):
                 # 更新进度（只在进度变化时打印）
-                frame_count += 1
-                progress = int((frame_count / total_frames) * 100)
+                nonlocal last_progress
+                progress = int((frame_count / total) * 100) if total > 0 else 0
                 if progress != last_progress:
                     print(f"处理进度: {progress}%")
                     last_progress = progress
 
-            # 确保写入最后一帧
-            out.release()
-            cap.release()
+            # 整段视频固定使用开始时的模型版本，中途切换模型不影响本次输出
+            pinned = self.registry.acquire(model)
+
+            # 长视频按关键帧切分成多段，由多个进程并行处理后按顺序拼接
+            segments = settings.VIDEO_SEGMENTS if segments is None else segments
+            plan = plan_segments(video_path, total_frames, fps, segments) if segments > 1 and not sampler.active else []
+            if len(plan) > 1:
+                cap.release()
+                process_segments(
+                    video_path, output_path, plan, fps, (width, height),
+                    render=render, tracking=tracking,
+                    weights=pinned.weights, backend=pinned.backend, quantization=pinned.quantization,
+                    options=self._segment_options(),
+                    total_frames=total_frames,
+                    on_progress=report_progress,
+                    on_detections=on_detections
+                )
+            else:
+                # 创建视频写入器（不渲染时写检测日志）
+                if render:
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    out = cv2.VideoWriter(output_path, fourcc, sampler.output_fps, (width, height))
+                else:
+                    out = DetectionLogWriter(output_path, fps,
+                                             frame_indices=sampler.sampled_indices if sampler.active else None)
+
+                if not out.isOpened():
+                    raise ValueError("无法创建输出视频文件")
+
+                on_result = None
+                if on_detections is not None:
+                    # 流水线内的帧序号换算成源视频帧号
+                    on_result = lambda index, detections: on_detections(
+                        sampler.sampled_indices[index] if sampler.active else index, detections)
+                self.run_video_pipeline(sampler, out, sampler.expected_frames(), tracking, render,
+                                        pinned.key, report_progress, on_result=on_result)
+
+                # 确保写入最后一帧
+                out.release()
+                cap.release()
 
             # 验证输出文件
             if not os.path.exists(output_path):
                 raise Exception("输出视频文件创建失败")
             
             file_size = os.path.getsize(output_path)
-            if file_size == 0:
+            if file_size == 0 and render:
                 raise Exception("输出视频文件为空")
 
             print(f"视频处理完成，输出文件大小: {file_size / 1024 / 1024:.2f}MB")
@@ -135,9 +456,13 @@ class YOLODetector:
                 cap.release()
             if 'out' in locals():
                 out.release()
+            if 'pinned' in locals():
+                self.registry.release(pinned)
 
-    def detect_camera(self, camera_id: int = 0) -> str:
+    def detect_camera(self, camera_id: int = 0, tracking: bool = None) -> str:
         """实时摄像头检测"""
+        if tracking is None:
+            tracking = settings.TRACKING_ENABLED
         cap = cv2.VideoCapture(camera_id)
         if not cap.isOpened():
             raise ValueError("无法打开摄像头")
@@ -152,23 +477,25 @@ class YOLODetector:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
 
+        stream = self.create_tracked_stream() if tracking else None
+
         try:
             while cap.isOpened():
                 ret, frame = cap.read()
                 if not ret:
                     break
 
+                if stream is not None:
+                    # 关键帧检测，其余帧由跟踪器外推
+                    detections, _ = stream.step(frame)
+                    out.write(draw_detections(frame, detections))
+                    continue
+
                 # 检测当前帧
-                results = self.model.predict(
-                    source=frame,
-                    conf=self.confidence_threshold,
-                    iou=self.iou_threshold,
-                    device=self.device,
-                    half=self.half
-                )[0]
+                detections = self.detect_frame(frame)
 
                 # 绘制结果并写入输出视频
-                out.write(results.plot())
+                out.write(draw_detections(frame, detections))
 
         finally:
             cap.release()
@@ -176,63 +503,177 @@ class YOLODetector:
 
         return output_path
         
-    def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
-        """处理单帧图像并返回检测结果和标注后的图像"""
-        results = self.model.predict(
-            source=frame,
-            conf=self.confidence_threshold,
-            iou=self.iou_threshold,
-            device=self.device,
-            half=self.half
-        )[0]
-        
-        # 处理检测结果
-        detections = []
-        for box, cls, conf in zip(results.boxes.xyxy.tolist(),
-                                results.boxes.cls.tolist(),
-                                results.boxes.conf.tolist()):
-            detections.append({
-                "class_name": results.names[int(cls)],
-                "confidence": float(conf),
-                "bbox": [float(x) for x in box]
-            })
-            
-        # 获取标注后的图像
-        annotated_frame = results.plot()
-        
-        return annotated_frame, detections
+    def _gate_for(self, stream_id: str = None) -> MotionGate:
+        """获取视频流对应的门控，未指定流或未启用门控时返回 None"""
+        if stream_id is None or not settings.MOTION_GATE_ENABLED:
+            return None
+        with self._gates_lock:
+            gate = self._gates.get(stream_id)
+            if gate is None:
+                gate = self._gates[stream_id] = MotionGate()
+                # 超出上限时淘汰最久未使用的流
+                while len(self._gates) > settings.MOTION_GATE_MAX_STREAMS:
+                    self._gates.popitem(last=False)
+            else:
+                self._gates.move_to_end(stream_id)
+            return gate
+
+    def _clear_gates(self):
+        """模型或检测参数变化后，按流缓存的检测结果不再有效"""
+        with self._gates_lock:
+            self._gates.clear()
+
+    def release_stream(self, stream_id: str):
+        """视频流结束时释放其门控状态"""
+        with self._gates_lock:
+            self._gates.pop(stream_id, None)
+
+    @timed(method_duration, method="process_frame")
+    def process_frame(self, frame: np.ndarray, stream_id: str = None, render: bool = True,
+                      model: str = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """处理单帧图像并返回检测结果和标注后的图像
+
+        指定 stream_id 时启用静态画面门控，画面无变化则复用该流上次的检测结果。
+        标注直接绘制在传入的帧上；render 为 False 时不绘制，返回的图像为 None。
+        """
+        return self.process_frames([frame], [stream_id], render, model)[0]
+
+    @timed(method_duration, method="process_frames")
+    def process_frames(self, frames: List[np.ndarray], stream_ids: List[str] = None, render: bool = True,
+                       model: str = None) -> List[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """批量处理多帧图像，返回每帧的标注图像和检测结果"""
+        outputs = self.process_frames_detailed(frames, stream_ids, render, model)
+        return [(r["frame"], r["detections"]) for r in outputs]
+
+    @timed(method_duration, method="process_frame_detailed")
+    def process_frame_detailed(self, frame: np.ndarray, stream_id: str = None, render: bool = True,
+                               model: str = None) -> Dict[str, Any]:
+        """与 process_frame 相同，但以字典返回，并附带实际使用的输入尺寸"""
+        return self.process_frames_detailed([frame], [stream_id], render, model)[0]
+
+    @timed(method_duration, method="process_frames_detailed")
+    def process_frames_detailed(self, frames: List[np.ndarray], stream_ids: List[str] = None,
+                                render: bool = True, model: str = None) -> List[Dict[str, Any]]:
+        """批量处理实时帧，返回 {"frame", "detections", "imgsz"} 列表
+
+        输入尺寸由负载控制器决定；被静态画面门控跳过的帧 imgsz 为 None。
+        """
+        stream_ids = stream_ids or [None] * len(frames)
+        outputs = [None] * len(frames)
+        pending = []
+        for i, (frame, stream_id) in enumerate(zip(frames, stream_ids)):
+            gate = self._gate_for(stream_id)
+            cached = gate.check(frame) if gate is not None else None
+            if cached is not None:
+                # 画面无变化，直接在当前帧上绘制上次的检测结果
+                outputs[i] = {
+                    "frame": draw_detections(frame, cached) if render else None,
+                    "detections": cached,
+                    "imgsz": None
+                }
+            else:
+                pending.append((i, gate))
+
+        detections_list, imgsz = self._detect_realtime([frames[i] for i, _ in pending], model)
+        for (i, gate), detections in zip(pending, detections_list):
+            if gate is not None:
+                gate.commit(detections)
+            # 获取标注后的图像
+            outputs[i] = {
+                "frame": draw_detections(frames[i], detections) if render else None,
+                "detections": detections,
+                "imgsz": imgsz
+            }
+        return outputs
         
-    def process_frame_base64(self, frame_base64: str) -> Dict[str, Any]:
-        """处理Base64编码的图像帧并返回检测结果和标注后的图像"""
+    @timed(method_duration, method="process_frame_base64")
+    def process_frame_base64(self, frame_base64: str, stream_id: str = None, render: bool = True,
+                             model: str = None, quality: int = None, scale: float = 1.0,
+                             max_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """处理Base64编码的图像帧并返回检测结果和标注后的图像
+
+        render 为 False 时只返回检测结果，省去绘制、JPEG 编码和 Base64 编码；
+        quality、scale、max_size 控制标注图像的编码质量和尺寸（相对原图），见 renderer.encode_image。
+        大图按缩小后的尺寸解码，但不小于标注图像的输出尺寸，检测框坐标映射回原图。
+        """
         # 解码Base64图像
         try:
             # 移除可能的Data URL前缀
             if ',' in frame_base64:
                 frame_base64 = frame_base64.split(',')[1]
                 
-            img_data = base64.b64decode(frame_base64)
-            nparr = np.frombuffer(img_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            with stage_duration.time(stage="base64_decode"):
+                img_data = base64.b64decode(frame_base64)
+            # 解码尺寸只跟随显示尺寸，不随输出档位的 scale 变化，同一路流的帧尺寸保持稳定（跟踪依赖）
+            decoded = decode_image(img_data, output_scale=1.0 if render else None, output_max_size=max_size)
             
             # 处理帧
-            annotated_frame, detections = self.process_frame(frame)
+            output = self.process_frame_detailed(decoded.image, stream_id, render, model)
+            annotated_frame = output["frame"]
+            detections = scale_detections(output["detections"], decoded.scale)
+            if not render:
+                return {
+                    "detections": detections,
+                    "imgsz": output["imgsz"]
+                }
             
             # 将标注后的图像编码为Base64
-            _, buffer = cv2.imencode('.jpg', annotated_frame)
-            annotated_frame_base64 = base64.b64encode(buffer).decode('utf-8')
+            # scale 相对原图，换算成相对解码后图像的比例
+            buffer = encode_image(annotated_frame, ".jpg", quality, (scale or 1.0) * decoded.scale[0], max_size)
+            with stage_duration.time(stage="base64_encode"):
+                annotated_frame_base64 = base64.b64encode(buffer).decode('utf-8')
             
             return {
                 "frame": f"data:image/jpeg;base64,{annotated_frame_base64}",
-                "detections": detections
+                "detections": detections,
+                "imgsz": output["imgsz"]
             }
         except Exception as e:
             return {
                 "error": str(e)
             }
 
+    @timed(method_duration, method="process_frame_encoded")
+    def process_frame_encoded(self, data, stream_id: str = None, render: bool = True, model: str = None,
+                              image_format: str = ".jpg", quality: int = None, scale: float = 1.0,
+                              max_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """处理原始 JPEG / WebP 字节，返回 {"detections", "imgsz", "image"}
+
+        二进制 WebSocket 协议使用：data 可以是 bytes 或 memoryview，直接交给解码器，
+        标注图像按 image_format、quality、scale、max_size 编码后以 bytes 返回，全程不经过 Base64。
+        大图按缩小后的尺寸解码，但不小于标注图像的输出尺寸，检测框坐标映射回原图。
+        """
+        # 解码尺寸只跟随显示尺寸，不随输出档位的 scale 变化，同一路流的帧尺寸保持稳定（跟踪依赖）
+        decoded = decode_image(data, output_scale=1.0 if render else None, output_max_size=max_size)
+        output = self.process_frame_detailed(decoded.image, stream_id, render, model)
+        image = None
+        if render:
+            # scale 相对原图，换算成相对解码后图像的比例
+            image = encode_image(output["frame"], image_format, quality,
+                                 (scale or 1.0) * decoded.scale[0], max_size).tobytes()
+        detections = scale_detections(output["detections"], decoded.scale)
+        return {"detections": detections, "imgsz": output["imgsz"], "image": image}
+
     def update_settings(self, confidence: float = None, iou: float = None,
-                       device: str = None, half: bool = None):
+                       device: str = None, half: bool = None, tiled: bool = None,
+                       tile_size: int = None, tile_overlap: float = None,
+                       tile_merge: str = None, tile_merge_iou: float = None,
+                       tile_full_image: bool = None):
         """更新检测参数"""
+        if tile_merge is not None and tile_merge not in ("nms", "nmm"):
+            raise ValueError(f"不支持的合并策略: {tile_merge}")
+        if tiled is not None:
+            self.tiled = tiled
+        if tile_size is not None:
+            self.tile_size = tile_size
+        if tile_overlap is not None:
+            self.tile_overlap = tile_overlap
+        if tile_merge is not None:
+            self.tile_merge = tile_merge
+        if tile_merge_iou is not None:
+            self.tile_merge_iou = tile_merge_iou
+        if tile_full_image is not None:
+            self.tile_full_image = tile_full_image
         if confidence is not None:
             self.confidence_threshold = confidence
         if iou is not None:
@@ -241,3 +682,35 @@ class YOLODetector:
             self.device = device
         if half is not None:
             self.half = half
+        if device is not None or half is not None:
+            # 直通路径的缓冲区和模型副本绑定在原设备上，需要重建
+            self.registry.clear_caches()
+        # 参数变化后缓存的检测结果不再有效
+        self._clear_gates()
+
+    def load_model(self, name: str, weights: str, backend: str = None,
+                   make_default: bool = False, quantization: str = None) -> Dict[str, Any]:
+        """在后台加载（或替换）命名模型，预热完成后上线"""
+        return self.registry.load(name, weights, backend, make_default=make_default,
+                                  quantization=quantization).describe()
+
+    def set_default_model(self, name: str):
+        """切换默认模型，不影响正在处理的请求"""
+        self.registry.set_default(name)
+
+    def unload_model(self, name: str):
+        """卸载模型，在途请求结束后释放"""
+        self.registry.unload(name)
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        """注册表中各模型版本的状态和内存占用"""
+        return self.registry.describe()
+
+    def fast_path_stats(self) -> List[Dict[str, Any]]:
+        """各模型版本直通推理路径的帧数和缓冲区分配统计"""
+        stats = []
+        for version in self.registry.versions():
+            fast_path = version.cache.get("fast_path")
+            if fast_path is not None:
+                stats.append(dict(fast_path.stats(), model=version.name, version=version.version))
+        return stats
@@ -6,11 +6,14 @@ from core.config import settings
 from api.endpoints import router
 from api.qwenvl import router as qwenvl_router
 from api.user import router as user_router
+from api.metrics import router as metrics_router
+from app.core.metrics import endpoint_duration
 from models.user import User
 from utils.auth import get_current_user
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import os
+import time
 
 
 # 创建上传目录
@@ -31,6 +34,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录各 HTTP 接口的耗时，按路由模板区分，避免路径参数造成过多序列
+@app.middleware("http")
+async def record_endpoint_duration(request: Request, call_next):
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        endpoint_duration.observe(time.perf_counter() - started, endpoint=f"{request.method} {path}")
+
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory=r"D:\code\manhole-cover\app\static"), name="static")
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
@@ -39,6 +53,8 @@ app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads"
 app.include_router(router, prefix=settings.API_V1_STR)
 app.include_router(qwenvl_router, prefix=settings.API_V1_STR)
 app.include_router(user_router, prefix=settings.API_V1_STR)
+# 指标接口挂在根路径，便于 Prometheus 按默认路径抓取
+app.include_router(metrics_router)
 @app.get("/")
 async def root():
     return RedirectResponse(url="/static/login.html")
@@ -0,0 +1,4 @@
+from sqlalchemy.orm import declarative_base
+
+# 所有 ORM 模型共用的基类；与数据库连接分开，导入模型时不会创建 MySQL 引擎
+Base = declarative_base()
@@ -0,0 +1,32 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String
+from app.models.base import Base
+
+# SQLite 只有 INTEGER PRIMARY KEY 才会自增
+_BigId = BigInteger().with_variant(Integer, "sqlite")
+
+
+class DetectionRecord(Base):
+    """单个检测框的历史记录，每帧的每个目标一行"""
+    __tablename__ = "detections"
+    __table_args__ = (
+        # 查询都按 (created_at, id) 倒序分页，各组合索引以这两列结尾
+        Index("ix_detections_time", "created_at", "id"),
+        Index("ix_detections_source_time", "source", "created_at", "id"),
+        Index("ix_detections_class_time", "class_name", "created_at", "id"),
+        Index("ix_detections_class_confidence", "class_name", "confidence"),
+        {'extend_existing': True},
+    )
+
+    id = Column(_BigId, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False)
+    source = Column(String(255), nullable=False)
+    source_type = Column(String(20), nullable=False)
+    frame_index = Column(Integer)
+    class_name = Column(String(100), nullable=False)
+    confidence = Column(Float, nullable=False)
+    x1 = Column(Float, nullable=False)
+    y1 = Column(Float, nullable=False)
+    x2 = Column(Float, nullable=False)
+    y2 = Column(Float, nullable=False)
+    track_id = Column(Integer)
+    model = Column(String(100))
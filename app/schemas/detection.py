@@ -5,13 +5,27 @@ class DetectionResult(BaseModel):
     class_name: str
     confidence: float
     bbox: List[float]
+    track_id: Optional[int] = None
 
 class ImageDetectionResponse(BaseModel):
     detections: List[DetectionResult]
-    result_image: str
+    result_image: Optional[str] = None
 
 class DetectionSettings(BaseModel):
     confidence: Optional[float] = None
     iou: Optional[float] = None
     device: Optional[str] = None
     half: Optional[bool] = None
+    tiled: Optional[bool] = None
+    tile_size: Optional[int] = None
+    tile_overlap: Optional[float] = None
+    tile_merge: Optional[str] = None
+    tile_merge_iou: Optional[float] = None
+    tile_full_image: Optional[bool] = None
+
+class ModelLoadRequest(BaseModel):
+    name: str
+    weights: str
+    backend: Optional[str] = None
+    make_default: bool = False
+    quantization: Optional[str] = None  # none / dynamic / static，为空时仅未指定后端的模型沿用配置
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+from app.core.detection_store import DetectionStore, decode_cursor, store_rows
+from app.models.detection import DetectionRecord
+
+
+def make_engine():
+    # 内存 SQLite，所有连接共用同一个库，后台写线程和查询看到的是同一份数据
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def det(class_name="manhole", confidence=0.9, bbox=(1, 2, 3, 4), track_id=None):
+    return {"class_name": class_name, "confidence": confidence, "bbox": list(bbox), "track_id": track_id}
+
+
+def count_rows(store: DetectionStore) -> int:
+    with store.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(DetectionRecord)).scalar_one()
+
+
+@pytest.fixture
+def store():
+    store = DetectionStore(make_engine(), batch_size=4, flush_interval=0.05, queue_size=1000).start()
+    yield store
+    store.stop()
+
+
+def test_record_is_written_in_batches(store):
+    for i in range(5):
+        store.record("img-a", [det(), det(class_name="broken", confidence=0.4)], frame_index=i)
+    assert store.flush(timeout=5)
+    assert count_rows(store) == 10
+
+    items = store.query(source="img-a", limit=100)["items"]
+    assert len(items) == 10
+    assert items[0]["bbox"] == [1.0, 2.0, 3.0, 4.0]
+    assert {item["frame_index"] for item in items} == set(range(5))
+
+
+def test_rows_are_dropped_when_queue_is_full():
+    store = DetectionStore(make_engine(), batch_size=10, flush_interval=0.05, queue_size=3)
+    before = store_rows.get(result="dropped")
+    # 写线程尚未启动，队列只能容纳 3 行
+    store.record("img", [det() for _ in range(5)])
+    assert store_rows.get(result="dropped") - before == 2
+    assert not store.flush(timeout=0.2)
+
+    store.start()
+    try:
+        assert store.flush(timeout=5)
+        assert count_rows(store) == 3
+    finally:
+        store.stop()
+
+
+def test_query_filters(store):
+    base = datetime.datetime(2024, 1, 1)
+    store.record("cam-1", [det("manhole", 0.9), det("broken", 0.3)], created_at=base)
+    store.record("cam-2", [det("manhole", 0.5)], created_at=base + datetime.timedelta(hours=1))
+    store.record("cam-1", [det("manhole", 0.7)], created_at=base + datetime.timedelta(hours=2))
+    assert store.flush(timeout=5)
+
+    assert len(store.query(source="cam-1")["items"]) == 3
+    assert {i["class_name"] for i in store.query(class_name="broken")["items"]} == {"broken"}
+    assert [i["confidence"] for i in store.query(class_name="manhole", min_confidence=0.6)["items"]] == [0.7, 0.9]
+
+    window = store.query(start=base + datetime.timedelta(minutes=30), end=base + datetime.timedelta(hours=2))
+    assert [i["source"] for i in window["items"]] == ["cam-2"]
+
+
+def test_keyset_pagination_with_equal_timestamps(store):
+    same_time = datetime.datetime(2024, 1, 1, 12)
+    # 同一时间戳的多行跨越页边界
+    store.record("video", [det(bbox=(i, i, i + 1, i + 1)) for i in range(23)], created_at=same_time)
+    store.record("video", [det() for _ in range(4)], created_at=same_time - datetime.timedelta(seconds=1))
+    assert store.flush(timeout=5)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = store.query(source="video", cursor=cursor, limit=5)
+        seen.extend(item["id"] for item in page["items"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 6
+    assert len(seen) == len(set(seen)) == 27
+    # 整体顺序为 (created_at, id) 倒序
+    with store.engine.connect() as conn:
+        expected = conn.execute(
+            select(DetectionRecord.id).order_by(DetectionRecord.created_at.desc(), DetectionRecord.id.desc())
+        ).scalars().all()
+    assert seen == expected
+
+
+def test_invalid_cursor_raises(store):
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    with pytest.raises(ValueError):
+        store.query(cursor="bm90LWEtY3Vyc29y")
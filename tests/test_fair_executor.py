@@ -0,0 +1,31 @@
+import threading
+
+from app.core.fair_executor import FairExecutor
+
+
+def test_release_with_queued_tasks_drops_deficit_once_drained():
+    executor = FairExecutor(workers=1, quantum_s=0.01, name="test-fair-executor")
+    gate = threading.Event()
+    try:
+        blocker = executor.submit("other", gate.wait, 5)
+        futures = [executor.submit("conn", lambda i=i: i) for i in range(3)]
+        # 连接在任务还在排队时关闭
+        executor.release("conn")
+        gate.set()
+        assert [f.result(timeout=5) for f in futures] == [0, 1, 2]
+        blocker.result(timeout=5)
+        executor.submit("other", lambda: None).result(timeout=5)
+        assert "conn" not in executor._deficit
+        assert not executor._released
+    finally:
+        executor.stop()
+
+
+def test_release_of_idle_key_drops_deficit():
+    executor = FairExecutor(workers=1, quantum_s=0.01, name="test-fair-executor-idle")
+    try:
+        executor.submit("conn", lambda: None).result(timeout=5)
+        executor.release("conn")
+        assert "conn" not in executor._deficit
+    finally:
+        executor.stop()
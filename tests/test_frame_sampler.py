@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.frame_sampler import FrameSampler, parse_ranges
+
+
+class FakeCapture:
+    """按帧号计数的假 VideoCapture，返回的帧内容为帧号"""
+
+    def __init__(self, frames: int = 300, fps: float = 30.0):
+        self.frames = frames
+        self.fps = fps
+        self.pos = 0
+        self.seeks = []
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frames
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.seeks.append(int(value))
+            self.pos = int(value)
+        return True
+
+    def grab(self):
+        if self.pos >= self.frames:
+            return False
+        self.pos += 1
+        return True
+
+    def read(self):
+        if self.pos >= self.frames:
+            return False, None
+        frame = np.full((2, 2, 3), self.pos % 256, dtype=np.uint8)
+        self.pos += 1
+        return True, frame
+
+
+def drain(sampler: FrameSampler):
+    while True:
+        ret, _ = sampler.read()
+        if not ret:
+            return sampler.sampled_indices
+
+
+@pytest.mark.parametrize("target_fps", [7, 12, 2, 29.97])
+def test_fps_policy_matches_output_fps(target_fps):
+    cap = FakeCapture(300, 30.0)
+    sampler = FrameSampler(cap, "fps", target_fps=target_fps)
+    indices = drain(sampler)
+
+    duration = 300 / 30.0
+    # 写出视频的帧率与实际抽到的帧数一致，播放时长等于源视频时长
+    assert len(indices) == pytest.approx(sampler.output_fps * duration, abs=1)
+    assert len(indices) == sampler.expected_frames()
+    # 小数步长不漂移：每帧都落在名义时间表向上取整的位置
+    step = 30.0 / target_fps
+    assert indices == [int(np.ceil(k * step - 1e-6)) for k in range(len(indices))]
+
+
+def test_every_n_policy():
+    sampler = FrameSampler(FakeCapture(100, 25.0), "every_n", every_n=3)
+    assert drain(sampler) == list(range(0, 100, 3))
+    assert sampler.expected_frames() == 34
+
+
+def test_large_gaps_seek_instead_of_grab():
+    cap = FakeCapture(1000, 10.0)
+    sampler = FrameSampler(cap, "every_n", every_n=200, seek_gap=50)
+    assert drain(sampler) == [0, 200, 400, 600, 800]
+    assert cap.seeks == [200, 400, 600, 800]
+
+
+def test_ranges_policy_restarts_at_range_start():
+    cap = FakeCapture(300, 10.0)
+    sampler = FrameSampler(cap, "ranges", every_n=5, ranges=parse_ranges("2-4,20-"))
+    indices = drain(sampler)
+    assert indices == [20, 25, 30, 35] + list(range(200, 300, 5))
+    assert sampler.expected_frames() == len(indices)
+
+
+def test_parse_ranges_rejects_empty_range():
+    with pytest.raises(ValueError):
+        parse_ranges("5-3")
@@ -0,0 +1,64 @@
+import threading
+
+from app.core.metrics import Histogram, timed
+
+
+def test_nested_timed_calls_record_outermost_only():
+    histogram = Histogram("test_nested_seconds", "嵌套计时", ("method",))
+
+    @timed(histogram, method="inner")
+    def inner():
+        return 1
+
+    @timed(histogram, method="outer")
+    def outer():
+        return inner() + inner()
+
+    assert outer() == 2
+    assert histogram.get(method="outer") == 1
+    assert histogram.get(method="inner") == 0
+
+    # 单独调用内层函数时照常记录
+    inner()
+    assert histogram.get(method="inner") == 1
+
+
+def test_nested_timed_calls_on_other_histograms_are_recorded():
+    methods = Histogram("test_methods_seconds", "方法耗时", ("method",))
+    stages = Histogram("test_stages_seconds", "阶段耗时", ("stage",))
+
+    @timed(stages, stage="render")
+    def render():
+        pass
+
+    @timed(methods, method="process")
+    def process():
+        render()
+
+    process()
+    assert methods.get(method="process") == 1
+    assert stages.get(stage="render") == 1
+
+
+def test_timed_nesting_is_tracked_per_thread():
+    histogram = Histogram("test_threads_seconds", "跨线程计时", ("method",))
+    started, release = threading.Event(), threading.Event()
+
+    @timed(histogram, method="worker")
+    def worker():
+        pass
+
+    @timed(histogram, method="outer")
+    def outer():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=outer)
+    thread.start()
+    started.wait(5)
+    # 另一个线程正在计时，不影响本线程的记录
+    worker()
+    release.set()
+    thread.join()
+    assert histogram.get(method="worker") == 1
+    assert histogram.get(method="outer") == 1